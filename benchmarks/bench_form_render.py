@@ -0,0 +1,59 @@
+"""
+Renders a 16 game pick form with and without the ScheduleGameWidget
+fragment cache.
+
+    python benchmarks/bench_form_render.py
+"""
+import os
+import sys
+import timeit
+from os.path import abspath, dirname, join
+
+root = abspath(join(dirname(__file__), '..'))
+if root not in sys.path:
+    sys.path.insert(0, root)
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'example.settings')
+
+from django import forms as django_forms
+
+from nfl import forms, utils
+
+MATCHUPS = [
+    ("NO", "GB"), ("ATL", "CHI"), ("CIN", "CLE"), ("IND", "HOU"), ("PIT", "BAL"),
+    ("BUF", "KC"), ("PHI", "STL"), ("DET", "TB"), ("TEN", "JAC"), ("CAR", "ARI"),
+    ("MIN", "SD"), ("SEA", "SF"), ("NYG", "WAS"), ("DAL", "NYJ"), ("NE", "MIA"),
+    ("OAK", "DEN"),
+]
+
+def pick_form_class():
+    fields = {}
+    for number, (away, home) in enumerate(MATCHUPS):
+        fields['game%s' % (number + 1)] = django_forms.ChoiceField(
+            label='Game %s' % (number + 1),
+            widget=django_forms.RadioSelect(renderer=forms.ScheduleGameWidget),
+            choices=[(away, away), (home, home)],
+        )
+    return type('PickForm', (django_forms.Form,), fields)
+
+def run(number=200, repeat=3):
+    form_class = pick_form_class()
+    picks = dict(('game%s' % (n + 1), home) for n, (away, home) in enumerate(MATCHUPS))
+    render = lambda: unicode(form_class(initial=picks).as_ul())
+
+    original_cache = forms.fragment_cache
+    results = []
+    try:
+        forms.fragment_cache = None
+        results.append({'name': 'form_render.uncached',
+                        'seconds': min(timeit.repeat(render, number=number, repeat=repeat)) / number})
+        forms.fragment_cache = utils.LocalCache(max_entries=2048, timeout=60 * 60)
+        render()
+        results.append({'name': 'form_render.fragment_cache',
+                        'seconds': min(timeit.repeat(render, number=number, repeat=repeat)) / number})
+    finally:
+        forms.fragment_cache = original_cache
+    return results
+
+if __name__ == '__main__':
+    for result in run():
+        sys.stdout.write("%(name)-28s %(seconds).6fs per 16 game form\n" % result)
@@ -0,0 +1,129 @@
+"""
+Compares the query plans and latency of the model access paths with the
+indexes declared on the models against the foreign key indexes the tables
+used to have.
+
+A test database is filled with generate_data. Each table is then copied
+to a baseline table with the same columns but only the old foreign key
+indexes, and the same queries are explained and timed against both.
+
+    python benchmarks/bench_indexes.py [--seasons 20] [--iterations 2000]
+"""
+import os
+import sys
+import time
+from optparse import OptionParser
+from os.path import abspath, dirname, join
+
+root = abspath(join(dirname(__file__), '..'))
+if root not in sys.path:
+    sys.path.insert(0, root)
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'example.settings')
+
+from django.db import connection
+from django.test.utils import setup_test_environment
+from django.utils import simplejson
+
+from nfl import generator, models
+
+# name, model, the table's indexes before they were declared on the models,
+# query and a function giving the parameters for the nth run
+ACCESS_PATHS = [
+    ('Game by week in game_time order', models.Game, ['week_id', 'home_id', 'away_id'],
+     "SELECT * FROM %s WHERE week_id = %%s ORDER BY game_time",
+     lambda seasons, n: ["%s-%s" % (seasons[n % len(seasons)], n % 17 + 1)]),
+    ('Week by season in number order', models.Week, ['season_id'],
+     "SELECT * FROM %s WHERE season_id = %%s ORDER BY number",
+     lambda seasons, n: [seasons[n % len(seasons)]]),
+    ('TeamResult by team and week', models.TeamResult, ['team_id', 'week_id'],
+     "SELECT * FROM %s WHERE team_id = %%s AND week_id = %%s",
+     lambda seasons, n: ['GB', "%s-%s" % (seasons[n % len(seasons)], n % 17 + 1)]),
+    ('Winner by week', models.Winner, ['week_id'],
+     "SELECT * FROM %s WHERE week_id = %%s",
+     lambda seasons, n: ["%s-%s" % (seasons[n % len(seasons)], n % 17 + 1)]),
+    ('Season by is_active', models.Season, [],
+     "SELECT * FROM %s WHERE is_active = %%s",
+     lambda seasons, n: [True]),
+]
+
+def set_up_database(seasons):
+    setup_test_environment()
+    connection.creation.create_test_db(verbosity=0)
+    years = range(2011 - seasons, 2011)
+    generator.generate_data(years)
+    return [str(year) for year in years]
+
+def create_baseline(model, indexes):
+    """
+    Copies the model's table without any of its indexes or constraints,
+    then adds the given indexes back.
+    """
+    qn = connection.ops.quote_name
+    table = model._meta.db_table
+    baseline = table + '_baseline'
+    columns = [(qn(f.column), f.db_type(connection=connection)) for f in model._meta.local_fields]
+    cursor = connection.cursor()
+    cursor.execute("CREATE TABLE %s (%s)" % (
+        qn(baseline), ", ".join("%s %s" % column for column in columns)))
+    column_names = ", ".join(name for name, db_type in columns)
+    cursor.execute("INSERT INTO %s (%s) SELECT %s FROM %s" % (
+        qn(baseline), column_names, column_names, qn(table)))
+    for column in indexes:
+        cursor.execute("CREATE INDEX %s ON %s (%s)" % (
+            qn('%s_%s' % (baseline, column)), qn(baseline), qn(column)))
+    return baseline
+
+def explain(sql, params):
+    prefix = 'EXPLAIN QUERY PLAN ' if connection.vendor == 'sqlite' else 'EXPLAIN '
+    cursor = connection.cursor()
+    cursor.execute(prefix + sql, params)
+    return [' '.join(unicode(column) for column in row) for row in cursor.fetchall()]
+
+def measure(sql, params, seasons, iterations):
+    cursor = connection.cursor()
+    start = time.time()
+    for n in range(iterations):
+        cursor.execute(sql, params(seasons, n))
+        cursor.fetchall()
+    return (time.time() - start) / iterations
+
+def run(seasons=20, iterations=2000):
+    season_keys = set_up_database(seasons)
+    results = []
+    try:
+        for name, model, indexes, sql, params in ACCESS_PATHS:
+            baseline = create_baseline(model, indexes)
+            for indexed, query_table in (('baseline', baseline), ('declared', model._meta.db_table)):
+                query = sql % connection.ops.quote_name(query_table)
+                results.append({
+                    'name': name,
+                    'indexes': indexed,
+                    'plan': explain(query, params(season_keys, 0)),
+                    'seconds': measure(query, params, season_keys, iterations),
+                    'items': iterations,
+                })
+    finally:
+        connection.creation.destroy_test_db(':memory:', verbosity=0)
+    return results
+
+def main():
+    parser = OptionParser(usage="%prog [options]")
+    parser.add_option('--seasons', dest='seasons', type='int', default=20,
+                      help="Number of seasons to generate.")
+    parser.add_option('--iterations', dest='iterations', type='int', default=2000,
+                      help="Queries timed per access path.")
+    parser.add_option('--json', dest='json', action='store_true', default=False,
+                      help="Write the results as JSON.")
+    options, args = parser.parse_args()
+
+    results = run(options.seasons, options.iterations)
+    if options.json:
+        sys.stdout.write(simplejson.dumps(results, indent=2) + '\n')
+        return
+    for result in results:
+        sys.stdout.write("%(name)-32s %(indexes)-9s %(seconds).6fs\n" % result)
+        for line in result['plan']:
+            sys.stdout.write("    %s\n" % line)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+"""
+Scores 10,000 entrants over a 17 week season with nfl.scoring, with and
+without NumPy. Only the in-memory scoring is timed, not loading picks.
+
+    python benchmarks/bench_scoring.py
+"""
+import os
+import random
+import sys
+import time
+from os.path import abspath, dirname, join
+
+root = abspath(join(dirname(__file__), '..'))
+if root not in sys.path:
+    sys.path.insert(0, root)
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'example.settings')
+
+from nfl import scoring
+
+def synthetic_season(entrants=10000, weeks=17, seed=2011):
+    rand = random.Random(seed)
+    # a few weeks have byes, so only 13 or 14 games are played
+    game_counts = [rand.choice([13, 14, 16, 16, 16]) for week in range(weeks)]
+    all_games = [(1 << count) - 1 for count in game_counts]
+
+    winner_homes = [rand.getrandbits(16) & games for games in all_games]
+    winner_filled = all_games
+
+    rows, cols, home_masks, filled_masks = [], [], [], []
+    for entrant in range(entrants):
+        for week, games in enumerate(all_games):
+            rows.append(entrant)
+            cols.append(week)
+            home_masks.append(rand.getrandbits(16) & games)
+            # now and then someone forgets a pick
+            filled_masks.append(games & ~(1 << rand.randrange(20)))
+    return rows, cols, home_masks, filled_masks, winner_homes, winner_filled, (entrants, weeks)
+
+def time_scoring(args, repeat=3):
+    best = None
+    for attempt in range(repeat):
+        start = time.time()
+        scoring.score_arrays(*args)
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def run(entrants=10000, weeks=17):
+    args = synthetic_season(entrants, weeks)
+    results = []
+    numpy = scoring.numpy
+    try:
+        if numpy is not None:
+            results.append({'name': 'scoring.numpy', 'seconds': time_scoring(args)})
+        scoring.numpy = None
+        results.append({'name': 'scoring.python', 'seconds': time_scoring(args)})
+    finally:
+        scoring.numpy = numpy
+    for result in results:
+        result['items'] = entrants * weeks
+    return results
+
+if __name__ == '__main__':
+    for result in run():
+        sys.stdout.write("%(name)-20s %(seconds).4fs for %(items)s pick sheets\n" % result)
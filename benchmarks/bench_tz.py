@@ -0,0 +1,57 @@
+"""
+Compares converting a season of game times to UTC one at a time, the way
+it was done before the DST transitions were memoized, against the
+memoized zone and against tz.convert_many.
+
+    python benchmarks/bench_tz.py
+"""
+import sys
+import timeit
+from datetime import datetime, timedelta
+from os.path import abspath, dirname, join
+
+root = abspath(join(dirname(__file__), '..'))
+if root not in sys.path:
+    sys.path.insert(0, root)
+
+from nfl import tz
+
+class UnmemoizedZone(tz.StandardAmericanZone):
+    """
+    Works out the DST transitions on every call, like the zone used to.
+    """
+
+    def dst(self, dt):
+        if self.get_dst_start(dt) <= dt.replace(tzinfo=None) < self.get_dst_end(dt):
+            return timedelta(hours=1)
+        return timedelta(0)
+
+UNMEMOIZED_EASTERN = UnmemoizedZone(-5, 'America/New_York')
+
+def season_game_times(games=256):
+    kickoff = datetime(2011, 9, 8, 20, 30)
+    return [kickoff + timedelta(hours=15 * i) for i in range(games)]
+
+def per_call(zone, game_times):
+    return [dt.replace(tzinfo=zone).astimezone(tz.UTC) for dt in game_times]
+
+def run(number=50, repeat=3):
+    game_times = season_game_times()
+    cases = [
+        ('per call, unmemoized', lambda: per_call(UNMEMOIZED_EASTERN, game_times)),
+        ('per call, memoized', lambda: per_call(tz.EASTERN, game_times)),
+        ('convert_many', lambda: tz.convert_many(game_times, tz.EASTERN, tz.UTC)),
+    ]
+    results = []
+    for name, func in cases:
+        best = min(timeit.repeat(func, number=number, repeat=repeat))
+        results.append({
+            'name': 'tz.%s' % name.replace(', ', '.').replace(' ', '_'),
+            'seconds': best / number,
+            'items': len(game_times),
+        })
+    return results
+
+if __name__ == '__main__':
+    for result in run():
+        sys.stdout.write("%(name)-30s %(seconds).6fs per %(items)s game times\n" % result)
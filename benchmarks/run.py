@@ -0,0 +1,190 @@
+"""
+Benchmarks for the nfl hot paths.
+
+Each path is timed with a cold cache (everything cleared before each
+run) and a warm one, against the local memory and database cache
+backends. Along with wall time, the number of queries and cache
+operations per run is recorded. The results are written as JSON so
+they can be compared from one release to the next.
+
+    python benchmarks/run.py [--output results.json] [--iterations 20]
+
+The micro benchmarks in bench_tz.py, bench_scoring.py and
+bench_form_render.py are included in the results as well.
+"""
+import os
+import platform
+import sys
+import time
+from optparse import OptionParser
+from os.path import abspath, dirname, join
+
+root = abspath(join(dirname(__file__), '..'))
+if root not in sys.path:
+    sys.path.insert(0, root)
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'example.settings')
+
+import django
+from django.contrib import admin
+from django.contrib.auth.models import User
+from django.core.cache import get_cache
+from django.db import connection, reset_queries
+from django.forms.models import modelform_factory
+from django.test.client import RequestFactory
+from django.test.utils import setup_test_environment
+from django.utils import simplejson
+
+from nfl import forms, importer, models, utils
+
+CACHE_BACKENDS = {
+    'locmem': ('django.core.cache.backends.locmem.LocMemCache', {}),
+    'db': ('django.core.cache.backends.db.DatabaseCache', {'LOCATION': ''}),
+}
+CACHE_OPERATIONS = ('get', 'set', 'add', 'delete', 'incr', 'get_many', 'set_many')
+FIXTURE = join(root, 'nfl', 'fixtures', '2011_games.json')
+
+class CountingCache(object):
+    """
+    Passes everything through to a cache backend, counting the calls
+    to the cache operations.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.operations = 0
+
+    def __getattr__(self, name):
+        attr = getattr(self.backend, name)
+        if name not in CACHE_OPERATIONS:
+            return attr
+
+        def counted(*args, **kwargs):
+            self.operations += 1
+            return attr(*args, **kwargs)
+        return counted
+
+def set_up_database():
+    admin.autodiscover()
+    setup_test_environment()
+    connection.creation.create_test_db(verbosity=0)
+    connection.use_debug_cursor = True
+
+    with open(FIXTURE) as stream:
+        importer.import_schedule(stream)
+    models.Season.objects.filter(pk='2011').update(is_active=True)
+    winner = models.Winner.objects.create(week_id='2011-1', game1='GB', game2='CHI')
+    user = User.objects.create_superuser('bench', 'bench@example.com', 'bench')
+    return user, winner
+
+def clear_caches():
+    utils.cache.clear()
+    if utils.local_cache is not None:
+        utils.local_cache.clear()
+    if forms.fragment_cache is not None:
+        forms.fragment_cache.clear()
+    models._week_boundaries.clear()
+    models._week_indexes.clear()
+    models._team_registry.clear()
+
+def hot_paths(user, winner):
+    week = models.Week.objects.get(pk='2011-1')
+    winner_admin = admin.site._registry[models.Winner]
+    game_fields = ['game%s' % n for n in range(1, 17)]
+    form_class = modelform_factory(models.Winner, form=forms.BaseGamesForm, fields=['week'] + game_fields)
+    factory = RequestFactory()
+
+    def admin_request(path):
+        request = factory.get(path)
+        request.user = user
+        return request
+
+    paths = [
+        ('Team.all_teams', models.Team.all_teams),
+        ('Game.week_schedule', lambda: models.Game.week_schedule(week)),
+        ('BaseGamesForm.construct', lambda: form_class(initial={'week': week.pk})),
+        ('BaseGamesForm.render', lambda: form_class(initial={'week': week.pk}).as_ul()),
+        ('WinnerAdmin.add_view',
+         lambda: winner_admin.add_view(admin_request('/admin/nfl/winner/add/'))),
+        ('WinnerAdmin.change_view',
+         lambda: winner_admin.change_view(admin_request('/admin/nfl/winner/%s/' % winner.pk),
+                                          str(winner.pk))),
+    ]
+    for date_trigger in ('first_game', 'last_game'):
+        for delay in (False, True):
+            name = 'Week.current_week[%s,delay=%s]' % (date_trigger, delay)
+            paths.append((name, lambda t=date_trigger, d=delay: models.Week.current_week(date_trigger=t, delay=d)))
+    return paths
+
+def measure(func, cold, iterations):
+    counting_cache = utils.cache
+    if not cold:
+        func()
+
+    seconds = queries = operations = 0
+    for i in range(iterations):
+        if cold:
+            clear_caches()
+        reset_queries()
+        counting_cache.operations = 0
+        start = time.time()
+        func()
+        seconds += time.time() - start
+        queries += len(connection.queries)
+        operations += counting_cache.operations
+    return {
+        'seconds': seconds / iterations,
+        'queries': float(queries) / iterations,
+        'cache_operations': float(operations) / iterations,
+    }
+
+def run_hot_paths(iterations):
+    user, winner = set_up_database()
+    original_cache = utils.cache
+    results = []
+    try:
+        for backend_name, (backend, params) in sorted(CACHE_BACKENDS.items()):
+            utils.cache = CountingCache(get_cache(backend, **params))
+            for name, func in hot_paths(user, winner):
+                for state in ('cold', 'warm'):
+                    result = measure(func, state == 'cold', iterations)
+                    result.update({'name': name, 'cache_backend': backend_name, 'cache_state': state})
+                    results.append(result)
+    finally:
+        utils.cache = original_cache
+        connection.creation.destroy_test_db(':memory:', verbosity=0)
+    return results
+
+def run_micro_benchmarks():
+    from benchmarks import bench_form_render, bench_scoring, bench_tz
+    results = []
+    for module in (bench_tz, bench_scoring, bench_form_render):
+        results.extend(module.run())
+    return results
+
+def main():
+    parser = OptionParser(usage="%prog [options]")
+    parser.add_option('--output', dest='output', help="Write the results here instead of stdout.")
+    parser.add_option('--iterations', dest='iterations', type='int', default=20,
+                      help="Runs per path and cache state.")
+    parser.add_option('--skip-micro', dest='micro', action='store_false', default=True,
+                      help="Leave out the tz, scoring and form render micro benchmarks.")
+    options, args = parser.parse_args()
+
+    report = {
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'iterations': options.iterations,
+        'results': run_hot_paths(options.iterations),
+    }
+    if options.micro:
+        report['micro'] = run_micro_benchmarks()
+
+    output = simplejson.dumps(report, indent=2, sort_keys=True)
+    if options.output:
+        with open(options.output, 'w') as stream:
+            stream.write(output)
+    else:
+        sys.stdout.write(output + '\n')
+
+if __name__ == '__main__':
+    main()
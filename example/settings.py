@@ -38,6 +38,18 @@ CACHES = {
     }
 }
 
+# Keeps the nfl cached lookups in process memory in front of CACHES.
+# Values are versioned so TIMEOUT bounds how stale another worker can be.
+#NFL_LOCAL_CACHE = {'MAX_ENTRIES': 256, 'TIMEOUT': 5}
+
+# Counts cache hits, misses and queries for the nfl lookups. Add
+# 'nfl.stats.StatsMiddleware' to MIDDLEWARE_CLASSES to log them per request.
+#NFL_STATS = True
+
+# Binary snapshot of the active season written by manage.py export_snapshot.
+# New workers read teams, weeks and schedules from it (see nfl.snapshot).
+#NFL_SNAPSHOT = '/var/tmp/nfl-snapshot.bin'
+
 # Local time zone for this installation. Choices can be found here:
 # http://en.wikipedia.org/wiki/List_of_tz_zones_by_name
 # although not all choices may be available on all operating systems.
@@ -9,11 +9,42 @@ from django.http import Http404
 from django.utils.encoding import force_unicode
 from django.utils.html import escape
 from django.utils.safestring import mark_safe
+from django.utils.functional import wraps
 from django.utils.translation import ugettext as _
 
-from nfl import models, forms
+from nfl import models, forms, utils
 
-class DivisionAdmin(admin.ModelAdmin):
+def defer_bumps(view):
+    """
+    The model signals bump the cache namespaces while the view's
+    transaction is still open. This holds the bumps back until the view
+    has returned and the transaction has been committed, otherwise another
+    request could cache the old rows under the new version.
+    """
+    def wrapper(*args, **kwargs):
+        with utils.deferred_bumps():
+            return view(*args, **kwargs)
+    return wraps(view)(wrapper)
+
+class ModelAdmin(admin.ModelAdmin):
+
+    @defer_bumps
+    def add_view(self, *args, **kwargs):
+        return super(ModelAdmin, self).add_view(*args, **kwargs)
+
+    @defer_bumps
+    def change_view(self, *args, **kwargs):
+        return super(ModelAdmin, self).change_view(*args, **kwargs)
+
+    @defer_bumps
+    def delete_view(self, *args, **kwargs):
+        return super(ModelAdmin, self).delete_view(*args, **kwargs)
+
+    @defer_bumps
+    def changelist_view(self, *args, **kwargs):
+        return super(ModelAdmin, self).changelist_view(*args, **kwargs)
+
+class DivisionAdmin(ModelAdmin):
     readonly_fields = ['conference', 'region']
 
     def has_add_permission(self, request):
@@ -22,31 +53,34 @@ class DivisionAdmin(admin.ModelAdmin):
     def has_delete_permission(self, request, obj=None):
         return False
 
-class TeamAdmin(admin.ModelAdmin):
+class TeamAdmin(ModelAdmin):
     list_display = ['name', 'abbr', 'division', 'is_active']
     list_filter = ['division', 'is_active']
+    list_select_related = True
 
-class WeekAdmin(admin.ModelAdmin):
+class WeekAdmin(ModelAdmin):
     list_display = ['number', 'first_game', 'last_game']
-    list_filter = ['season__year']
+    list_filter = ['season']
 
-class GameAdmin(admin.ModelAdmin):
+class GameAdmin(ModelAdmin):
     list_display = ['__unicode__', 'week_pk', 'number', 'game_time']
-    list_filter = ['week__season__year', 'week__number', 'game_time']
+    list_filter = ['week__season', 'week__number', 'game_time']
     date_hierarchy = 'game_time'
 
     def week_pk(self, obj):
-        return obj.week.pk
+        return obj.week_id
     week_pk.short_description = "Week Number"
 
-class WinnerAdmin(admin.ModelAdmin):
+class WinnerAdmin(ModelAdmin):
     fields = ('week',
         'game1', 'game2', 'game3', 'game4',
         'game5', 'game6', 'game7', 'game8',
         'game9', 'game10', 'game11', 'game12',
         'game13', 'game14', 'game15', 'game16',
     )
-    list_filter = ['week__season__year']
+    list_filter = ['week__season']
+    list_select_related = True
+    ordering = ['week']
     form = forms.BaseGamesForm
 
     def get_admin_form(self, form, request, obj=None):
@@ -54,6 +88,7 @@ class WinnerAdmin(admin.ModelAdmin):
                                  self.prepopulated_fields, self.get_readonly_fields(request, obj),
                                  model_admin=self)
 
+    @defer_bumps
     @csrf_protect_m
     @transaction.commit_on_success
     def add_view(self, request, form_url='', extra_context=None):
@@ -103,6 +138,7 @@ class WinnerAdmin(admin.ModelAdmin):
         self.log_change(request, new_object, change_message)
         return self.response_change(request, new_object)
 
+    @defer_bumps
     @csrf_protect_m
     @transaction.commit_on_success
     def change_view(self, request, object_id, extra_context=None):
@@ -141,12 +177,12 @@ class WinnerAdmin(admin.ModelAdmin):
         return self.render_change_form(request, context, change=True, obj=obj)
 
 
-class TeamResultAdmin(admin.ModelAdmin):
-    list_filter = ('week', 'week__season__year')
+class TeamResultAdmin(ModelAdmin):
+    list_filter = ('week', 'week__season')
     fields = ('week', 'team', 'wins', 'losses', 'total_wins', 'total_losses')
 
 admin.site.register(models.Division, DivisionAdmin)
-admin.site.register(models.Season)
+admin.site.register(models.Season, ModelAdmin)
 admin.site.register(models.Team, TeamAdmin)
 admin.site.register(models.Week, WeekAdmin)
 admin.site.register(models.Game, GameAdmin)
@@ -0,0 +1,194 @@
+"""
+Applies game results from a live score feed as games finish, rather than
+waiting for them to be entered in the admin.
+
+A source is anything that can be iterated over for game final events, one
+JSON object per line:
+
+    {"game": "2011-1-3", "winner": "GB"}
+
+where game is the Game primary key ("<season>-<week>-<number>") and winner
+is the team key of the team that won (blank to take a result back out).
+FileSource and SocketSource read them from a file or a TCP connection.
+
+The source is read on its own thread. Events that arrive within `window`
+seconds of the first one in a batch are coalesced, and the batch is
+applied in one transaction: each week's Winner is updated once (which
+brings its TeamResult rows up to date), and every cache namespace the
+batch touched is bumped once, after the transaction commits.
+"""
+import logging
+import Queue
+import socket
+import threading
+import time
+
+from django.db import transaction
+from django.utils import simplejson
+from django.utils.encoding import force_unicode
+
+from nfl import models, utils
+
+WINDOW = 2.0
+
+logger = logging.getLogger('nfl.feed')
+
+class ScoreFeedError(Exception):
+    pass
+
+def parse_event(line):
+    """
+    Returns (week key, game number, winner) for a line of the feed.
+    """
+    try:
+        event = simplejson.loads(line)
+        game_key = force_unicode(event['game'])
+        winner = force_unicode(event.get('winner') or '').strip().upper()
+        week_key, number = game_key.rsplit('-', 1)
+        return week_key, int(number), winner
+    except (ValueError, KeyError, TypeError, AttributeError):
+        raise ScoreFeedError("Can't read score feed event: %r" % line)
+
+class FileSource(object):
+    """
+    Reads events from a file like object (or a path) until the end of it.
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+
+    def __iter__(self):
+        if isinstance(self.stream, basestring):
+            with open(self.stream, 'rb') as stream:
+                for line in self._lines(stream):
+                    yield line
+        else:
+            for line in self._lines(self.stream):
+                yield line
+
+    def _lines(self, stream):
+        for line in stream:
+            if line.strip():
+                yield line
+
+class SocketSource(FileSource):
+    """
+    Reads events from a TCP connection until the other end closes it.
+    """
+
+    def __init__(self, host, port, timeout=None):
+        self.address = (host, port)
+        self.timeout = timeout
+
+    def __iter__(self):
+        sock = socket.create_connection(self.address, self.timeout)
+        try:
+            for line in self._lines(sock.makefile('rb')):
+                yield line
+        finally:
+            sock.close()
+
+class ScoreFeedIngestor(object):
+    """
+    Reads a source on a background thread and applies its events in
+    batches. run() returns once the source is used up, after applying
+    what was read, and raises ScoreFeedError if reading it failed.
+    """
+
+    def __init__(self, source, window=WINDOW):
+        self.source = source
+        self.window = window
+        self.counts = dict.fromkeys(['events', 'batches', 'winners', 'errors'], 0)
+        self._queue = Queue.Queue()
+        self._done = object()
+        self._source_error = None
+
+    def read(self):
+        try:
+            for line in self.source:
+                self._queue.put(line)
+        except Exception as e:
+            self._source_error = e
+        finally:
+            self._queue.put(self._done)
+
+    def run(self):
+        reader = threading.Thread(target=self.read, name='nfl-score-feed')
+        reader.daemon = True
+        reader.start()
+
+        finished = False
+        while not finished:
+            batch = []
+            line = self._queue.get()
+            deadline = time.time() + self.window
+            while line is not self._done:
+                batch.append(line)
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                try:
+                    line = self._queue.get(timeout=remaining)
+                except Queue.Empty:
+                    break
+            finished = line is self._done
+            if batch:
+                self.apply_batch(batch)
+        reader.join()
+        if self._source_error is not None:
+            raise ScoreFeedError("Reading the score feed failed: %s" % self._source_error)
+        return self.counts
+
+    def apply_batch(self, lines):
+        """
+        Applies a batch of events, the last one for a game winning.
+        """
+        results = {}
+        for line in lines:
+            self.counts['events'] += 1
+            try:
+                week_key, number, winner = parse_event(line)
+            except ScoreFeedError as e:
+                self._error(e)
+                continue
+            results.setdefault(week_key, {})[number] = winner
+
+        with utils.deferred_bumps():
+            self._save_winners(results)
+        self.counts['batches'] += 1
+
+    @transaction.commit_on_success
+    def _save_winners(self, results):
+        winners = dict((w.week_id, w) for w in models.Winner.objects.filter(week__in=results.keys()))
+        for week_key, games in sorted(results.items()):
+            try:
+                week = models.Week.current_week(week_key)
+            except models.Week.DoesNotExist:
+                self._error("There's no week %s." % week_key)
+                continue
+            schedule = dict((g.number, g) for g in models.Game.week_schedule(week))
+            winner = winners.get(week_key) or models.Winner(week=week)
+            changed = False
+            for number, team_key in sorted(games.items()):
+                game = schedule.get(number)
+                if game is None:
+                    self._error("There's no game %s-%s." % (week_key, number))
+                elif team_key and team_key not in (game.home_id, game.away_id):
+                    self._error("%s isn't playing in game %s-%s (%s)." % (team_key, week_key, number, game))
+                elif getattr(winner, 'game%s' % number) != team_key:
+                    setattr(winner, 'game%s' % number, team_key)
+                    changed = True
+            if changed:
+                winner.save()
+                self.counts['winners'] += 1
+
+    def _error(self, message):
+        self.counts['errors'] += 1
+        logger.warning("%s", message)
+
+def ingest(source, window=WINDOW):
+    """
+    Applies the events from a source and returns how many events, batches,
+    winners saved and errors there were.
+    """
+    return ScoreFeedIngestor(source, window).run()
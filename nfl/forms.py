@@ -1,58 +1,180 @@
 
+import copy
+
 from django import forms
+from django.utils.datastructures import SortedDict
 from django.utils.encoding import force_unicode
 from django.utils.safestring import mark_safe
 
-from nfl import models
+from nfl import models, utils
+
 
+# Rendered pick lists, see ScheduleGameWidget.render
+fragment_cache = utils.LocalCache(max_entries=2048, timeout=60 * 60)
 
 class ScheduleGameWidget(forms.RadioSelect.renderer):
 
     def render(self):
-        """Outputs a <ul> for this set of radio fields."""
+        """
+        Outputs a <ul> for this set of radio fields. The markup only depends
+        on the field name, the selected team, the attrs and the choices
+        (which come from the week's schedule and team names), so it's kept
+        in fragment_cache under those. A change to the schedule or a team
+        name changes the choices, so stale markup is never picked up.
+        """
+        if fragment_cache is None:
+            return self._render()
+        try:
+            key = (self.name, self.value, tuple(self.choices), tuple(sorted(self.attrs.items())))
+            hash(key)
+        except TypeError:
+            return self._render()
+
+        html = fragment_cache.get(key)
+        if html is None:
+            html = self._render()
+            fragment_cache.set(key, html)
+        return html
+
+    def _render(self):
         return mark_safe(u'<ul class="radiolist inline">%s</ul>' % u''.join([u'<li>%s</li>'
                 % force_unicode(w) for w in self]))
 
 class BaseGamesForm(forms.ModelForm):
     date_trigger = 'first_game'
     delay = False
+    # set on the per week classes built by for_week
+    week = None
+    game_fields = ()
+    # (widget hook, label hook, week key) -> (version, game fields), see
+    # week_game_fields
+    _game_fields = {}
 
     def __init__(self, *args,  **kwargs):
         self.current_week_key = kwargs.pop('current_week', None)
 
 
         super(BaseGamesForm, self).__init__(*args, **kwargs)
-        self.add_game_fields()
+        if self.week is None:
+            self.add_game_fields()
 
-    def add_game_fields(self):
+    @classmethod
+    def for_week(cls, week):
+        """
+        Returns a subclass of this form with the week's game fields already
+        built, so creating one is just the normal form constructor. One
+        class is kept per form class and week, and rebuilt when the week's
+        schedule or the teams change.
+        """
+        version = cls._week_version(week)
+        # kept on the class itself (not inherited) so classes built on the
+        # fly take their week forms with them when they're garbage
+        # collected.
+        if '_week_forms' not in cls.__dict__:
+            cls._week_forms = {}
+        cached = cls._week_forms.get(week.pk)
+        if cached is None or cached[0] != version:
+            cached = (version, cls._build_week_form(week))
+            cls._week_forms[week.pk] = cached
+        return cached[1]
+
+    @classmethod
+    def _week_version(cls, week):
+        return (utils.get_version(models.Game.schedule_namespace(week.pk)),
+                utils.get_version(models.Team.CACHE_NAMESPACE))
+
+    @classmethod
+    def week_game_fields(cls, week):
+        """
+        Returns the week's game fields by name, in game number order. They
+        only depend on the schedule, the teams and the label and widget
+        hooks, so they're kept on BaseGamesForm for every form class with
+        the same hooks (the admin builds a new form class for each
+        request) and rebuilt when the week's schedule or the teams change.
+        Copy a field before changing it.
+        """
+        version = cls._week_version(week)
+        key = (cls.get_game_choice_widget.im_func, cls._get_label.im_func, week.pk)
+        cached = BaseGamesForm._game_fields.get(key)
+        if cached is None or cached[0] != version:
+            cached = (version, cls._build_game_fields(week))
+            BaseGamesForm._game_fields[key] = cached
+        return cached[1]
+
+    @classmethod
+    def _build_game_fields(cls, week):
         """
         Adds all the games. It is WAY more efficient to just get the values
         for the games and look up the team numbers than to let the foreign
         keys just do all their lookups. (8 rpc's vs ~ 38)
         """
-        current_week = models.Week.current_week(self.initial.get('week'),
-                                                self.date_trigger, self.delay)
-
-        teams = dict((t.pk, t) for t in models.Team.all_teams())
-        for game in models.Game.week_schedule(current_week):
+        teams = models.Team.registry()
+        hooks = cls._hooks()
+        game_fields = SortedDict()
+        for game in models.Game.week_schedule(week):
             away_team = teams.get(game.away_id)
             home_team = teams.get(game.home_id)
 
-            # if we don't add the field name to _meta.fields, the games
-            # won't save when the form saves.
-            field_name = 'game%s' % game.number
-            self._meta.fields.append(field_name)
-            self.fields[field_name] = forms.ChoiceField(
+            game_fields['game%s' % game.number] = forms.ChoiceField(
                 label='Game %s' % game.number,
-                widget=self.get_game_choice_widget(),
+                widget=hooks.get_game_choice_widget(),
                 choices=[
-                    (game.away_id, self._get_label(away_team)),
-                    (game.home_id, self._get_label(home_team)),                                                            ],
-                )
+                    (game.away_id, hooks._get_label(away_team)),
+                    (game.home_id, hooks._get_label(home_team)),
+                ],
+            )
+        return game_fields
+
+    @classmethod
+    def _meta_fields(cls, meta, game_fields):
+        # if the game fields aren't in _meta.fields, the games
+        # won't save when the form saves.
+        return list(meta.fields) + [f for f in game_fields if f not in meta.fields]
+
+    @classmethod
+    def _build_week_form(cls, week):
+        game_fields = cls.week_game_fields(week)
+        attrs = {'__module__': cls.__module__, 'week': week, 'game_fields': tuple(game_fields)}
+        attrs.update(game_fields)
+
+        meta_attrs = {}
+        if cls._meta.fields is not None:
+            meta_attrs['fields'] = cls._meta_fields(cls._meta, game_fields)
+        meta_bases = (cls.Meta, object) if hasattr(cls, 'Meta') else (object,)
+        attrs['Meta'] = type('Meta', meta_bases, meta_attrs)
+
+        name = '%sWeek%s' % (cls.__name__, week.pk.replace('-', '_'))
+        return type(cls)(str(name), (cls,), attrs)
+
+    def add_game_fields(self):
+        """
+        Switches this form over to the current week's game fields.
+        """
+        current_week = models.Week.current_week(self.initial.get('week'),
+                                                self.date_trigger, self.delay)
+        if current_week is None:
+            return
+
+        game_fields = self.week_game_fields(current_week)
+        if self._meta.fields is not None:
+            self._meta = copy.copy(self._meta)
+            self._meta.fields = self._meta_fields(self._meta, game_fields)
+        for field_name, field in game_fields.items():
+            self.fields[field_name] = copy.deepcopy(field)
+
+    @classmethod
+    def _hooks(cls):
+        """
+        get_game_choice_widget and _get_label are overridden as instance
+        methods, but the week's fields are built once for the form class
+        before there's a form, so they're called on an instance that
+        hasn't been through __init__.
+        """
+        return cls.__new__(cls)
 
     def get_game_choice_widget(self):
         return forms.RadioSelect(renderer=ScheduleGameWidget)
 
     def _get_label(self, team):
         return str(team)
-#        return "%s (%s-%s)" % (team, team.wins, team.losses)
\ No newline at end of file
+#        return "%s (%s-%s)" % (team, team.wins, team.losses)
@@ -0,0 +1,195 @@
+"""
+Generates made up seasons for benchmarks and load testing: schedules for
+the teams that are already loaded, a winner and team results for every
+week, and pool pick sheets. The same seed always generates the same data.
+
+Every season has WEEK_COUNT weeks of GAME_COUNT games with no byes. The
+weekly match ups are rounds of a round robin between the teams, picked
+at random, so no two teams meet twice in a season.
+
+Pick sheets are written as plain rows rather than model instances, which
+keeps the python side cheap. On sqlite, 20 seasons take about 2 seconds
+and 20 seasons with 50,000 entrants (850,000 pick sheets) about 35,
+nearly all of it spent in the inserts: django's sqlite backend registers
+an adapter for str, which makes the driver adapt each of the 22 values
+a row binds.
+"""
+import datetime
+import random
+
+from django.db import connections, router, transaction
+
+from nfl import models, utils
+from nfl.picks import PICK_SHEET_FIELDS
+
+CHUNK_SIZE = 1000
+WEEK_COUNT = 17
+HOME_WIN_RATE = 0.57
+# share of pick sheets that leave some games blank
+PARTIAL_SHEET_RATE = 0.05
+
+# when each game number kicks off: (days after Thursday, hour, minute)
+KICKOFFS = ([(0, 20, 30)] + [(3, 13, 0)] * 9 + [(3, 16, 15)] * 4 +
+            [(3, 20, 20), (4, 20, 30)])
+
+class DataGenerationError(Exception):
+    pass
+
+def season_opener(year):
+    """
+    The Thursday after Labor Day (the first Monday in September).
+    """
+    labor_day = datetime.date(year, 9, 1)
+    labor_day += datetime.timedelta(days=(7 - labor_day.weekday()) % 7)
+    return labor_day + datetime.timedelta(days=3)
+
+def round_robin(teams):
+    """
+    Returns len(teams) - 1 rounds in which every team plays every other
+    team once, each round a list of (team, team) pairs.
+    """
+    teams = list(teams)
+    rounds = []
+    for i in range(len(teams) - 1):
+        half = len(teams) // 2
+        rounds.append(zip(teams[:half], reversed(teams[half:])))
+        teams.insert(1, teams.pop())
+    return rounds
+
+class DataGenerator(object):
+
+    def __init__(self, seed=0, chunk_size=CHUNK_SIZE):
+        self.random = random.Random(seed)
+        self.chunk_size = chunk_size
+        self.teams = sorted(models.Team.objects.filter(is_active=True).values_list('pk', flat=True))
+        if len(self.teams) != models.GamesMixin.GAME_COUNT * 2:
+            raise DataGenerationError("Generating schedules needs %s active teams, there are %s." % (
+                models.GamesMixin.GAME_COUNT * 2, len(self.teams)))
+        self.counts = dict.fromkeys(['seasons', 'weeks', 'games', 'winners', 'team_results', 'pick_sheets'], 0)
+
+    def generate(self, years, entrants=0, pick_seasons=1):
+        """
+        Generates the seasons for years, with pick sheets for each of the
+        entrants in the last pick_seasons of them.
+        """
+        years = sorted(years)
+        existing = models.Season.objects.filter(year__in=[str(y) for y in years])
+        if existing.exists():
+            raise DataGenerationError("Seasons already exist: %s" % ", ".join(s.pk for s in existing))
+
+        schedules = {}
+        for year in years:
+            schedules.update(self.add_season(year))
+        for year in years[len(years) - pick_seasons:]:
+            self.add_pick_sheets(year, entrants, schedules)
+
+        for year in years:
+            models.Week.invalidate_season(str(year))
+            models.TeamResult.invalidate_standings(str(year))
+        for week_key in schedules:
+            utils.bump_version(models.Game.schedule_namespace(week_key))
+            utils.bump_version(models.Winner.week_namespace(week_key))
+        return self.counts
+
+    def add_season(self, year):
+        """
+        Writes a season's weeks, games, winners and team results and returns
+        {week key: {game number: game}}.
+        """
+        season = models.Season.objects.create(year=str(year))
+        self.counts['seasons'] += 1
+
+        opener = season_opener(year)
+        teams = list(self.teams)
+        self.random.shuffle(teams)
+        rounds = self.random.sample(round_robin(teams), WEEK_COUNT)
+
+        weeks, games, winners, results, schedules = [], [], [], [], {}
+        totals = dict((team, (0, 0)) for team in teams)
+        for number, pairs in enumerate(rounds, 1):
+            thursday = opener + datetime.timedelta(weeks=number - 1)
+            week_key = "%s-%s" % (season.pk, number)
+            schedule = schedules[week_key] = {}
+            winner = models.Winner(week_id=week_key)
+            for game_number, pair in enumerate(pairs, 1):
+                away, home = pair if self.random.random() < 0.5 else reversed(pair)
+                days, hour, minute = KICKOFFS[game_number - 1]
+                kickoff = datetime.datetime.combine(thursday, datetime.time(hour, minute))
+                game = schedule[game_number] = models.Game(
+                    primary_key="%s-%s" % (week_key, game_number), week_id=week_key,
+                    number=game_number, away_id=away, home_id=home,
+                    game_time=kickoff + datetime.timedelta(days=days))
+                games.append(game)
+
+                won, lost = (home, away) if self.random.random() < HOME_WIN_RATE else (away, home)
+                setattr(winner, 'game%s' % game_number, won)
+                for team, outcome in ((won, (1, 0)), (lost, (0, 1))):
+                    totals[team] = (totals[team][0] + outcome[0], totals[team][1] + outcome[1])
+                    results.append(models.TeamResult(
+                        team_id=team, week_id=week_key, wins=outcome[0], losses=outcome[1],
+                        total_wins=totals[team][0], total_losses=totals[team][1]))
+
+            winner.pack_games(schedule)
+            winners.append(winner)
+            times = [g.game_time for g in schedule.values()]
+            weeks.append(models.Week(primary_key=week_key, season_id=season.pk, number=number,
+                                     first_game=min(times), last_game=max(times)))
+
+        utils.bulk_create(models.Week, weeks, self.chunk_size)
+        utils.bulk_create(models.Game, games, self.chunk_size)
+        utils.bulk_create(models.Winner, winners, self.chunk_size)
+        utils.bulk_create(models.TeamResult, results, self.chunk_size)
+        self.counts['weeks'] += len(weeks)
+        self.counts['games'] += len(games)
+        self.counts['winners'] += len(winners)
+        self.counts['team_results'] += len(results)
+        return schedules
+
+    def add_pick_sheets(self, year, entrants, schedules):
+        week_keys = sorted((k for k in schedules if k.startswith("%s-" % year)),
+                           key=lambda k: int(k.split('-')[1]))
+        rows = self.pick_sheet_rows([(k, schedules[k]) for k in week_keys], entrants)
+        utils.insert_rows(models.PickSheet, PICK_SHEET_FIELDS, rows, self.chunk_size)
+        self.counts['pick_sheets'] += len(week_keys) * entrants
+
+    def pick_sheet_rows(self, week_schedules, entrants):
+        """
+        Yields a row for each entrant and week. Picks are made by drawing
+        random masks and reading the team keys back off the schedule.
+        Rows come in (entrant, week) order, the order of the unique index,
+        which keeps the inserts cheap.
+        """
+        connection = connections[router.db_for_write(models.PickSheet)]
+        now = connection.ops.value_to_db_datetime(datetime.datetime.now().replace(microsecond=0))
+        weeks = []
+        for week_key, schedule in week_schedules:
+            games = [(1 << (n - 1), schedule[n].home_id, schedule[n].away_id)
+                     for n in range(1, models.GamesMixin.GAME_COUNT + 1)]
+            weeks.append((unicode(week_key), games))
+        game_count = models.GamesMixin.GAME_COUNT
+        full_mask = (1 << game_count) - 1
+
+        for entrant in range(1, entrants + 1):
+            name = u"entrant%06d" % entrant
+            for week_key, games in weeks:
+                home_mask = self.random.getrandbits(game_count)
+                filled_mask = full_mask
+                if self.random.random() < PARTIAL_SHEET_RATE:
+                    filled_mask = self.random.getrandbits(game_count)
+                home_mask &= filled_mask
+                picks = [(home if home_mask & bit else away) if filled_mask & bit else u''
+                         for bit, home, away in games]
+                yield [name, week_key] + picks + [home_mask, filled_mask, now, now]
+
+def generate_data(years, entrants=0, pick_seasons=1, seed=0, chunk_size=CHUNK_SIZE):
+    """
+    Generates the data in one transaction and returns the number of rows
+    written by model. The cache namespaces are bumped after the commit.
+    """
+    with utils.deferred_bumps():
+        return _generate_data(years, entrants, pick_seasons, seed, chunk_size)
+
+@transaction.commit_on_success
+def _generate_data(years, entrants, pick_seasons, seed, chunk_size):
+    generator = DataGenerator(seed, chunk_size)
+    return generator.generate(years, entrants, pick_seasons)
@@ -0,0 +1,263 @@
+"""
+Loads season schedules in bulk. Weeks and games are written with bulk
+inserts instead of going through Model.save() one row at a time, and the
+schedule caches are invalidated once at the end.
+
+Two formats are understood:
+
+json: the fixture format used by fixtures/2011_games.json. Only
+    nfl.week and nfl.game records are imported.
+csv: one game per line with a header row of
+    season,week,number,away,home,game_time
+    Weeks are created from the first and last game times in them. Weeks
+    that are already there keep the games that aren't in the file, so
+    their range is worked out again from all of their games.
+
+Game times are "YYYY-MM-DD HH:MM[:SS]" in Eastern time.
+"""
+import csv
+import datetime
+
+from django.db import transaction
+from django.db.models import Max, Min
+from django.utils import simplejson
+
+from nfl import models, utils
+
+CHUNK_SIZE = 500
+READ_SIZE = 64 * 1024
+DATETIME_FORMATS = ('%Y-%m-%d %H:%M:%S', '%Y-%m-%d %H:%M')
+
+class ScheduleImportError(Exception):
+    pass
+
+def iter_json_objects(stream, read_size=READ_SIZE):
+    """
+    Yields the objects in a top level JSON array one at a time, reading
+    the stream a piece at a time instead of loading the whole file.
+    """
+    decoder = simplejson.JSONDecoder()
+    buf, pos, eof = '', 0, False
+    while True:
+        while pos < len(buf) and buf[pos] in ' \t\r\n,[':
+            pos += 1
+        if pos < len(buf) and buf[pos] == ']':
+            return
+        if pos < len(buf):
+            try:
+                obj, pos = decoder.raw_decode(buf, pos)
+            except ValueError:
+                if eof:
+                    raise ScheduleImportError("Invalid JSON near: %r" % buf[pos:pos + 50])
+            else:
+                yield obj
+                continue
+        elif eof:
+            return
+
+        chunk = stream.read(read_size)
+        eof = not chunk
+        buf, pos = buf[pos:] + chunk, 0
+
+def parse_datetime(value):
+    for date_format in DATETIME_FORMATS:
+        try:
+            return datetime.datetime.strptime(value.strip(), date_format)
+        except ValueError:
+            pass
+    raise ScheduleImportError("Unrecognized date and time: %r" % value)
+
+def iter_json_records(stream):
+    """
+    Yields ('week', fields) and ('game', fields) from a fixture.
+    """
+    for obj in iter_json_objects(stream):
+        model = obj.get('model')
+        if model == 'nfl.week':
+            fields = obj['fields']
+            yield 'week', {
+                'season': fields['season'],
+                'number': int(fields['number']),
+                'first_game': parse_datetime(fields['first_game']),
+                'last_game': parse_datetime(fields['last_game']),
+            }
+        elif model == 'nfl.game':
+            fields = obj['fields']
+            yield 'game', {
+                'week': fields['week'],
+                'number': int(fields['number']),
+                'away': fields['away'],
+                'home': fields['home'],
+                'game_time': parse_datetime(fields['game_time']),
+                'is_active': fields.get('is_active', True),
+            }
+
+def iter_csv_records(stream):
+    """
+    Yields ('game', fields) for each line. The weeks are worked out by
+    ScheduleImporter from the games in them.
+    """
+    for row in csv.DictReader(stream):
+        try:
+            yield 'game', {
+                'season': row['season'].strip(),
+                'week': "%s-%s" % (row['season'].strip(), int(row['week'])),
+                'number': int(row['number']),
+                'away': row['away'].strip(),
+                'home': row['home'].strip(),
+                'game_time': parse_datetime(row['game_time']),
+                'is_active': True,
+            }
+        except (KeyError, ValueError) as e:
+            raise ScheduleImportError("Invalid schedule line %s: %s" % (row, e))
+
+class ScheduleImporter(object):
+    """
+    Writes weeks and games in chunks. Week keys are "<season>-<number>"
+    and game keys "<week>-<number>", so they're worked out from the
+    records without fetching anything.
+    """
+
+    def __init__(self, chunk_size=CHUNK_SIZE):
+        self.chunk_size = chunk_size
+        self.weeks = {}
+        self.pending_weeks = set()
+        self.games = []
+        self.game_count = 0
+        # the weeks of every game written, which may not be in self.weeks
+        # when the file only has games
+        self.game_weeks = set()
+        # weeks without a week record, whose range comes from their games
+        self.game_ranged = set()
+        # the game_ranged weeks that were already there
+        self.ranged_weeks = set()
+
+    def add(self, kind, fields):
+        if kind == 'week':
+            self.add_week(fields['season'], fields['number'],
+                          fields['first_game'], fields['last_game'])
+            self.game_ranged.discard("%s-%s" % (fields['season'], fields['number']))
+        else:
+            self.add_game(fields)
+
+    def add_week(self, season_key, number, first_game, last_game):
+        week_key = "%s-%s" % (season_key, number)
+        week = self.weeks.get(week_key)
+        if week is None:
+            week = self.weeks[week_key] = models.Week(
+                primary_key=week_key, season_id=season_key, number=number,
+                first_game=first_game, last_game=last_game)
+        else:
+            week.first_game = min(week.first_game, first_game)
+            week.last_game = max(week.last_game, last_game)
+        self.pending_weeks.add(week_key)
+
+    def add_game(self, fields):
+        if 'season' in fields:
+            season_key, number = fields['week'].split('-')
+            if fields['week'] not in self.weeks:
+                self.game_ranged.add(fields['week'])
+            self.add_week(season_key, int(number), fields['game_time'], fields['game_time'])
+        self.game_weeks.add(fields['week'])
+        self.games.append(models.Game(
+            primary_key="%s-%s" % (fields['week'], fields['number']),
+            week_id=fields['week'], number=fields['number'],
+            home_id=fields['home'], away_id=fields['away'],
+            game_time=fields['game_time'], is_active=fields['is_active']))
+        if len(self.games) >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        self.write_weeks()
+        self.write_games()
+
+    def write_weeks(self):
+        if not self.pending_weeks:
+            return
+        weeks = [self.weeks[key] for key in sorted(self.pending_weeks)]
+        self.pending_weeks = set()
+
+        for season_key in set(week.season_id for week in weeks):
+            models.Season.objects.get_or_create(year=season_key)
+
+        existing = set(models.Week.objects.filter(pk__in=[w.pk for w in weeks]).values_list('pk', flat=True))
+        now = datetime.datetime.now()
+        for week in weeks:
+            if week.pk in existing and week.pk in self.game_ranged:
+                self.ranged_weeks.add(week.pk)
+            elif week.pk in existing:
+                models.Week.objects.filter(pk=week.pk).update(
+                    first_game=week.first_game, last_game=week.last_game, updated_time=now)
+        utils.bulk_create(models.Week, [w for w in weeks if w.pk not in existing], self.chunk_size)
+
+    def write_games(self):
+        """
+        Replaces any games that are already there. Nothing refers to a
+        game, so deleting and inserting is the cheapest upsert.
+        """
+        if not self.games:
+            return
+        # the last record wins when a game is in the file twice
+        games = dict((g.pk, g) for g in self.games).values()
+        self.games = []
+
+        existing = models.Game.objects.filter(pk__in=[g.pk for g in games])
+        created = dict(existing.values_list('pk', 'created_time'))
+        utils.bulk_delete(models.Game, created.keys())
+        for game in games:
+            game.created_time = created.get(game.pk)
+        utils.bulk_create(models.Game, games, self.chunk_size)
+        self.game_count += len(games)
+
+    def write_week_ranges(self):
+        """
+        Sets the first and last game of the weeks that were already there
+        from all of their games, not only the ones in the file.
+        """
+        if not self.ranged_weeks:
+            return
+        ranges = (models.Game.objects.filter(week__in=self.ranged_weeks).order_by().values('week')
+                  .annotate(first=Min('game_time'), last=Max('game_time')))
+        now = datetime.datetime.now()
+        for week_range in ranges:
+            models.Week.objects.filter(pk=week_range['week']).update(
+                first_game=week_range['first'], last_game=week_range['last'], updated_time=now)
+
+    def finish(self):
+        self.flush()
+        self.write_week_ranges()
+        # winners and pick sheets are packed against the schedule
+        for week_key in sorted(self.game_weeks):
+            models.Game.repack_picks(week_key)
+
+    def invalidate(self):
+        week_keys = set(self.weeks) | self.game_weeks
+        for season_key in set(week_key.split('-')[0] for week_key in week_keys):
+            models.Week.invalidate_season(season_key)
+            models.TeamResult.invalidate_standings(season_key)
+        for week_key in week_keys:
+            utils.bump_version(models.Game.schedule_namespace(week_key))
+
+def import_schedule(stream, format='json', chunk_size=CHUNK_SIZE):
+    """
+    Imports a schedule from a file like object in one transaction and
+    returns (number of weeks, number of games) written.
+    """
+    if format == 'json':
+        records = iter_json_records(stream)
+    elif format == 'csv':
+        records = iter_csv_records(stream)
+    else:
+        raise ScheduleImportError("Unknown schedule format: %r" % format)
+
+    importer = ScheduleImporter(chunk_size)
+    with utils.deferred_bumps():
+        _import_records(importer, records)
+        importer.invalidate()
+    return len(importer.weeks), importer.game_count
+
+@transaction.commit_on_success
+def _import_records(importer, records):
+    for kind, fields in records:
+        importer.add(kind, fields)
+    importer.finish()
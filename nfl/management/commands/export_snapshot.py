@@ -0,0 +1,35 @@
+from optparse import make_option
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from nfl import models, snapshot
+
+class Command(BaseCommand):
+    args = '[<snapshot file>]'
+    help = ("Exports the active season's divisions, teams, weeks, games and team results "
+            "to a binary snapshot for workers to start from (NFL_SNAPSHOT by default).")
+    option_list = BaseCommand.option_list + (
+        make_option('--season', dest='season',
+                    help="Season to export instead of the active one."),
+    )
+
+    def handle(self, *args, **options):
+        if len(args) > 1:
+            raise CommandError("Give at most one snapshot file.")
+        path = args[0] if args else getattr(settings, 'NFL_SNAPSHOT', None)
+        if not path:
+            raise CommandError("Give a snapshot file or set NFL_SNAPSHOT.")
+
+        season = options.get('season')
+        if season and not models.Season.objects.filter(pk=season).exists():
+            raise CommandError("There's no %s season." % season)
+
+        try:
+            counts = snapshot.export_snapshot(path, season)
+        except models.Season.DoesNotExist:
+            raise CommandError("There's no active season to export.")
+        except (IOError, OSError, snapshot.SnapshotError) as e:
+            raise CommandError(str(e))
+        self.stdout.write("Exported %s to %s.\n" % (
+            ", ".join("%s %s" % (counts[name], name) for name in sorted(counts)), path))
@@ -0,0 +1,36 @@
+import time
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+from nfl import generator
+
+class Command(BaseCommand):
+    help = ("Generates seasons of made up schedules, winners, team results and "
+            "pool pick sheets for benchmarks and load tests.")
+    option_list = BaseCommand.option_list + (
+        make_option('--seasons', dest='seasons', type='int', default=20,
+                    help="Number of seasons to generate."),
+        make_option('--start-year', dest='start_year', type='int', default=1991,
+                    help="Year of the first generated season."),
+        make_option('--entrants', dest='entrants', type='int', default=1000,
+                    help="Number of pool entrants with a pick sheet for every week."),
+        make_option('--pick-seasons', dest='pick_seasons', type='int', default=1,
+                    help="Number of seasons, counting back from the last, that get pick sheets."),
+        make_option('--seed', dest='seed', type='int', default=0,
+                    help="Random seed. The same seed generates the same data."),
+        make_option('--chunk-size', dest='chunk_size', type='int', default=generator.CHUNK_SIZE,
+                    help="Number of rows written per insert."),
+    )
+
+    def handle(self, *args, **options):
+        years = range(options['start_year'], options['start_year'] + options['seasons'])
+        start = time.time()
+        try:
+            counts = generator.generate_data(years, options['entrants'], options['pick_seasons'],
+                                             options['seed'], options['chunk_size'])
+        except generator.DataGenerationError as e:
+            raise CommandError(str(e))
+        self.stdout.write("Generated %s in %.1f seconds.\n" % (
+            ", ".join("%s %s" % (counts[name], name.replace('_', ' ')) for name in sorted(counts)),
+            time.time() - start))
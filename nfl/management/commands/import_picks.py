@@ -0,0 +1,33 @@
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+from nfl import picks
+
+class Command(BaseCommand):
+    args = '<pick sheet file>'
+    help = ("Saves pool pick sheets from a JSON or CSV file "
+            "(entrant,week,game1,...,game16), replacing any already entered.")
+    option_list = BaseCommand.option_list + (
+        make_option('--format', dest='format', choices=['json', 'csv'],
+                    help="Pick sheet file format. Guessed from the file extension by default."),
+        make_option('--chunk-size', dest='chunk_size', type='int', default=picks.CHUNK_SIZE,
+                    help="Number of pick sheets written per insert."),
+    )
+
+    def handle(self, *args, **options):
+        if len(args) != 1:
+            raise CommandError("Give exactly one pick sheet file to import.")
+        path = args[0]
+        format = options.get('format') or ('csv' if path.lower().endswith('.csv') else 'json')
+
+        try:
+            with open(path, 'rb') as stream:
+                saved, errors = picks.submit_pick_sheets(stream, format, options['chunk_size'])
+        except (IOError, picks.PickSheetError) as e:
+            raise CommandError(str(e))
+
+        for error in errors:
+            self.stderr.write("Row %s (%s, %s): %s\n" % (
+                error['row'], error['entrant'], error['week'], " ".join(error['errors'])))
+        self.stdout.write("Saved %s pick sheets, %s with errors.\n" % (saved, len(errors)))
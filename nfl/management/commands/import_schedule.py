@@ -0,0 +1,29 @@
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+from nfl import importer
+
+class Command(BaseCommand):
+    args = '<schedule file>'
+    help = ("Imports weeks and games from a JSON fixture or a CSV file "
+            "(season,week,number,away,home,game_time) using bulk inserts.")
+    option_list = BaseCommand.option_list + (
+        make_option('--format', dest='format', choices=['json', 'csv'],
+                    help="Schedule file format. Guessed from the file extension by default."),
+        make_option('--chunk-size', dest='chunk_size', type='int', default=importer.CHUNK_SIZE,
+                    help="Number of games written per insert."),
+    )
+
+    def handle(self, *args, **options):
+        if len(args) != 1:
+            raise CommandError("Give exactly one schedule file to import.")
+        path = args[0]
+        format = options.get('format') or ('csv' if path.lower().endswith('.csv') else 'json')
+
+        try:
+            with open(path, 'rb') as stream:
+                weeks, games = importer.import_schedule(stream, format, options['chunk_size'])
+        except (IOError, importer.ScheduleImportError) as e:
+            raise CommandError(str(e))
+        self.stdout.write("Imported %s weeks and %s games.\n" % (weeks, games))
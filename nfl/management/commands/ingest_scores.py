@@ -0,0 +1,35 @@
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+from nfl import feed
+
+class Command(BaseCommand):
+    args = '[<event file>]'
+    help = ("Applies game final events ({\"game\": \"2011-1-3\", \"winner\": \"GB\"} per line) "
+            "from a file or a TCP score feed to the weekly winners and team results.")
+    option_list = BaseCommand.option_list + (
+        make_option('--host', dest='host',
+                    help="Read events from a score feed at this host instead of a file."),
+        make_option('--port', dest='port', type='int',
+                    help="Port of the score feed."),
+        make_option('--window', dest='window', type='float', default=feed.WINDOW,
+                    help="Seconds of events coalesced into each batch."),
+    )
+
+    def handle(self, *args, **options):
+        if options.get('host'):
+            if args or not options.get('port'):
+                raise CommandError("Give a --port for the score feed and no event file.")
+            source = feed.SocketSource(options['host'], options['port'])
+        elif len(args) == 1:
+            source = feed.FileSource(args[0])
+        else:
+            raise CommandError("Give exactly one event file, or a --host and --port to read from.")
+
+        try:
+            counts = feed.ingest(source, options['window'])
+        except feed.ScoreFeedError as e:
+            raise CommandError(str(e))
+        self.stdout.write("Applied %(events)s events in %(batches)s batches, "
+                          "%(winners)s winners saved, %(errors)s errors.\n" % counts)
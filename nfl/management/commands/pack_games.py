@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import get_model
+
+from nfl import models
+
+class Command(BaseCommand):
+    args = '<app_label.ModelName ...>'
+    help = ("Fills in home_mask and filled_mask for existing rows of GamesMixin "
+            "models (nfl.Winner when no models are given).")
+
+    @transaction.commit_on_success
+    def handle(self, *labels, **options):
+        for label in labels or ['nfl.Winner']:
+            model = self.get_games_model(label)
+            count = pack_model_games(model)
+            self.stdout.write("Packed %s %s rows.\n" % (count, label))
+
+    def get_games_model(self, label):
+        try:
+            app_label, model_name = label.split('.')
+        except ValueError:
+            raise CommandError("Models must be given as app_label.ModelName, not %r." % label)
+        model = get_model(app_label, model_name)
+        if model is None or not issubclass(model, models.GamesMixin):
+            raise CommandError("%s is not a GamesMixin model." % label)
+        return model
+
+def pack_model_games(model):
+    """
+    Packs every row one week at a time and returns the number of rows
+    whose masks changed.
+    """
+    count = 0
+    for week_key in model.objects.values_list('week', flat=True).distinct():
+        schedule = dict((g.number, g) for g in models.Game.objects.filter(week=week_key))
+        count += model.repack_week(week_key, schedule)
+    return count
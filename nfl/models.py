@@ -1,9 +1,17 @@
 
+import bisect
+import datetime
+import time
+
 from django.core.validators import RegexValidator, MinValueValidator, MaxValueValidator
-from django.db import models
+from django.db import connections, models, router, transaction
+from django.db.models.query import QuerySet
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from django.utils.datastructures import SortedDict
 from django.utils.encoding import force_unicode
 
-from nfl import tz, utils
+from nfl import stats, tz, utils
 
 class TimestampMixin(models.Model):
     created_time = models.DateTimeField(auto_now_add=True)
@@ -18,8 +26,19 @@ class GamesMixin(models.Model):
     there not every game can be required.
     Games mixin only stores the team key for efficiency and just looks
     up the actual team object for the team chosen when necessary.
+
+    The picks are also packed into two 16 bit masks against the week's
+    schedule: bit n-1 of filled_mask is set when game n has a pick and
+    the same bit of home_mask is set when that pick is the home team.
+    Picks can then be compared as integers (see matching_picks).
+    Subclasses need a `week` foreign key for the masks to be kept up
+    to date when they're saved, and they're packed again when the
+    week's schedule changes (see Game.repack_picks).
     """
-    teams = None
+    GAME_COUNT = 16
+    # keeps the pk__in lists of repack_week under the database's
+    # parameter limits
+    REPACK_CHUNK_SIZE = 500
 
     game1 = models.CharField(max_length=3, blank=True)
     game2 = models.CharField(max_length=3, blank=True)
@@ -38,21 +57,205 @@ class GamesMixin(models.Model):
     game15 = models.CharField(max_length=3, blank=True)
     game16 = models.CharField(max_length=3, blank=True)
 
+    home_mask = models.PositiveIntegerField(default=0, editable=False)
+    filled_mask = models.PositiveIntegerField(default=0, editable=False)
+
     created_time = models.DateTimeField(auto_now_add=True)
     updated_time = models.DateTimeField(auto_now=True)
 
     class Meta(object):
         abstract = True
 
+    def save(self, **kwargs):
+        if getattr(self, 'week_id', None):
+            self.pack_games()
+        super(GamesMixin, self).save(**kwargs)
+
     def get_team(self, game_number):
-        if not self.teams:
-            self.teams = dict((t.pk, t) for t in Team.all_teams())
-        team_key = getattr(self, 'game%s' % game_number)
-        return self.teams.get(team_key)
+        """
+        Returns the TeamRecord picked for the game (or None).
+        """
+        team_key = getattr(self, 'game%s' % game_number) or self.get_packed_pick(game_number)
+        return Team.registry().get(team_key)
+
+    def get_picks(self):
+        return dict((number, getattr(self, 'game%s' % number))
+                    for number in range(1, self.GAME_COUNT + 1))
+
+    def get_schedule(self):
+        """
+        Returns the week's games by game number. A bare Week is enough
+        to look up the cached schedule, so there's no foreign key fetch.
+        """
+        cached = getattr(self, '_schedule', None)
+        if cached is None or cached[0] != self.week_id:
+            week = Week(primary_key=self.week_id)
+            schedule = dict((g.number, g) for g in Game.week_schedule(week))
+            cached = self._schedule = (self.week_id, schedule)
+        return cached[1]
+
+    def pack_games(self, schedule=None):
+        """
+        Sets home_mask and filled_mask from the game fields.
+        """
+        if schedule is None:
+            schedule = self.get_schedule()
+        self.home_mask, self.filled_mask = self.pack(self.get_picks(), schedule)
+
+    def get_packed_pick(self, game_number, schedule=None):
+        """
+        Returns the team key picked for the game according to the masks.
+        """
+        bit = 1 << (game_number - 1)
+        if not self.filled_mask & bit:
+            return None
+        if schedule is None:
+            schedule = self.get_schedule()
+        game = schedule.get(game_number)
+        if game is None:
+            return None
+        return game.home_id if self.home_mask & bit else game.away_id
+
+    def unpack_games(self, schedule=None):
+        """
+        Sets the game fields from home_mask and filled_mask.
+        """
+        for number in range(1, self.GAME_COUNT + 1):
+            setattr(self, 'game%s' % number, self.get_packed_pick(number, schedule) or '')
+
+    @staticmethod
+    def pack(picks, schedule):
+        """
+        Packs picks ({game number: team key}) against a schedule
+        ({game number: game}) into (home_mask, filled_mask). Picks for
+        games that aren't on the schedule or teams that aren't playing
+        in them are left out.
+        """
+        home_mask = filled_mask = 0
+        for number, team_key in picks.items():
+            game = schedule.get(number)
+            if not team_key or game is None:
+                continue
+            bit = 1 << (number - 1)
+            if team_key == game.home_id:
+                home_mask |= bit
+                filled_mask |= bit
+            elif team_key == game.away_id:
+                filled_mask |= bit
+        return home_mask, filled_mask
+
+    @staticmethod
+    def matching_picks(home_mask, filled_mask, other_home_mask, other_filled_mask):
+        """
+        Counts the games both sets of picks have a pick for and agree on.
+        """
+        matches = ~(home_mask ^ other_home_mask) & filled_mask & other_filled_mask
+        return bin(matches & 0xFFFF).count('1')
+
+    @classmethod
+    def repack_week(cls, week_key, schedule):
+        """
+        Packs the week's rows again from their game fields against the
+        schedule ({game number: game}). Rows that end up with the same
+        masks are updated together, and rows whose masks don't change
+        aren't touched. Returns the number of rows updated.
+        """
+        fields = ['game%s' % number for number in range(1, cls.GAME_COUNT + 1)]
+        rows_by_masks = {}
+        for row in cls.objects.filter(week=week_key).values_list('pk', 'home_mask', 'filled_mask', *fields):
+            masks = cls.pack(dict(zip(range(1, cls.GAME_COUNT + 1), row[3:])), schedule)
+            if masks != tuple(row[1:3]):
+                rows_by_masks.setdefault(masks, []).append(row[0])
+
+        count = 0
+        for (home_mask, filled_mask), pks in rows_by_masks.items():
+            for start in range(0, len(pks), cls.REPACK_CHUNK_SIZE):
+                chunk = pks[start:start + cls.REPACK_CHUNK_SIZE]
+                cls.objects.filter(pk__in=chunk).update(home_mask=home_mask, filled_mask=filled_mask)
+            count += len(pks)
+        return count
+
+class ResultQuerySet(QuerySet):
+    """
+    Leaderboards worked out in the database. Rows are ranked against the
+    other rows for the same week by win percentage of their running
+    totals (compared as integers, so ties are exact), sharing a rank when
+    they're level and with rows without any games last. Rows with the same
+    rank are ordered by total wins, then primary key.
+    """
+
+    def _columns(self):
+        qn = connections[self.db].ops.quote_name
+        opts = self.model._meta
+        table = qn(opts.db_table)
+        column = lambda name: "%s.%s" % (table, qn(name))
+        return {
+            'table': table,
+            'week': qn(opts.get_field('week').column),
+            'pk': column(opts.pk.column),
+            'wins': column('total_wins'),
+            'losses': column('total_losses'),
+        }
+
+    def _rank_sql(self):
+        return ("1 + (SELECT COUNT(*) FROM %(table)s other WHERE other.%(week)s = %(table)s.%(week)s AND ("
+                "(other.total_wins + other.total_losses > 0 AND %(wins)s + %(losses)s = 0) OR "
+                "other.total_wins * (%(wins)s + %(losses)s) > %(wins)s * (other.total_wins + other.total_losses)))"
+                ) % self._columns()
+
+    def with_standing(self):
+        """
+        Selects games_played, win_pct (None without any games) and rank.
+        win_pct is win_percent worked out in the database.
+        """
+        columns = self._columns()
+        return self.extra(select=SortedDict([
+            ('games_played', "%(wins)s + %(losses)s" % columns),
+            ('win_pct', "CASE WHEN %(wins)s + %(losses)s > 0 "
+                            "THEN 100.0 * %(wins)s / (%(wins)s + %(losses)s) END" % columns),
+            ('rank', self._rank_sql()),
+        ]))
+
+    def leaderboard(self):
+        return self.with_standing().extra(order_by=['rank', '-total_wins', 'pk'])
+
+    def after(self, result):
+        """
+        The rows of a leaderboard that come after `result` (a row from
+        with_standing or leaderboard), for paging by key rather than by
+        offset.
+        """
+        rank_sql = self._rank_sql()
+        columns = self._columns()
+        return self.extra(
+            where=["(%s > %%s OR (%s = %%s AND (%s < %%s OR (%s = %%s AND %s > %%s))))" % (
+                rank_sql, rank_sql, columns['wins'], columns['wins'], columns['pk'])],
+            params=[result.rank, result.rank, result.total_wins, result.total_wins, result.pk])
+
+    def top(self, week, count=10):
+        """
+        The first `count` rows of a week's leaderboard.
+        """
+        return self.filter(week=week).leaderboard()[:count]
+
+class ResultManager(models.Manager):
+
+    def get_query_set(self):
+        return ResultQuerySet(self.model, using=self._db)
+
+    def with_standing(self):
+        return self.get_query_set().with_standing()
+
+    def leaderboard(self):
+        return self.get_query_set().leaderboard()
+
+    def top(self, week, count=10):
+        return self.get_query_set().top(week, count)
 
 class ResultMixin(models.Model):
     """
-    Mixin for holding results data for a week
+    Mixin for holding results data for a week. Subclasses need a `week`
+    foreign key for the leaderboards in ResultQuerySet.
     """
     wins = models.SmallIntegerField(default=0)
     losses = models.SmallIntegerField(default=0)
@@ -62,6 +265,8 @@ class ResultMixin(models.Model):
     created_time = models.DateTimeField(auto_now_add=True)
     updated_time = models.DateTimeField(auto_now=True)
 
+    objects = ResultManager()
+
     class Meta(object):
         abstract = True
 
@@ -95,7 +300,7 @@ class Division(TimestampMixin):
 class Season(TimestampMixin):
     year = models.CharField(primary_key=True, max_length=4,
                             validators=[RegexValidator(r'^\d{4}$')])
-    is_active = models.BooleanField()
+    is_active = models.BooleanField(db_index=True)
 
     class Meta(object):
         ordering = ('is_active', '-year')
@@ -104,15 +309,43 @@ class Season(TimestampMixin):
         return force_unicode(self.year)
 
     def save(self, **kwargs):
+        """
+        Only one season is active at a time. The other seasons are turned
+        off in the same transaction, and the week caches are invalidated
+        again after the save so nothing built from the old active season
+        in the meantime is kept.
+        """
+        using = kwargs.get('using') or router.db_for_write(Season, instance=self)
+        # a caller's transaction is left for the caller to commit or roll
+        # back, otherwise the two writes get one of their own
+        managed = transaction.is_managed(using=using)
+        if not managed:
+            transaction.enter_transaction_management(using=using)
+            transaction.managed(True, using=using)
+        try:
+            if self.is_active:
+                Season.objects.using(using).exclude(pk=self.pk).update(is_active=False)
+            super(Season, self).save(**kwargs)
+            if not managed:
+                transaction.commit(using=using)
+        except:
+            if not managed:
+                transaction.rollback(using=using)
+            raise
+        finally:
+            if not managed:
+                transaction.leave_transaction_management(using=using)
         if self.is_active:
-            Season.objects.update(is_active=False)
-        super(Season, self).save(**kwargs)
+            Week.invalidate_season(self.pk)
 
     @classmethod
+    @stats.track_queries('Season.active_season')
     def active_season(cls):
         return cls.objects.get(is_active=True)
 
 class Team(TimestampMixin):
+    CACHE_NAMESPACE = 'teams'
+
     abbr = models.CharField(primary_key=True, max_length=3)
     name = models.CharField(max_length=10)
     division = models.ForeignKey(Division, related_name="teams")
@@ -125,11 +358,76 @@ class Team(TimestampMixin):
         return force_unicode(self.name)
 
     @classmethod
+    @stats.track_queries('Team.all_teams')
     def all_teams(cls):
         qs = cls.objects.filter(is_active=True)
-        return utils.get_or_add_qs('all_teams', qs, timeout=2.6*1e6)
+        return utils.get_or_add_qs('all_teams', qs, namespace=cls.CACHE_NAMESPACE,
+                                   lock=True, timeout=utils.MAX_TIMEOUT)
+
+    @classmethod
+    def registry(cls):
+        """
+        Returns the TeamRegistry of the active teams, shared by everything
+        in the process and rebuilt only when the teams cache namespace has
+        changed.
+        """
+        version = utils.get_version(cls.CACHE_NAMESPACE)
+        cached = _team_registry.get(None)
+        if cached is None or cached[0] != version:
+            cached = _team_registry[None] = (version, TeamRegistry(cls.all_teams()))
+        return cached[1]
+
+# None -> (teams cache version, TeamRegistry)
+_team_registry = {}
+
+class TeamRecord(object):
+    """
+    The parts of a team that get looked up over and over (labels, picks,
+    standings), without the weight of a model instance.
+    """
+    __slots__ = ('abbr', 'name', 'division', 'conference')
+
+    def __init__(self, abbr, name, division):
+        self.abbr = abbr
+        self.name = force_unicode(name)
+        self.division = division
+        self.conference = division.split('-')[0]
+
+    def __repr__(self):
+        return "<TeamRecord %s>" % self.abbr
+
+    def __unicode__(self):
+        return self.name
+
+    def __str__(self):
+        return self.name.encode('utf-8')
+
+    @property
+    def pk(self):
+        return self.abbr
+
+class TeamRegistry(object):
+    """
+    TeamRecords by abbreviation and by division.
+    """
+
+    def __init__(self, teams):
+        self.by_abbr = {}
+        self.by_division = {}
+        for team in teams:
+            record = TeamRecord(team.abbr, team.name, team.division_id)
+            self.by_abbr[record.abbr] = record
+            self.by_division.setdefault(record.division, []).append(record)
+
+    def __len__(self):
+        return len(self.by_abbr)
+
+    def get(self, abbr, default=None):
+        return self.by_abbr.get(abbr, default)
 
 class Week(TimestampMixin):
+    CACHE_NAMESPACE = 'weeks'
+
     primary_key = models.CharField(primary_key=True, max_length=7,
         editable=False, blank=True, unique=True, auto_created=True)
     season = models.ForeignKey(Season, related_name="weeks")
@@ -139,24 +437,97 @@ class Week(TimestampMixin):
 
     class Meta(object):
         ordering = ['number']
+        unique_together = ('season', 'number')
 
     def __unicode__(self):
         return u"Week %s" % self.number
 
     def save(self, **kwargs):
-        self.primary_key = "%s-%s" % (self.season.pk, self.number)
+        self.primary_key = "%s-%s" % (self.season_id, self.number)
         super(Week, self).save(**kwargs)
 
     @classmethod
+    def season_namespace(cls, season_key):
+        return "%s-weeks" % season_key
+
+    @classmethod
+    def invalidate_season(cls, season_key):
+        utils.bump_version(cls.season_namespace(season_key))
+        utils.bump_version(cls.CACHE_NAMESPACE)
+
+    @classmethod
+    @stats.track_queries('Week.season_weeks')
     def season_weeks(cls, season):
-        return cls.objects.filter(season=season)
+        return cls.season_index(season).weeks
+
+    @classmethod
+    def season_index(cls, season):
+        """
+        Returns the WeekIndex for a season (or season key), rebuilding it
+        when the season's cache namespace has changed or WEEK_TTL says
+        the cached weeks should be looked at again. Seasons that don't
+        exist get an empty index and nothing is cached for them.
+        """
+        season_key = force_unicode(getattr(season, 'pk', season))
+        if season_key not in cls.season_keys():
+            _week_indexes.pop(season_key, None)
+            return EMPTY_WEEK_INDEX
+        namespace = cls.season_namespace(season_key)
+        version = utils.get_version(namespace)
+        cached = _week_indexes.get(season_key)
+        if cached is None or cached[0] != version or cached[1] <= time.time():
+            qs = cls.objects.filter(season=season_key)
+            weeks = utils.get_or_add_qs(namespace, qs, namespace=namespace,
+                                        lock=True, ttl=WEEK_TTL)
+            expires = time.time() + WEEK_TTL(weeks)
+            cached = _week_indexes[season_key] = (version, expires, WeekIndex(weeks))
+        return cached[2]
+
+    @classmethod
+    def season_keys(cls):
+        """
+        Returns the set of season keys, kept until a season or week changes.
+        """
+        version = utils.get_version(cls.CACHE_NAMESPACE)
+        cached = _season_keys.get(None)
+        if cached is None or cached[0] != version:
+            qs = Season.objects.values_list('pk', flat=True)
+            keys = utils.get_or_add_qs('season_keys', qs, namespace=cls.CACHE_NAMESPACE,
+                                       lock=True, timeout=utils.MAX_TIMEOUT)
+            cached = _season_keys[None] = (version, frozenset(force_unicode(key) for key in keys))
+        return cached[1]
 
     @classmethod
+    def active_index(cls):
+        """
+        Returns the WeekIndex for the active season. It's swapped for the
+        new season's index in one step when the active season changes.
+        """
+        version = utils.get_version(cls.CACHE_NAMESPACE)
+        cached = _active_seasons.get(None)
+        if cached is None or cached[0] != version:
+            qs = Season.objects.filter(is_active=True).values_list('pk', flat=True)
+            seasons = utils.get_or_add_qs('active_season', qs, namespace=cls.CACHE_NAMESPACE,
+                                          lock=True, timeout=utils.MAX_TIMEOUT)
+            cached = _active_seasons[None] = (version, seasons[0] if seasons else None)
+        if cached[1] is None:
+            return EMPTY_WEEK_INDEX
+        return cls.season_index(cached[1])
+
+    @classmethod
+    @stats.track_queries('Week.active_weeks')
     def active_weeks(cls):
-        qs = cls.objects.filter(season__is_active=True)
-        return utils.get_or_add_qs('active_weeks', qs, timeout=2.6*1e6)
+        return cls.active_index().weeks
 
     @classmethod
+    def get_week(cls, season, number):
+        """
+        Returns the season's week by number (or None) without a query.
+        """
+        return cls.season_index(season).by_number.get(int(number))
+
+    @classmethod
+    @stats.track_queries('Week.current_week')
     def current_week(cls, week_key=None, date_trigger="first_game", delay=False):
         """
         Returns current week based on current time. Currently makes a
@@ -172,21 +543,108 @@ class Week(TimestampMixin):
         delay the week returned so you show last week results longer.
         """
         if week_key:
-            return cls.objects.get(pk=week_key)
+            week_key = force_unicode(week_key)
+            week = cls.season_index(week_key.split('-')[0]).by_pk.get(week_key)
+            if week is None:
+                raise cls.DoesNotExist("Week matching key %r does not exist." % week_key)
+            return week
         return cls._find_current_week(date_trigger, delay)
 
     @classmethod
     def _find_current_week(cls, date_trigger, delay):
         assert date_trigger in ("first_game", "last_game")
-        current_time = tz.get_current_time()
+        current_time = tz.get_current_time(tz.UTC)
+        return cls.week_boundaries(date_trigger).find(current_time, delay)
 
-        current_week = None
-        season_weeks = cls.active_weeks()
-        for cnt, week in enumerate(season_weeks):
-            current_week = season_weeks[cnt - 1] if delay and cnt > 0 else week
-            if current_time < getattr(week, date_trigger).replace(tzinfo=tz.EASTERN):
-                break
-        return current_week
+    @classmethod
+    def week_boundaries(cls, date_trigger):
+        """
+        Returns the WeekBoundaries for the active weeks, rebuilding it only
+        when the active WeekIndex has been rebuilt.
+        """
+        index = cls.active_index()
+        cached = _week_boundaries.get(date_trigger)
+        if cached is None or cached[0] is not index:
+            cached = (index, WeekBoundaries(index.weeks, date_trigger))
+            _week_boundaries[date_trigger] = cached
+        return cached[1]
+
+# Changes are handled by the cache namespaces, these only make sure cached
+# weeks and schedules are looked at again when the season moves on: a
+# season's weeks at the end of the next week still to finish, and a week's
+# schedule at the next kickoff. Both are kept for utils.MAX_TIMEOUT once
+# they're in the past.
+WEEK_TTL = utils.expire_at_next('last_game')
+SCHEDULE_TTL = utils.expire_at_next('game_time')
+
+# date_trigger -> (active WeekIndex it was built from, WeekBoundaries)
+_week_boundaries = {}
+
+# season key -> (season cache version, expiry time, WeekIndex)
+_week_indexes = {}
+
+# None -> (weeks cache version, active season key or None)
+_active_seasons = {}
+
+# None -> (weeks cache version, frozenset of season keys)
+_season_keys = {}
+
+class WeekIndex(object):
+    """
+    A season's weeks in order, by primary key and by number.
+    """
+
+    def __init__(self, weeks):
+        self.weeks = list(weeks)
+        self.by_pk = dict((week.pk, week) for week in self.weeks)
+        self.by_number = dict((week.number, week) for week in self.weeks)
+
+EMPTY_WEEK_INDEX = WeekIndex([])
+
+class WeekBoundaries(object):
+    """
+    The UTC instants at which the current week moves on, so finding the
+    current week is a bisect instead of a walk through every week.
+
+    The last week found is remembered along with the instants it's good
+    between, so most lookups don't need the bisect either.
+    """
+
+    def __init__(self, weeks, date_trigger):
+        self.weeks = list(weeks)
+        self.instants = []
+        dates = [getattr(week, date_trigger) for week in self.weeks]
+        for instant in tz.convert_many(dates, tz.EASTERN, tz.UTC):
+            # weeks are checked in order, so an out of order date can't
+            # move the boundary back.
+            if self.instants and instant < self.instants[-1]:
+                instant = self.instants[-1]
+            self.instants.append(instant)
+        self._found = {}
+
+    def find(self, current_time, delay=False):
+        """
+        Returns the first week whose date_trigger is still after current_time
+        (or the last week), or the one before it when delay is set.
+        """
+        found = self._found.get(delay)
+        if found is not None:
+            start, end, week = found
+            if (start is None or start <= current_time) and (end is None or current_time < end):
+                return week
+
+        if not self.weeks:
+            return None
+        position = bisect.bisect_right(self.instants, current_time)
+        index = min(position, len(self.weeks) - 1)
+        if delay and index > 0:
+            index -= 1
+
+        start = self.instants[position - 1] if position > 0 else None
+        end = self.instants[position] if position < len(self.instants) else None
+        week = self.weeks[index]
+        self._found[delay] = (start, end, week)
+        return week
 
 
 class Game(TimestampMixin):
@@ -204,29 +662,64 @@ class Game(TimestampMixin):
 
     class Meta(object):
         ordering = ['game_time']
+        # sql/game.sql adds an index on (week, game_time) for week_schedule
+        unique_together = ('week', 'number')
 
     def __unicode__(self):
         return "%s vs. %s" % (self.home_id, self.away_id)
     
     def save(self, **kwargs):
-        self.primary_key = "%s-%s" % (self.week.pk, self.number)
+        self.primary_key = "%s-%s" % (self.week_id, self.number)
         super(Game, self).save(**kwargs)
 
     @classmethod
+    def schedule_namespace(cls, week_key):
+        return "%s-schedule" % week_key
+
+    @classmethod
+    def repack_picks(cls, week_key):
+        """
+        Packs the week's winner and pick sheets again after its schedule
+        changed, so they're scored against the games as they are now.
+        The schedule is read from the database since its cache namespace
+        may not have been bumped yet.
+        """
+        schedule = dict((g.number, g) for g in cls.objects.filter(week=week_key))
+        if Winner.repack_week(week_key, schedule):
+            utils.bump_version(Winner.week_namespace(week_key))
+        PickSheet.repack_week(week_key, schedule)
+
+    @classmethod
+    @stats.track_queries('Game.week_schedule')
     def week_schedule(cls, week):
-        cache_key = "%s-schedule" % week.pk
+        cache_key = cls.schedule_namespace(week.pk)
         qs = cls.objects.filter(week=week)
-        return utils.get_or_add_qs(cache_key, qs)
+        return utils.get_or_add_qs(cache_key, qs, namespace=cache_key, lock=True, ttl=SCHEDULE_TTL)
 
 class Winner(GamesMixin):
-    week = models.ForeignKey(Week, related_name='winners')
+    week = models.ForeignKey(Week, related_name='winners', unique=True)
 
-    class Meta(object):
-        ordering = ['week__number']
-        
     def __unicode__(self):
         return unicode(self.week)
 
+    @classmethod
+    def week_namespace(cls, week_key):
+        return "%s-winner" % week_key
+
+class PickSheet(GamesMixin):
+    """
+    One pool entrant's picks for a week. The entrant is whatever identifies
+    them in the pool (a username, email address, etc...)
+    """
+    entrant = models.CharField(max_length=75, db_index=True)
+    week = models.ForeignKey(Week, related_name='pick_sheets')
+
+    class Meta(object):
+        unique_together = ('entrant', 'week')
+
+    def __unicode__(self):
+        return u"%s (%s)" % (self.entrant, self.week)
+
 class TeamResult(ResultMixin):
     """
     Stores team result by week on a running total basis.
@@ -234,6 +727,171 @@ class TeamResult(ResultMixin):
     team = models.ForeignKey(Team)
     week = models.ForeignKey(Week, related_name="team_results")
 
+    class Meta(object):
+        unique_together = ('team', 'week')
+
     def __unicode__(self):
         return "%s (%s - %s)" % (self.team_id, self.total_wins, self.total_losses)
-    
\ No newline at end of file
+
+    @classmethod
+    def standings_namespace(cls, season_key, division_key):
+        return "%s-%s-standings" % (season_key, division_key)
+
+    @classmethod
+    def results_namespace(cls, season_key):
+        return "%s-results" % season_key
+
+    @classmethod
+    def invalidate_standings(cls, season_key, team_keys=None):
+        """
+        Invalidates the season's results, and its standings for the
+        divisions of the teams given (every division when there aren't any).
+        """
+        utils.bump_version(cls.results_namespace(season_key))
+        teams = Team.registry()
+        if team_keys is None:
+            division_keys = teams.by_division.keys()
+        else:
+            division_keys = set(teams.by_abbr[k].division for k in team_keys if k in teams.by_abbr)
+        for division_key in division_keys:
+            utils.bump_version(cls.standings_namespace(season_key, division_key))
+
+    @classmethod
+    def record_winner(cls, winner):
+        """
+        Brings the week's results in line with the winner's picks and carries
+        any change in the running totals forward to the rest of the season.
+        Only teams whose result for the week changed are touched, and rows
+        that change the same way are updated together.
+        """
+        week = Week.objects.get(pk=winner.week_id)
+        outcomes = cls._week_outcomes(week, winner)
+        existing = dict((r.team_id, r) for r in cls.objects.filter(week=week))
+        now = datetime.datetime.now()
+
+        week_changes, total_changes, new_teams = {}, {}, []
+        for team_key, (wins, losses) in outcomes.items():
+            result = existing.get(team_key)
+            if result is None:
+                if wins or losses:
+                    new_teams.append(team_key)
+                    total_changes.setdefault((wins, losses), []).append(team_key)
+                continue
+            change = (wins - result.wins, losses - result.losses)
+            if change != (0, 0):
+                week_changes.setdefault((wins, losses) + change, []).append(team_key)
+                total_changes.setdefault(change, []).append(team_key)
+
+        for (wins, losses, win_change, loss_change), teams in week_changes.items():
+            cls.objects.filter(week=week, team__in=teams).update(
+                wins=wins, losses=losses, updated_time=now,
+                total_wins=models.F('total_wins') + win_change,
+                total_losses=models.F('total_losses') + loss_change)
+
+        if new_teams:
+            cls._create_results(week, new_teams, outcomes)
+
+        later_weeks = cls.objects.filter(week__season=week.season_id, week__number__gt=week.number)
+        for (win_change, loss_change), teams in total_changes.items():
+            later_weeks.filter(team__in=teams).update(
+                updated_time=now,
+                total_wins=models.F('total_wins') + win_change,
+                total_losses=models.F('total_losses') + loss_change)
+
+        changed_teams = [team for teams in total_changes.values() for team in teams]
+        if changed_teams:
+            cls.invalidate_standings(week.season_id, changed_teams)
+
+    @classmethod
+    def _week_outcomes(cls, week, winner):
+        """
+        Returns {team key: (wins, losses)} for every team on the schedule.
+        """
+        outcomes = {}
+        for game in Game.week_schedule(week):
+            home, away = outcomes.get(game.home_id, (0, 0)), outcomes.get(game.away_id, (0, 0))
+            picked = getattr(winner, 'game%s' % game.number)
+            if picked == game.home_id:
+                home, away = (home[0] + 1, home[1]), (away[0], away[1] + 1)
+            elif picked == game.away_id:
+                home, away = (home[0], home[1] + 1), (away[0] + 1, away[1])
+            outcomes[game.home_id], outcomes[game.away_id] = home, away
+        return outcomes
+
+    @classmethod
+    def _create_results(cls, week, teams, outcomes):
+        """
+        Adds rows for teams without a result for the week yet, starting
+        from their totals as of the latest earlier week.
+        """
+        totals = {}
+        earlier = cls.objects.filter(team__in=teams, week__season=week.season_id,
+                                     week__number__lt=week.number).order_by('week__number')
+        for team_key, total_wins, total_losses in earlier.values_list('team', 'total_wins', 'total_losses'):
+            totals[team_key] = (total_wins, total_losses)
+
+        results = []
+        for team_key in teams:
+            wins, losses = outcomes[team_key]
+            total_wins, total_losses = totals.get(team_key, (0, 0))
+            results.append(cls(team_id=team_key, week=week, wins=wins, losses=losses,
+                               total_wins=total_wins + wins, total_losses=total_losses + losses))
+        utils.bulk_create(cls, results)
+
+
+# Cached lookups are stored under versioned namespaces. Saving or deleting
+# anything they were built from moves the namespace to a new version, so
+# only the affected keys are rebuilt and long timeouts stay safe. Raw saves
+# (fixture loading) are skipped since the cache may not be set up yet. Code
+# saving inside a transaction should wrap it in utils.deferred_bumps() so the
+# bumps happen after the commit (the admin views do this).
+@receiver(post_save, sender=Team, dispatch_uid='nfl-invalidate-team')
+@receiver(post_delete, sender=Team, dispatch_uid='nfl-invalidate-team')
+def invalidate_teams(sender, raw=False, **kwargs):
+    if not raw:
+        utils.bump_version(Team.CACHE_NAMESPACE)
+
+@receiver(post_save, sender=Season, dispatch_uid='nfl-invalidate-season')
+@receiver(post_delete, sender=Season, dispatch_uid='nfl-invalidate-season')
+def invalidate_season(sender, instance, raw=False, **kwargs):
+    if not raw:
+        Week.invalidate_season(instance.pk)
+
+@receiver(post_save, sender=Week, dispatch_uid='nfl-invalidate-week')
+@receiver(post_delete, sender=Week, dispatch_uid='nfl-invalidate-week')
+def invalidate_weeks(sender, instance, raw=False, **kwargs):
+    if not raw:
+        Week.invalidate_season(instance.season_id)
+
+@receiver(post_save, sender=Game, dispatch_uid='nfl-invalidate-game')
+@receiver(post_delete, sender=Game, dispatch_uid='nfl-invalidate-game')
+def invalidate_schedule(sender, instance, raw=False, **kwargs):
+    if not raw:
+        utils.bump_version(Game.schedule_namespace(instance.week_id))
+        # head to head and division records come from the schedule
+        TeamResult.invalidate_standings(instance.week_id.split('-')[0])
+        Game.repack_picks(instance.week_id)
+
+@receiver(post_save, sender=TeamResult, dispatch_uid='nfl-invalidate-team-result')
+@receiver(post_delete, sender=TeamResult, dispatch_uid='nfl-invalidate-team-result')
+def invalidate_standings(sender, instance, raw=False, **kwargs):
+    if not raw:
+        TeamResult.invalidate_standings(instance.week_id.split('-')[0], [instance.team_id])
+
+@receiver(post_save, sender=Winner, dispatch_uid='nfl-invalidate-winner')
+@receiver(post_delete, sender=Winner, dispatch_uid='nfl-invalidate-winner')
+def invalidate_winner(sender, instance, raw=False, **kwargs):
+    if not raw:
+        utils.bump_version(Winner.week_namespace(instance.week_id))
+
+@receiver(post_save, sender=Winner, dispatch_uid='nfl-record-winner')
+def record_winner(sender, instance, raw=False, **kwargs):
+    if not raw:
+        TeamResult.record_winner(instance)
+
+@receiver(post_delete, sender=Winner, dispatch_uid='nfl-remove-winner')
+def remove_winner(sender, instance, **kwargs):
+    # recording a winner without any picks takes the week's results back
+    # out, unless the week is being deleted along with them.
+    if Week.objects.filter(pk=instance.week_id).exists():
+        TeamResult.record_winner(Winner(week_id=instance.week_id))
@@ -0,0 +1,181 @@
+"""
+Takes pool pick sheets in bulk. Every sheet is checked against the cached
+schedule for its week, without building a form per sheet, and the valid
+ones are written in chunks in one transaction. Sheets that are already
+there for an entrant and week are updated in place.
+
+Two formats are understood, both with the same fields:
+
+json: an array of objects, eg.
+    [{"entrant": "jim", "week": "2011-1", "game1": "GB", "game2": "ATL", ...}]
+csv: a header row of entrant,week,game1,...,game16 then a line per sheet.
+
+Games can be left out or blank. Problems with a sheet don't stop the
+others from being saved, they're returned along with the number saved.
+"""
+import csv
+import datetime
+
+from django.db import connections, router, transaction
+from django.utils.encoding import force_unicode
+
+from nfl import importer, models, utils
+
+CHUNK_SIZE = 500
+ENTRANT_MAX_LENGTH = models.PickSheet._meta.get_field('entrant').max_length
+
+GAME_FIELDS = ['game%s' % number for number in range(1, models.GamesMixin.GAME_COUNT + 1)]
+PICK_SHEET_FIELDS = (['entrant', 'week'] + GAME_FIELDS +
+                     ['home_mask', 'filled_mask', 'created_time', 'updated_time'])
+
+class PickSheetError(Exception):
+    pass
+
+def iter_json_sheets(stream):
+    """
+    Yields (row number, fields) for each object in a JSON array.
+    """
+    try:
+        for number, obj in enumerate(importer.iter_json_objects(stream), 1):
+            yield number, obj
+    except importer.ScheduleImportError as e:
+        raise PickSheetError(str(e))
+
+def iter_csv_sheets(stream):
+    """
+    Yields (line number, fields) for each line after the header.
+    """
+    reader = csv.DictReader(stream)
+    if reader.fieldnames is None or not set(['entrant', 'week']) <= set(reader.fieldnames):
+        raise PickSheetError("The header row needs entrant and week columns.")
+    for row in reader:
+        yield reader.line_num, row
+
+class PickSheetWriter(object):
+    """
+    Validates pick sheets and writes them a week at a time. Sheets are
+    kept by (entrant, week), so the last one in the file wins.
+    """
+
+    def __init__(self, chunk_size=CHUNK_SIZE):
+        self.chunk_size = chunk_size
+        self.sheets = {}
+        self.errors = []
+        self.saved = 0
+        self._schedules = {}
+
+    def get_schedule(self, week_key):
+        """
+        Returns the week's games by number, or None for an unknown week.
+        """
+        if week_key not in self._schedules:
+            try:
+                week = models.Week.current_week(week_key)
+            except models.Week.DoesNotExist:
+                schedule = None
+            else:
+                schedule = dict((g.number, g) for g in models.Game.week_schedule(week))
+            self._schedules[week_key] = schedule
+        return self._schedules[week_key]
+
+    def add(self, number, fields):
+        entrant = force_unicode(fields.get('entrant') or '').strip()
+        week_key = force_unicode(fields.get('week') or '').strip()
+        errors = self.validate(entrant, week_key, fields)
+        if errors:
+            self.errors.append({'row': number, 'entrant': entrant, 'week': week_key, 'errors': errors})
+            return
+
+        schedule = self._schedules[week_key]
+        picks = dict((n, force_unicode(fields.get('game%s' % n) or '').strip().upper())
+                     for n in range(1, models.GamesMixin.GAME_COUNT + 1))
+        self.sheets[(entrant, week_key)] = (picks, models.GamesMixin.pack(picks, schedule))
+
+    def validate(self, entrant, week_key, fields):
+        errors = []
+        if not entrant:
+            errors.append("An entrant is required.")
+        elif len(entrant) > ENTRANT_MAX_LENGTH:
+            errors.append("The entrant can't be more than %s characters." % ENTRANT_MAX_LENGTH)
+
+        if not week_key:
+            errors.append("A week is required.")
+            return errors
+        schedule = self.get_schedule(week_key)
+        if schedule is None:
+            errors.append("There's no week %s." % week_key)
+            return errors
+
+        for n in range(1, models.GamesMixin.GAME_COUNT + 1):
+            team_key = force_unicode(fields.get('game%s' % n) or '').strip().upper()
+            if not team_key:
+                continue
+            game = schedule.get(n)
+            if game is None:
+                errors.append("There's no game %s in week %s." % (n, week_key))
+            elif team_key not in (game.home_id, game.away_id):
+                errors.append("%s isn't playing in game %s (%s)." % (team_key, n, game))
+        return errors
+
+    def write(self):
+        sheets_by_week = {}
+        for (entrant, week_key), sheet in self.sheets.items():
+            sheets_by_week.setdefault(week_key, []).append((entrant, sheet))
+        for week_key, sheets in sorted(sheets_by_week.items()):
+            sheets.sort()
+            for start in range(0, len(sheets), self.chunk_size):
+                self.write_chunk(week_key, sheets[start:start + self.chunk_size])
+
+    def write_chunk(self, week_key, sheets):
+        """
+        Updates the sheets already there for the entrants in place, so they
+        keep their primary key and the time they were first created, and
+        inserts the rest. Sheets with the same picks are updated together.
+        """
+        existing = models.PickSheet.objects.filter(week=week_key, entrant__in=[e for e, s in sheets])
+        pks = dict(existing.values_list('entrant', 'pk'))
+
+        connection = connections[router.db_for_write(models.PickSheet)]
+        now = datetime.datetime.now()
+        db_now = connection.ops.value_to_db_datetime(now)
+        numbers = range(1, models.GamesMixin.GAME_COUNT + 1)
+        pks_by_picks = {}
+        rows = []
+        for entrant, (picks, masks) in sheets:
+            game_picks = tuple(picks[n] for n in numbers)
+            if entrant in pks:
+                pks_by_picks.setdefault((game_picks, masks), []).append(pks[entrant])
+            else:
+                rows.append([entrant, week_key] + list(game_picks) + list(masks) + [db_now, db_now])
+
+        for (game_picks, (home_mask, filled_mask)), chunk in pks_by_picks.items():
+            values = dict(zip(GAME_FIELDS, game_picks))
+            models.PickSheet.objects.filter(pk__in=chunk).update(
+                home_mask=home_mask, filled_mask=filled_mask, updated_time=now, **values)
+        utils.insert_rows(models.PickSheet, PICK_SHEET_FIELDS, rows, self.chunk_size)
+        self.saved += len(sheets)
+
+def submit_pick_sheets(stream, format='json', chunk_size=CHUNK_SIZE):
+    """
+    Saves the pick sheets in a file like object and returns (number saved,
+    errors), with an error for each sheet that wasn't saved:
+        {'row': 3, 'entrant': u'jim', 'week': u'2011-1', 'errors': [...]}
+    """
+    if format == 'json':
+        sheets = iter_json_sheets(stream)
+    elif format == 'csv':
+        sheets = iter_csv_sheets(stream)
+    else:
+        raise PickSheetError("Unknown pick sheet format: %r" % format)
+
+    writer = PickSheetWriter(chunk_size)
+    for number, fields in sheets:
+        if not isinstance(fields, dict):
+            raise PickSheetError("Pick sheet %s isn't an object." % number)
+        writer.add(number, fields)
+    _write(writer)
+    return writer.saved, writer.errors
+
+@transaction.commit_on_success
+def _write(writer):
+    writer.write()
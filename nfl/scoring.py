@@ -0,0 +1,135 @@
+"""
+Scores pool pick sheets against the weekly winners in bulk.
+
+Picks and winners are compared as the packed masks GamesMixin keeps
+(home_mask/filled_mask), so a week's score for a sheet is a couple of
+integer operations. With NumPy installed every sheet for a week or a
+whole season is scored in one vectorized pass; without it the same
+arithmetic runs in a plain python loop.
+
+A game counts once its winner has been entered. Games on a bye week
+that aren't played never have a winner, so they don't count, and a
+game without a pick counts as a loss.
+"""
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from nfl import models
+
+# number of bits set in every possible 16 bit mask
+if numpy is not None:
+    BIT_COUNTS = numpy.array([bin(i).count('1') for i in range(1 << 16)], dtype=numpy.int16)
+
+class ScoreTable(object):
+    """
+    Wins and losses by entrant (rows) and week (columns), along with the
+    running totals through each week.
+    """
+
+    def __init__(self, entrants, weeks, wins, losses):
+        self.entrants = entrants
+        self.weeks = weeks
+        self.wins = wins
+        self.losses = losses
+        self.total_wins = _running_totals(wins)
+        self.total_losses = _running_totals(losses)
+        self._rows = dict((entrant, row) for row, entrant in enumerate(entrants))
+
+    def for_entrant(self, entrant):
+        """
+        Returns [(week, wins, losses, total_wins, total_losses), ...]
+        """
+        row = self._rows[entrant]
+        return [(week, int(self.wins[row][col]), int(self.losses[row][col]),
+                 int(self.total_wins[row][col]), int(self.total_losses[row][col]))
+                for col, week in enumerate(self.weeks)]
+
+def _running_totals(matrix):
+    if numpy is not None and isinstance(matrix, numpy.ndarray):
+        return matrix.cumsum(axis=1)
+    totals = []
+    for row in matrix:
+        total, running = 0, []
+        for value in row:
+            total += value
+            running.append(total)
+        totals.append(running)
+    return totals
+
+def _bit_count(mask):
+    return bin(mask).count('1')
+
+def score_arrays(rows, cols, home_masks, filled_masks,
+                 winner_homes, winner_filled, shape):
+    """
+    Scores flat arrays of picks (one item per pick sheet) where rows and
+    cols say which entrant and week each sheet is for, against per week
+    winner masks. Returns (wins, losses) matrices of the given shape.
+    """
+    if numpy is not None:
+        rows = numpy.asarray(rows, dtype=numpy.intp)
+        cols = numpy.asarray(cols, dtype=numpy.intp)
+        winner_homes = numpy.asarray(winner_homes, dtype=numpy.int64)
+        winner_filled = numpy.asarray(winner_filled, dtype=numpy.int64)
+
+        decided = BIT_COUNTS[winner_filled & 0xFFFF][cols]
+        agree = ~(numpy.asarray(home_masks, dtype=numpy.int64) ^ winner_homes[cols])
+        agree &= numpy.asarray(filled_masks, dtype=numpy.int64) & winner_filled[cols] & 0xFFFF
+
+        wins = numpy.zeros(shape, dtype=numpy.int16)
+        losses = numpy.zeros(shape, dtype=numpy.int16)
+        wins[rows, cols] = BIT_COUNTS[agree]
+        losses[rows, cols] = decided - wins[rows, cols]
+        return wins, losses
+
+    wins = [[0] * shape[1] for row in range(shape[0])]
+    losses = [[0] * shape[1] for row in range(shape[0])]
+    for row, col, home_mask, filled_mask in zip(rows, cols, home_masks, filled_masks):
+        won = models.GamesMixin.matching_picks(home_mask, filled_mask,
+                                               winner_homes[col], winner_filled[col])
+        wins[row][col] = won
+        losses[row][col] = _bit_count(winner_filled[col] & 0xFFFF) - won
+    return wins, losses
+
+def score_weeks(weeks, pick_sheets=None, entrant_field='entrant'):
+    """
+    Scores every pick sheet for the weeks given. pick_sheets can be a
+    queryset of any GamesMixin model with an entrant field and a week
+    foreign key (PickSheet by default).
+    """
+    weeks = list(weeks)
+    if pick_sheets is None:
+        pick_sheets = models.PickSheet.objects.all()
+    cols = dict((week.pk, col) for col, week in enumerate(weeks))
+
+    winner_homes = [0] * len(weeks)
+    winner_filled = [0] * len(weeks)
+    winners = models.Winner.objects.filter(week__in=cols.keys())
+    for week_key, home_mask, filled_mask in winners.values_list('week', 'home_mask', 'filled_mask'):
+        winner_homes[cols[week_key]] = home_mask
+        winner_filled[cols[week_key]] = filled_mask
+
+    entrants, entrant_rows = [], {}
+    sheet_rows, sheet_cols, home_masks, filled_masks = [], [], [], []
+    sheets = pick_sheets.filter(week__in=cols.keys()).order_by(entrant_field)
+    for entrant, week_key, home_mask, filled_mask in sheets.values_list(
+            entrant_field, 'week', 'home_mask', 'filled_mask'):
+        if entrant not in entrant_rows:
+            entrant_rows[entrant] = len(entrants)
+            entrants.append(entrant)
+        sheet_rows.append(entrant_rows[entrant])
+        sheet_cols.append(cols[week_key])
+        home_masks.append(home_mask)
+        filled_masks.append(filled_mask)
+
+    wins, losses = score_arrays(sheet_rows, sheet_cols, home_masks, filled_masks,
+                                winner_homes, winner_filled, (len(entrants), len(weeks)))
+    return ScoreTable(entrants, weeks, wins, losses)
+
+def score_week(week, pick_sheets=None, entrant_field='entrant'):
+    return score_weeks([week], pick_sheets, entrant_field)
+
+def score_season(season, pick_sheets=None, entrant_field='entrant'):
+    return score_weeks(models.Week.season_weeks(season), pick_sheets, entrant_field)
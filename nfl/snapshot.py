@@ -0,0 +1,411 @@
+"""
+A read only snapshot of the active season in a compact binary file, so a
+new worker can serve teams, weeks and schedules without going to the
+database or the cache backend first.
+
+export_snapshot() (or the export_snapshot command) writes the active
+season's divisions, teams, weeks, games and team results. Workers open it
+with mmap, so every process on the host shares the same pages, and only
+decode the records they're asked for. Set NFL_SNAPSHOT to the file's path
+and use the accessors here in place of the model lookups they mirror:
+
+    snapshot.all_teams()         Team.all_teams()
+    snapshot.active_weeks()      Week.active_weeks()
+    snapshot.week_schedule(week) Game.week_schedule(week)
+    snapshot.week_results(week)  TeamResult rows for the week
+
+Each one falls back to the model lookup when there's no snapshot, when
+it's not of the active season or older than the latest updated_time in
+the database, or when the cache namespace it covers has been bumped since
+the snapshot was exported (which catches deletes too). The file and the
+namespace versions are checked again every CHECK_INTERVAL seconds rather
+than on every call.
+
+File layout (little endian): a header, the string table, then fixed size
+namespace version, division, team, week, game and result records. Strings are stored once and
+referred to by number, times are microseconds since 1970 (naive, the
+way they're stored). Games (in game_time order) and results (by team)
+are written a week at a time, and each week record has the range of its
+games and of its results.
+"""
+import datetime
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.db.models import Max
+
+from nfl import models, utils
+
+MAGIC = 'NFLSNAP2'
+
+HEADER = struct.Struct('<8sqIIIIIII')
+STRING_OFFSET = struct.Struct('<I')
+VERSION = struct.Struct('<Hq')
+DIVISION = struct.Struct('<HHHq')
+TEAM = struct.Struct('<HHHq')
+WEEK = struct.Struct('<HBqqqIIII')
+GAME = struct.Struct('<BHHq?q')
+RESULT = struct.Struct('<Hhhhhq')
+
+EPOCH = datetime.datetime(1970, 1, 1)
+
+# How often, in seconds, a worker checks the file and the namespace
+# versions again. The same as the process local cache's TIMEOUT, which
+# is how long a worker can already go without seeing a bump.
+CHECK_INTERVAL = utils.local_cache.timeout if utils.local_cache is not None else 5
+
+class SnapshotError(Exception):
+    pass
+
+def _encode_time(dt):
+    delta = dt.replace(tzinfo=None) - EPOCH
+    return (delta.days * 86400 + delta.seconds) * 1000000 + delta.microseconds
+
+def _decode_time(value):
+    return EPOCH + datetime.timedelta(microseconds=value)
+
+def latest_update(season_key):
+    """
+    The latest updated_time of anything that goes into the season's
+    snapshot, according to the database.
+    """
+    times = [
+        models.Season.objects.aggregate(latest=Max('updated_time'))['latest'],
+        models.Division.objects.aggregate(latest=Max('updated_time'))['latest'],
+        models.Team.objects.aggregate(latest=Max('updated_time'))['latest'],
+        models.Week.objects.filter(season=season_key).aggregate(latest=Max('updated_time'))['latest'],
+        models.Game.objects.filter(week__season=season_key).aggregate(latest=Max('updated_time'))['latest'],
+        models.TeamResult.objects.filter(week__season=season_key).aggregate(latest=Max('updated_time'))['latest'],
+    ]
+    times = [t for t in times if t is not None]
+    return max(times) if times else EPOCH
+
+def season_namespaces(season_key, week_keys):
+    """
+    The cache namespaces whose data goes into the season's snapshot.
+    """
+    namespaces = [models.Team.CACHE_NAMESPACE, models.Week.CACHE_NAMESPACE,
+                  models.TeamResult.results_namespace(season_key)]
+    namespaces.extend(models.Game.schedule_namespace(week_key) for week_key in week_keys)
+    return namespaces
+
+class StringTable(object):
+
+    def __init__(self):
+        self.strings = []
+        self.numbers = {}
+
+    def add(self, value):
+        value = unicode(value)
+        if value not in self.numbers:
+            if len(self.strings) > 0xFFFF:
+                raise SnapshotError("Too many strings for a snapshot.")
+            self.numbers[value] = len(self.strings)
+            self.strings.append(value)
+        return self.numbers[value]
+
+    def pack(self):
+        data = [s.encode('utf-8') for s in self.strings]
+        offsets, position = [], 0
+        for value in data:
+            offsets.append(STRING_OFFSET.pack(position))
+            position += len(value)
+        offsets.append(STRING_OFFSET.pack(position))
+        return ''.join(offsets) + ''.join(data)
+
+def export_snapshot(path, season=None):
+    """
+    Writes the season's snapshot (the active season by default) to path,
+    replacing the file in one step so workers never open half of one.
+    Returns the number of records written by kind.
+    """
+    if season is None:
+        season = models.Season.active_season()
+    season_key = getattr(season, 'pk', season)
+    updated = latest_update(season_key)
+
+    strings = StringTable()
+    strings.add(season_key)
+    # read before the data, so a change made while exporting shows up
+    # as a bumped namespace
+    week_keys = models.Week.objects.filter(season=season_key).values_list('pk', flat=True)
+    versions = [VERSION.pack(strings.add(namespace), utils.get_version(namespace))
+                for namespace in season_namespaces(season_key, week_keys)]
+    divisions = [DIVISION.pack(strings.add(d.pk), strings.add(d.conference), strings.add(d.region),
+                               _encode_time(d.updated_time))
+                 for d in models.Division.objects.order_by('pk')]
+    teams = [TEAM.pack(strings.add(t.abbr), strings.add(t.name), strings.add(t.division_id),
+                       _encode_time(t.updated_time))
+             for t in models.Team.objects.filter(is_active=True)]
+
+    games_by_week, results_by_week = {}, {}
+    for game in models.Game.objects.filter(week__season=season_key).order_by('game_time'):
+        games_by_week.setdefault(game.week_id, []).append(game)
+    for result in models.TeamResult.objects.filter(week__season=season_key).order_by('team'):
+        results_by_week.setdefault(result.week_id, []).append(result)
+
+    weeks, games, results = [], [], []
+    for week in models.Week.objects.filter(season=season_key).order_by('number'):
+        week_games = games_by_week.get(week.pk, [])
+        week_results = results_by_week.get(week.pk, [])
+        weeks.append(WEEK.pack(strings.add(week.pk), week.number, _encode_time(week.first_game),
+                               _encode_time(week.last_game), _encode_time(week.updated_time),
+                               len(games), len(week_games), len(results), len(week_results)))
+        for game in week_games:
+            games.append(GAME.pack(game.number, strings.add(game.home_id), strings.add(game.away_id),
+                                   _encode_time(game.game_time), game.is_active, _encode_time(game.updated_time)))
+        for result in week_results:
+            results.append(RESULT.pack(strings.add(result.team_id), result.wins, result.losses,
+                                       result.total_wins, result.total_losses, _encode_time(result.updated_time)))
+
+    string_data = strings.pack()
+    header = HEADER.pack(MAGIC, _encode_time(updated), len(strings.strings), len(versions), len(divisions),
+                         len(teams), len(weeks), len(games), len(results))
+
+    directory = os.path.dirname(os.path.abspath(path))
+    handle, temp_path = tempfile.mkstemp(prefix='.nfl-snapshot-', dir=directory)
+    try:
+        with os.fdopen(handle, 'wb') as stream:
+            stream.write(header)
+            stream.write(string_data)
+            for records in (versions, divisions, teams, weeks, games, results):
+                stream.write(''.join(records))
+        os.rename(temp_path, path)
+    except Exception:
+        os.remove(temp_path)
+        raise
+    return {'divisions': len(divisions), 'teams': len(teams), 'weeks': len(weeks),
+            'games': len(games), 'results': len(results)}
+
+class Snapshot(object):
+    """
+    A snapshot file mapped into memory. Records are decoded into unsaved
+    model instances the first time they're asked for.
+    """
+
+    def __init__(self, path):
+        with open(path, 'rb') as stream:
+            self._map = mmap.mmap(stream.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self._map) < HEADER.size or self._map[:len(MAGIC)] != MAGIC:
+            self.close()
+            raise SnapshotError("%s isn't a snapshot file." % path)
+
+        (magic, updated, string_count, version_count, division_count, team_count,
+         week_count, game_count, result_count) = HEADER.unpack_from(self._map)
+        self.updated_time = _decode_time(updated)
+
+        self._string_offsets = HEADER.size
+        self._string_data = self._string_offsets + STRING_OFFSET.size * (string_count + 1)
+        self.season_key = self.string(0)
+
+        string_size = STRING_OFFSET.unpack_from(self._map, self._string_data - STRING_OFFSET.size)[0]
+        position = self._string_data + string_size
+        self._tables = {}
+        for name, record, count in (('versions', VERSION, version_count),
+                                    ('divisions', DIVISION, division_count), ('teams', TEAM, team_count),
+                                    ('weeks', WEEK, week_count), ('games', GAME, game_count),
+                                    ('results', RESULT, result_count)):
+            self._tables[name] = (position, record, count)
+            position += record.size * count
+        if position > len(self._map):
+            self.close()
+            raise SnapshotError("%s is cut short." % path)
+        self._decoded = {}
+        self._lock = threading.RLock()
+        # the cache namespace versions when the snapshot was exported
+        self.versions = dict((self.string(namespace), version)
+                             for namespace, version in self._records('versions'))
+
+    def close(self):
+        self._map.close()
+
+    def string(self, number):
+        start, end = struct.unpack_from('<II', self._map, self._string_offsets + STRING_OFFSET.size * number)
+        return self._map[self._string_data + start:self._string_data + end].decode('utf-8')
+
+    def _records(self, name, start=0, stop=None):
+        position, record, count = self._tables[name]
+        stop = count if stop is None else stop
+        for index in range(start, stop):
+            yield record.unpack_from(self._map, position + record.size * index)
+
+    def _decode(self, key, build):
+        with self._lock:
+            if key not in self._decoded:
+                self._decoded[key] = list(build())
+            return self._decoded[key]
+
+    def divisions(self):
+        def build():
+            for key, conference, region, updated in self._records('divisions'):
+                yield models.Division(primary_key=self.string(key), conference=self.string(conference),
+                                      region=self.string(region), updated_time=_decode_time(updated))
+        return self._decode('divisions', build)
+
+    def all_teams(self):
+        def build():
+            for abbr, name, division, updated in self._records('teams'):
+                yield models.Team(abbr=self.string(abbr), name=self.string(name),
+                                  division_id=self.string(division), is_active=True,
+                                  updated_time=_decode_time(updated))
+        return self._decode('teams', build)
+
+    def _week_records(self):
+        return self._decode('week_records', lambda: self._records('weeks'))
+
+    def active_weeks(self):
+        def build():
+            for record in self._week_records():
+                key, number, first_game, last_game, updated = record[:5]
+                yield models.Week(primary_key=self.string(key), season_id=self.season_key, number=number,
+                                  first_game=_decode_time(first_game), last_game=_decode_time(last_game),
+                                  updated_time=_decode_time(updated))
+        return self._decode('weeks', build)
+
+    def _week_ranges(self):
+        """
+        {week key: (first game, game count, first result, result count)}
+        """
+        with self._lock:
+            if 'week_ranges' not in self._decoded:
+                self._decoded['week_ranges'] = dict((self.string(record[0]), record[5:])
+                                                    for record in self._week_records())
+            return self._decoded['week_ranges']
+
+    def week_schedule(self, week_key):
+        """
+        Returns the week's games in game_time order, or None when the week
+        isn't in the snapshot.
+        """
+        ranges = self._week_ranges().get(week_key)
+        if ranges is None:
+            return None
+        first, count = ranges[:2]
+
+        def build():
+            for number, home, away, game_time, is_active, updated in self._records('games', first, first + count):
+                yield models.Game(primary_key="%s-%s" % (week_key, number), week_id=week_key, number=number,
+                                  home_id=self.string(home), away_id=self.string(away),
+                                  game_time=_decode_time(game_time), is_active=is_active,
+                                  updated_time=_decode_time(updated))
+        return self._decode(('schedule', week_key), build)
+
+    def week_results(self, week_key):
+        """
+        Returns the week's team results by team, or None when the week
+        isn't in the snapshot.
+        """
+        ranges = self._week_ranges().get(week_key)
+        if ranges is None:
+            return None
+        first, count = ranges[2:]
+
+        def build():
+            for team, wins, losses, total_wins, total_losses, updated in self._records('results', first, first + count):
+                yield models.TeamResult(team_id=self.string(team), week_id=week_key, wins=wins, losses=losses,
+                                        total_wins=total_wins, total_losses=total_losses,
+                                        updated_time=_decode_time(updated))
+        return self._decode(('results', week_key), build)
+
+def load(path):
+    """
+    Opens the snapshot at path, or returns None when there isn't one,
+    it can't be read, it isn't of the active season or it's older than
+    the database.
+    """
+    try:
+        opened = Snapshot(path)
+    except (IOError, OSError, ValueError, SnapshotError, struct.error):
+        return None
+    active = list(models.Season.objects.filter(is_active=True).values_list('pk', flat=True))
+    if active != [opened.season_key] or opened.updated_time < latest_update(opened.season_key):
+        opened.close()
+        return None
+    return opened
+
+class LoadedSnapshot(object):
+    """
+    The snapshot along with whether each namespace still has the version
+    it was exported with. A namespace bumped since then means the
+    snapshot's copy of that data is out of date. The versions are read
+    again at most every CHECK_INTERVAL seconds.
+    """
+
+    def __init__(self, snapshot):
+        self.snapshot = snapshot
+        self._checked = {}
+
+    def get(self, namespace):
+        """
+        Returns the snapshot when the namespace hasn't changed, else None.
+        """
+        if self.snapshot is None or namespace not in self.snapshot.versions:
+            return None
+        now = time.time()
+        checked = self._checked.get(namespace)
+        if checked is None or now - checked[0] >= CHECK_INTERVAL:
+            current = utils.get_version(namespace) == self.snapshot.versions[namespace]
+            checked = self._checked[namespace] = (now, current)
+        return self.snapshot if checked[1] else None
+
+# path -> (time checked, file modification time, LoadedSnapshot)
+_snapshots = {}
+_snapshots_lock = threading.Lock()
+
+def get_snapshot(namespace):
+    """
+    Returns the NFL_SNAPSHOT snapshot if it can answer for the namespace,
+    opening it again when the file has been replaced.
+    """
+    path = getattr(settings, 'NFL_SNAPSHOT', None)
+    if not path:
+        return None
+    now = time.time()
+    with _snapshots_lock:
+        cached = _snapshots.get(path)
+        if cached is None or now - cached[0] >= CHECK_INTERVAL:
+            try:
+                modified = os.stat(path).st_mtime
+            except OSError:
+                modified = None
+            if cached is not None and cached[1] == modified:
+                loaded = cached[2]
+            elif modified is None:
+                loaded = LoadedSnapshot(None)
+            else:
+                # the old map is left for the garbage collector, another
+                # thread may still be reading it
+                loaded = LoadedSnapshot(load(path))
+            cached = _snapshots[path] = (now, modified, loaded)
+    return cached[2].get(namespace)
+
+def all_teams():
+    snapshot = get_snapshot(models.Team.CACHE_NAMESPACE)
+    if snapshot is None:
+        return models.Team.all_teams()
+    return snapshot.all_teams()
+
+def active_weeks():
+    snapshot = get_snapshot(models.Week.CACHE_NAMESPACE)
+    if snapshot is None:
+        return models.Week.active_weeks()
+    return snapshot.active_weeks()
+
+def week_schedule(week):
+    snapshot = get_snapshot(models.Game.schedule_namespace(week.pk))
+    schedule = snapshot.week_schedule(week.pk) if snapshot is not None else None
+    if schedule is None:
+        return models.Game.week_schedule(week)
+    return schedule
+
+def week_results(week):
+    snapshot = get_snapshot(models.TeamResult.results_namespace(week.pk.split('-')[0]))
+    results = snapshot.week_results(week.pk) if snapshot is not None else None
+    if results is None:
+        return list(models.TeamResult.objects.filter(week=week).order_by('team'))
+    return results
@@ -0,0 +1,3 @@
+-- A week's games in game_time order (Game.week_schedule). Django only
+-- creates single column indexes, so this one is added here.
+CREATE INDEX nfl_game_week_id_game_time ON nfl_game (week_id, game_time);
@@ -0,0 +1,3 @@
+-- Ranking a week's results (ResultQuerySet.leaderboard) compares each row
+-- with the week's other rows, which this index answers on its own.
+CREATE INDEX nfl_teamresult_week_id_totals ON nfl_teamresult (week_id, total_wins, total_losses);
@@ -0,0 +1,22 @@
+-- Brings a database created before the picks were packed into masks and
+-- the access path indexes were declared up to date. syncdb only creates
+-- missing tables, so run this by hand once, then fill in the masks with
+--     python manage.py pack_games nfl.Winner
+--
+-- It's written for sqlite and postgresql. On mysql make the mask columns
+-- "integer UNSIGNED NOT NULL DEFAULT 0". Creating the unique indexes
+-- fails if there are duplicate rows already, remove those first.
+-- (This isn't named after a model, so syncdb never runs it.)
+
+ALTER TABLE nfl_winner ADD COLUMN home_mask integer NOT NULL DEFAULT 0;
+ALTER TABLE nfl_winner ADD COLUMN filled_mask integer NOT NULL DEFAULT 0;
+
+CREATE UNIQUE INDEX nfl_week_season_id_number ON nfl_week (season_id, number);
+CREATE UNIQUE INDEX nfl_game_week_id_number ON nfl_game (week_id, number);
+CREATE UNIQUE INDEX nfl_winner_week_id_unique ON nfl_winner (week_id);
+CREATE UNIQUE INDEX nfl_teamresult_team_id_week_id ON nfl_teamresult (team_id, week_id);
+CREATE INDEX nfl_season_is_active ON nfl_season (is_active);
+
+-- the same as sql/game.sql and sql/teamresult.sql for new tables
+CREATE INDEX nfl_game_week_id_game_time ON nfl_game (week_id, game_time);
+CREATE INDEX nfl_teamresult_week_id_totals ON nfl_teamresult (week_id, total_wins, total_losses);
@@ -0,0 +1,168 @@
+"""
+Division and conference standings as of any week of a season.
+
+Overall records come from the running totals in TeamResult. Head to head
+and division records are worked out from the schedule (Game) and the
+weekly winners (Winner). Teams are ordered by win percentage, then by
+wins less losses (so 2-0 is ahead of 1-0 and 0-0 ahead of 0-1), and teams
+still level are ordered by:
+
+  1. their record in games between the tied teams (head to head)
+  2. their record against their own division
+  3. team abbreviation, so the order is always the same
+
+Each division's table is cached per week under a namespace for the
+season and division, so a new result only rebuilds the tables of the
+divisions whose teams it changed (see TeamResult.invalidate_standings).
+Conference tables are put together from the division tables.
+"""
+from django.utils.encoding import force_unicode
+
+from nfl import models, utils
+
+class Standing(object):
+    """
+    A team's record as of a week, along with what's needed to break ties.
+    head_to_head is {opponent key: (wins, losses)}.
+    """
+
+    def __init__(self, team_key, division_key, wins=0, losses=0):
+        self.team_key = team_key
+        self.division_key = division_key
+        self.wins = wins
+        self.losses = losses
+        self.division_wins = 0
+        self.division_losses = 0
+        self.head_to_head = {}
+        self.rank = None
+
+    def __repr__(self):
+        return "<Standing %s %s-%s>" % (self.team_key, self.wins, self.losses)
+
+    @property
+    def win_percent(self):
+        return _percent(self.wins, self.losses)
+
+    @property
+    def division_percent(self):
+        return _percent(self.division_wins, self.division_losses)
+
+    def record_against(self, team_keys):
+        wins = losses = 0
+        for team_key in team_keys:
+            team_wins, team_losses = self.head_to_head.get(team_key, (0, 0))
+            wins += team_wins
+            losses += team_losses
+        return wins, losses
+
+def _percent(wins, losses):
+    games = wins + losses
+    if games > 0:
+        return float(wins) / games * 100
+    return 0.0
+
+def rank(standings):
+    """
+    Sorts standings best first, breaking ties as described above, and
+    numbers them from 1.
+    """
+    tied = {}
+    for standing in standings:
+        record = (standing.win_percent, standing.wins - standing.losses)
+        tied.setdefault(record, []).append(standing)
+
+    ordered = []
+    for record in sorted(tied, reverse=True):
+        group = tied[record]
+        opponents = [s.team_key for s in group]
+        group.sort(key=lambda s: (-_percent(*s.record_against(opponents)),
+                                  -s.division_percent, s.team_key))
+        ordered.extend(group)
+
+    for number, standing in enumerate(ordered, 1):
+        standing.rank = number
+    return ordered
+
+def _get_week(week):
+    if isinstance(week, models.Week):
+        return week
+    return models.Week.current_week(force_unicode(week))
+
+def _division_teams():
+    return dict((division_key, [team.abbr for team in teams])
+                for division_key, teams in models.Team.registry().by_division.items())
+
+def _build_division(week, division_key, team_keys):
+    """
+    Returns the division's standings as of the week, best first.
+    """
+    standings = dict((key, Standing(key, division_key)) for key in team_keys)
+
+    results = models.TeamResult.objects.filter(team__in=team_keys, week__season=week.season_id,
+                                               week__number__lte=week.number).order_by('week__number')
+    for team_key, total_wins, total_losses in results.values_list('team', 'total_wins', 'total_losses'):
+        standings[team_key].wins, standings[team_key].losses = total_wins, total_losses
+
+    weeks = dict((w.pk, w) for w in models.Week.season_weeks(week.season_id) if w.number <= week.number)
+    for winner in models.Winner.objects.filter(week__in=weeks.keys()):
+        for game in models.Game.week_schedule(weeks[winner.week_id]):
+            picked = getattr(winner, 'game%s' % game.number)
+            if not picked:
+                continue
+            lost = game.away_id if picked == game.home_id else game.home_id
+            _add_result(standings, picked, lost, won=True)
+            _add_result(standings, lost, picked, won=False)
+
+    return rank(standings.values())
+
+def _add_result(standings, team_key, opponent_key, won):
+    standing = standings.get(team_key)
+    if standing is None:
+        return
+    wins, losses = standing.head_to_head.get(opponent_key, (0, 0))
+    standing.head_to_head[opponent_key] = (wins + 1, losses) if won else (wins, losses + 1)
+    if opponent_key in standings:
+        if won:
+            standing.division_wins += 1
+        else:
+            standing.division_losses += 1
+
+def division_standings(week, division):
+    """
+    Returns the division's standings as of the week (a Week or week key),
+    best first.
+    """
+    week = _get_week(week)
+    division_key = force_unicode(getattr(division, 'pk', division))
+    team_keys = _division_teams().get(division_key, [])
+    namespace = models.TeamResult.standings_namespace(week.season_id, division_key)
+    key = "%s-%s-standings" % (week.pk, division_key)
+    return utils.get_or_add(key, lambda: _build_division(week, division_key, team_keys),
+                            namespace=namespace, lock=True)
+
+def conference_standings(week, conference):
+    """
+    Returns the conference's standings as of the week, best first.
+    """
+    week = _get_week(week)
+    standings = []
+    for division_key in sorted(_division_teams()):
+        if division_key.startswith("%s-" % conference):
+            standings.extend(division_standings(week, division_key))
+    return rank([_copy(s) for s in standings])
+
+def week_standings(week):
+    """
+    Returns {division key: standings} for every division as of the week.
+    """
+    week = _get_week(week)
+    return dict((division_key, division_standings(week, division_key))
+                for division_key in _division_teams())
+
+def _copy(standing):
+    # the division tables are cached (and may be shared in process), so
+    # they're ranked again as copies
+    copy = Standing(standing.team_key, standing.division_key, standing.wins, standing.losses)
+    copy.division_wins, copy.division_losses = standing.division_wins, standing.division_losses
+    copy.head_to_head = standing.head_to_head
+    return copy
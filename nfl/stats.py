@@ -0,0 +1,154 @@
+"""
+Opt in instrumentation for the nfl cached lookups.
+
+Turn it on with NFL_STATS = True in settings. It then counts, per key
+family ('all_teams', 'active_season', '*-weeks', '*-schedule', ...), how often
+utils.get_or_add_qs is called, how often it has to evaluate the
+queryset and how long that takes, along with how many queries the nfl
+lookup classmethods run. When it's off the only cost is checking the
+`enabled` flag.
+
+Stats are added up for the whole process in `totals`, and for a block
+of code or a request with collect() or StatsMiddleware:
+
+    with stats.collect() as request_stats:
+        ...
+    request_stats.as_dict()
+"""
+import logging
+import re
+import threading
+from functools import wraps
+
+from django.conf import settings
+from django.db import connection
+from django.utils import simplejson
+
+enabled = getattr(settings, 'NFL_STATS', False)
+
+logger = logging.getLogger('nfl.stats')
+
+SEASON_PREFIX = re.compile(r'^\d{4}(-\d+)?-')
+
+class Stats(object):
+
+    def __init__(self):
+        self.families = {}
+        self.queries = {}
+
+    def _family(self, key):
+        family = key_family(key)
+        if family not in self.families:
+            self.families[family] = {'calls': 0, 'misses': 0, 'recompute_seconds': 0.0}
+        return self.families[family]
+
+    def record_call(self, key):
+        self._family(key)['calls'] += 1
+
+    def record_miss(self, key, seconds):
+        family = self._family(key)
+        family['misses'] += 1
+        family['recompute_seconds'] += seconds
+
+    def record_queries(self, name, count):
+        calls, queries = self.queries.get(name, (0, 0))
+        self.queries[name] = (calls + 1, queries + count)
+
+    def as_dict(self):
+        families = {}
+        for name, family in self.families.items():
+            families[name] = dict(family, hits=family['calls'] - family['misses'])
+        queries = dict((name, {'calls': calls, 'queries': count})
+                       for name, (calls, count) in self.queries.items())
+        return {'cache': families, 'queries': queries}
+
+def key_family(key):
+    """
+    Keys for a season or week ('2011-weeks', '2011-1-schedule') are
+    grouped together ('*-weeks', '*-schedule').
+    """
+    return SEASON_PREFIX.sub('*-', key)
+
+totals = Stats()
+_local = threading.local()
+
+def _collectors():
+    current = getattr(_local, 'stats', None)
+    if current is None:
+        return (totals,)
+    return (totals, current)
+
+def record_call(key):
+    for collector in _collectors():
+        collector.record_call(key)
+
+def record_miss(key, seconds):
+    for collector in _collectors():
+        collector.record_miss(key, seconds)
+
+def track_queries(name):
+    """
+    Counts the queries run by the decorated function. Counts include
+    the queries of any tracked function it calls.
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if not enabled or getattr(_local, 'stats', None) is None:
+                return func(*args, **kwargs)
+            start = len(connection.queries)
+            try:
+                return func(*args, **kwargs)
+            finally:
+                count = len(connection.queries) - start
+                for collector in _collectors():
+                    collector.record_queries(name, count)
+        return wrapper
+    return decorator
+
+def start():
+    """
+    Starts collecting stats for this thread. Queries are only recorded
+    by django while collecting (or when DEBUG is on).
+    """
+    _local.stats = Stats()
+    _local.debug_cursor = connection.use_debug_cursor
+    connection.use_debug_cursor = True
+    return _local.stats
+
+def finish():
+    stats = getattr(_local, 'stats', None)
+    _local.stats = None
+    connection.use_debug_cursor = getattr(_local, 'debug_cursor', None)
+    return stats
+
+class collect(object):
+    """
+    Context manager that collects the stats of the code inside it.
+    Collects nothing (and gives None) when instrumentation is off.
+    """
+
+    def __enter__(self):
+        if enabled:
+            return start()
+
+    def __exit__(self, *exc_info):
+        if enabled:
+            finish()
+
+class StatsMiddleware(object):
+    """
+    Logs the stats for each request to the 'nfl.stats' logger.
+    """
+
+    def process_request(self, request):
+        if enabled:
+            start()
+
+    def process_response(self, request, response):
+        if enabled:
+            stats = finish()
+            if stats is not None:
+                logger.info("%s %s %s", request.method, request.path,
+                            simplejson.dumps(stats.as_dict(), sort_keys=True))
+        return response
@@ -1,12 +1,33 @@
 
+import collections
 import datetime
-
+import gc
+import hashlib
+import os
+import shutil
+import socket
+import tempfile
+import threading
+import time
+from StringIO import StringIO
+
+from django import forms as django_forms
 from django.core.exceptions import ValidationError
+from django.conf import settings
 from django.core.cache import get_cache, cache
-from django.test import TestCase
+from django.contrib.auth.models import Permission, User
+from django.core.management import call_command
+from django.db import connection, reset_queries, transaction
+from django.db.models.signals import post_save
+from django.forms.models import modelform_factory
+from django.http import HttpResponse
+from django.test import TestCase, TransactionTestCase
+from django.test.client import RequestFactory
+from django.utils import simplejson
 
 from nfl import models, tz
-from nfl import utils
+from nfl import admin as nfl_admin
+from nfl import feed, forms, generator, importer, picks, scoring, snapshot, standings, stats, utils
 
 class SeasonModelTests(TestCase):
 
@@ -48,6 +69,37 @@ class SeasonModelTests(TestCase):
         active_season = models.Season.active_season()
         self.assertEqual(season, active_season)
 
+class SeasonTransactionTests(TransactionTestCase):
+
+    def test_save_leaves_callers_transaction_to_the_caller(self):
+        @transaction.commit_on_success
+        def create():
+            division = models.Division.objects.get(pk="AFC-East")
+            models.Team.objects.create(abbr="XYZ", name="Fake Team", division=division)
+            models.Season.objects.create(year="2011", is_active=True)
+            raise ValueError("roll it back")
+
+        with self.assertRaises(ValueError):
+            create()
+        self.assertFalse(models.Team.objects.filter(pk="XYZ").exists())
+        self.assertFalse(models.Season.objects.exists())
+
+    def test_save_commits_on_its_own_outside_a_transaction(self):
+        models.Season.objects.create(year="2010", is_active=True)
+        models.Season.objects.create(year="2011", is_active=True)
+        transaction.rollback_unless_managed()
+        self.assertEqual(["2011"], list(models.Season.objects.filter(is_active=True).values_list('pk', flat=True)))
+
+    def test_failed_import_leaves_nothing_behind(self):
+        stream = StringIO("season,week,number,away,home,game_time\n"
+                          "2012,1,1,DAL,NYG,2012-09-05 20:30\n"
+                          "2012,1,2,IND,CHI,not a time\n")
+        with self.assertRaises(importer.ScheduleImportError):
+            importer.import_schedule(stream, 'csv', chunk_size=1)
+        self.assertFalse(models.Game.objects.exists())
+        self.assertFalse(models.Week.objects.exists())
+        self.assertFalse(models.Season.objects.exists())
+
 class DivisionModelTests(TestCase):
 
     def test_uses_conference_and_region_as_pk(self):
@@ -73,6 +125,13 @@ class TeamModelTests(TestCase):
         all_teams_count = len(models.Team.all_teams())
         self.assertEqual(32, all_teams_count)
 
+    def test_all_teams_is_rebuilt_when_team_changes(self):
+        models.Team.all_teams()
+        team = models.Team.objects.get(pk="BUF")
+        team.is_active = False
+        team.save()
+        self.assertEqual(31, len(models.Team.all_teams()))
+
 class WeekModelTests(TestCase):
 
     def test_gets_season_weeks(self):
@@ -95,6 +154,17 @@ class WeekModelTests(TestCase):
         weeks = models.Week.active_weeks()
         self.assertEqual([current_week], list(weeks))
 
+    def test_active_weeks_is_rebuilt_when_active_season_changes(self):
+        old_season = models.Season.objects.create(year="2010", is_active=True)
+        today = datetime.datetime.today()
+        old_week = models.Week.objects.create(number=1, season=old_season, first_game=today, last_game=today)
+        self.assertEqual([old_week], list(models.Week.active_weeks()))
+
+        season = models.Season.objects.create(year="2011", is_active=True)
+        self.assertEqual([], list(models.Week.active_weeks()))
+        week = models.Week.objects.create(number=1, season=season, first_game=today, last_game=today)
+        self.assertEqual([week], list(models.Week.active_weeks()))
+
     def test_uses_season_key_and_number_as_primary_key(self):
         today = datetime.datetime.today()
         season = models.Season.objects.create(year="2011")
@@ -191,6 +261,148 @@ class WeekModelTests(TestCase):
         current_week = models.Week.current_week(delay=True)
         self.assertEqual(week, current_week)
 
+    def test_returns_second_to_last_week_when_delayed_after_all_weeks(self):
+        season = models.Season.objects.create(year="2011", is_active=True)
+        today = tz.get_current_time()
+        two_weeks_ago = today - datetime.timedelta(days=14)
+        last_week = today - datetime.timedelta(days=7)
+
+        week = models.Week.objects.create(number=1, first_game=two_weeks_ago, last_game=two_weeks_ago, season=season)
+        models.Week.objects.create(number=2, first_game=last_week, last_game=last_week, season=season)
+
+        current_week = models.Week.current_week(delay=True)
+        self.assertEqual(week, current_week)
+
+    def test_current_week_is_none_without_active_weeks(self):
+        self.assertEqual(None, models.Week.current_week())
+
+    def test_current_week_sees_weeks_added_after_lookup(self):
+        season = models.Season.objects.create(year="2011", is_active=True)
+        today = tz.get_current_time()
+        yesterday = today - datetime.timedelta(days=1)
+        next_week = today + datetime.timedelta(days=7)
+
+        models.Week.objects.create(number=1, first_game=yesterday, last_game=yesterday, season=season)
+        models.Week.current_week()
+        week = models.Week.objects.create(number=2, first_game=next_week, last_game=next_week, season=season)
+        self.assertEqual(week, models.Week.current_week())
+
+class WeekIndexTests(TestCase):
+    """
+    The test settings keep the cache in the database, so these use a
+    local memory cache to count only the queries for weeks.
+    """
+
+    def setUp(self):
+        self.original_cache = utils.cache
+        utils.cache = get_cache('django.core.cache.backends.locmem.LocMemCache')
+        utils.cache.clear()
+        today = datetime.datetime.today()
+        self.old_season = models.Season.objects.create(year="2010")
+        self.season = models.Season.objects.create(year="2011", is_active=True)
+        self.old_week = models.Week.objects.create(number=3, season=self.old_season, first_game=today, last_game=today)
+        self.week = models.Week.objects.create(number=1, season=self.season, first_game=today, last_game=today)
+
+    def tearDown(self):
+        utils.cache = self.original_cache
+
+    def test_looks_up_weeks_of_any_season_without_queries(self):
+        models.Week.season_index("2010")
+        models.Week.season_index("2011")
+        with self.assertNumQueries(0):
+            self.assertEqual(self.old_week, models.Week.current_week("2010-3"))
+            self.assertEqual(self.old_week, models.Week.get_week("2010", 3))
+            self.assertEqual(self.week, models.Week.get_week(self.season, "1"))
+            self.assertEqual([self.old_week], models.Week.season_weeks(self.old_season))
+            self.assertEqual(None, models.Week.get_week("2010", 4))
+
+    def test_current_week_raises_does_not_exist_for_unknown_week_key(self):
+        with self.assertRaises(models.Week.DoesNotExist):
+            models.Week.current_week("2010-4")
+
+    def test_season_index_is_rebuilt_when_season_weeks_change(self):
+        models.Week.season_index("2010")
+        today = datetime.datetime.today()
+        week = models.Week.objects.create(number=4, season=self.old_season, first_game=today, last_game=today)
+        self.assertEqual(week, models.Week.get_week("2010", 4))
+        self.assertEqual([self.old_week, week], models.Week.season_weeks("2010"))
+
+    def test_season_index_goes_back_to_cache_when_week_ttl_expires(self):
+        index = models.Week.season_index("2011")
+        self.assertTrue(index is models.Week.season_index("2011"))
+
+        version, expires, cached = models._week_indexes["2011"]
+        models._week_indexes["2011"] = (version, time.time() - 1, cached)
+        self.assertFalse(index is models.Week.season_index("2011"))
+        self.assertFalse(index is models.Week.active_index())
+
+    def test_unknown_season_is_not_cached_or_indexed(self):
+        models.Week.season_index("2011")
+        with self.assertNumQueries(0):
+            self.assertTrue(models.Week.season_index("9999") is models.EMPTY_WEEK_INDEX)
+            with self.assertRaises(models.Week.DoesNotExist):
+                models.Week.current_week("9999-1")
+        self.assertFalse("9999" in models._week_indexes)
+        self.assertEqual(None, utils.cache.get(utils.VERSION_KEY % models.Week.season_namespace("9999")))
+
+        season = models.Season.objects.create(year="9999")
+        week = models.Week.objects.create(number=1, season=season, first_game=self.week.first_game,
+                                          last_game=self.week.last_game)
+        self.assertEqual(week, models.Week.current_week("9999-1"))
+
+    def test_switching_active_season_swaps_active_index(self):
+        self.assertEqual([self.week], models.Week.active_weeks())
+        old_index = models.Week.active_index()
+
+        self.old_season.is_active = True
+        self.old_season.save()
+        self.assertEqual([self.old_week], models.Week.active_weeks())
+        self.assertEqual(["2010"], list(models.Season.objects.filter(is_active=True).values_list('pk', flat=True)))
+        self.assertEqual([self.week], old_index.weeks)
+
+class WeekBoundariesTests(TestCase):
+
+    def setUp(self):
+        self.weeks = [
+            models.Week(number=1, first_game=datetime.datetime(2011, 9, 8, 20, 30)),
+            models.Week(number=2, first_game=datetime.datetime(2011, 9, 18, 13)),
+            models.Week(number=3, first_game=datetime.datetime(2011, 9, 25, 13)),
+        ]
+        self.boundaries = models.WeekBoundaries(self.weeks, 'first_game')
+
+    def test_stores_boundaries_as_utc_instants(self):
+        self.assertEqual(datetime.datetime(2011, 9, 9, 0, 30, tzinfo=tz.UTC), self.boundaries.instants[0])
+
+    def test_finds_first_week_starting_after_time(self):
+        current_time = datetime.datetime(2011, 9, 18, 16, 59, tzinfo=tz.UTC)
+        self.assertEqual(self.weeks[1], self.boundaries.find(current_time))
+
+        current_time = datetime.datetime(2011, 9, 18, 17, tzinfo=tz.UTC)
+        self.assertEqual(self.weeks[2], self.boundaries.find(current_time))
+
+    def test_finds_previous_week_when_delayed(self):
+        current_time = datetime.datetime(2011, 9, 10, tzinfo=tz.UTC)
+        self.assertEqual(self.weeks[0], self.boundaries.find(current_time, delay=True))
+
+        current_time = datetime.datetime(2011, 9, 1, tzinfo=tz.UTC)
+        self.assertEqual(self.weeks[0], self.boundaries.find(current_time, delay=True))
+
+    def test_returns_last_week_after_all_boundaries(self):
+        current_time = datetime.datetime(2012, 1, 1, tzinfo=tz.UTC)
+        self.assertEqual(self.weeks[2], self.boundaries.find(current_time))
+        self.assertEqual(self.weeks[1], self.boundaries.find(current_time, delay=True))
+
+    def test_reuses_found_week_until_next_boundary(self):
+        self.boundaries.find(datetime.datetime(2011, 9, 10, tzinfo=tz.UTC))
+        self.boundaries.instants = None # bisecting again would blow up
+
+        self.assertEqual(self.weeks[1], self.boundaries.find(datetime.datetime(2011, 9, 15, tzinfo=tz.UTC)))
+
+    def test_out_of_order_week_doesnt_move_boundary_back(self):
+        self.weeks[1].first_game = datetime.datetime(2011, 9, 1)
+        boundaries = models.WeekBoundaries(self.weeks, 'first_game')
+        self.assertEqual(boundaries.instants[0], boundaries.instants[1])
+
 class GameModelTests(TestCase):
 
     def setUp(self):
@@ -203,6 +415,13 @@ class GameModelTests(TestCase):
         game = models.Game.objects.create(week=self.week, number=2, game_time=self.today, home=self.team, away=self.team)
         self.assertEqual("2011-1-2", game.primary_key)
 
+    def test_doesnt_allow_two_games_with_same_number_in_week(self):
+        models.Game.objects.create(week=self.week, number=2, game_time=self.today, home=self.team, away=self.team)
+        game = models.Game(week=self.week, number=2, game_time=self.today, home=self.team, away=self.team)
+        with self.assertRaises(ValidationError) as e:
+            game.full_clean()
+        self.assertEqual(["Game with this Week and Number already exists."], e.exception.messages)
+
     def test_doesnt_allow_week_number_less_than_one(self):
         game = models.Game(week=self.week, number=0, game_time=self.today, home=self.team, away=self.team)
         with self.assertRaises(ValidationError) as e:
@@ -224,21 +443,1036 @@ class GameModelTests(TestCase):
 
         self.assertEqual([game1, game2], models.Game.week_schedule(self.week))
 
+    def test_week_schedule_is_rebuilt_when_game_changes(self):
+        game = models.Game.objects.create(week=self.week, number=1, game_time=self.today, home=self.team, away=self.team)
+        models.Game.week_schedule(self.week)
+
+        flexed_time = self.today + datetime.timedelta(hours=3)
+        game.game_time = flexed_time
+        game.save()
+        self.assertEqual(flexed_time, models.Game.week_schedule(self.week)[0].game_time)
+
+        game.delete()
+        self.assertEqual([], models.Game.week_schedule(self.week))
+
+    def test_saving_game_only_invalidates_its_own_week_schedule(self):
+        week2 = models.Week.objects.create(season=self.season, number=2, first_game=self.today, last_game=self.today)
+        week2_version = utils.get_version(models.Game.schedule_namespace(week2.pk))
+
+        models.Game.objects.create(week=self.week, number=1, game_time=self.today, home=self.team, away=self.team)
+        self.assertEqual(week2_version, utils.get_version(models.Game.schedule_namespace(week2.pk)))
+
 class GameMixinTests(TestCase):
 
     def test_get_team_returns_team_for_game_number(self):
         game_collection = models.GamesMixin(game1="BUF")
         team = game_collection.get_team(1)
-        self.assertTrue(isinstance(team, models.Team))
+        self.assertTrue(isinstance(team, models.TeamRecord))
         self.assertEqual("BUF", team.pk)
+        self.assertEqual(("Buffalo", "AFC-East", "AFC"), (team.name, team.division, team.conference))
+
+    def test_get_team_shares_team_registry_between_instances(self):
+        first, second = models.GamesMixin(game2="BUF"), models.GamesMixin(game5="BUF")
+        self.assertTrue(first.get_team(2) is second.get_team(5))
+        self.assertFalse('teams' in first.__dict__)
+
+    def test_team_registry_is_rebuilt_when_teams_change(self):
+        registry = models.Team.registry()
+        self.assertTrue(registry is models.Team.registry())
+        self.assertEqual(32, len(registry))
+
+        team = models.Team.objects.get(pk="BUF")
+        team.name = "Bills"
+        team.save()
+        self.assertEqual("Bills", models.GamesMixin(game1="BUF").get_team(1).name)
+        team.name = "Buffalo"
+        team.save()
 
-    def test_get_team_keeps_teams_dictionary_on_instance(self):
-        game_collection = models.GamesMixin(game2="BUF")
-        team_dict = dict((t.pk, t) for t in models.Team.all_teams())
+class PackedGamesTests(TestCase):
 
-        self.assertEqual(None, game_collection.teams)
-        game_collection.get_team(2)
-        self.assertEqual(team_dict, game_collection.teams)
+    def setUp(self):
+        today = datetime.datetime.now()
+        season = models.Season.objects.create(year="2011")
+        self.week = models.Week.objects.create(season=season, number=1, first_game=today, last_game=today)
+        for number, (away, home) in enumerate([("NO", "GB"), ("ATL", "CHI"), ("BUF", "KC")]):
+            models.Game.objects.create(week=self.week, number=number + 1, game_time=today, home_id=home, away_id=away)
+        self.schedule = dict((g.number, g) for g in models.Game.week_schedule(self.week))
+
+    def test_packs_home_picks_and_filled_picks_into_masks(self):
+        picks = {1: "GB", 2: "ATL", 3: "", 4: "NYJ"}
+        self.assertEqual((0x1, 0x3), models.GamesMixin.pack(picks, self.schedule))
+
+    def test_leaves_out_picks_for_teams_not_in_game(self):
+        self.assertEqual((0, 0), models.GamesMixin.pack({1: "CHI"}, self.schedule))
+
+    def test_saving_winner_packs_games(self):
+        winner = models.Winner.objects.create(week=self.week, game1="NO", game2="CHI", game3="KC")
+        self.assertEqual((0x6, 0x7), (winner.home_mask, winner.filled_mask))
+
+    def test_get_team_decodes_packed_pick(self):
+        winner = models.Winner(week=self.week, home_mask=0x2, filled_mask=0x3)
+        self.assertEqual("NO", winner.get_team(1).pk)
+        self.assertEqual("CHI", winner.get_team(2).pk)
+        self.assertEqual(None, winner.get_team(3))
+
+    def test_unpack_games_sets_game_fields(self):
+        winner = models.Winner(week=self.week, home_mask=0x4, filled_mask=0x5)
+        winner.unpack_games()
+        self.assertEqual(["NO", "", "KC"], [winner.game1, winner.game2, winner.game3])
+
+    def test_matching_picks_counts_games_both_picked_the_same(self):
+        self.assertEqual(2, models.GamesMixin.matching_picks(0x1, 0x7, 0x3, 0x5))
+        self.assertEqual(0, models.GamesMixin.matching_picks(0x1, 0x1, 0x0, 0x0))
+
+    def test_changing_schedule_repacks_winner_and_pick_sheets(self):
+        winner = models.Winner.objects.create(week=self.week, game1="GB", game2="ATL")
+        sheet = models.PickSheet.objects.create(week=self.week, entrant="jim", game1="GB", game2="CHI")
+        self.assertEqual((0x1, 0x3), (winner.home_mask, winner.filled_mask))
+
+        game = models.Game.objects.get(pk="2011-1-1")
+        game.home_id, game.away_id = "NO", "GB"
+        game.save()
+
+        winner = models.Winner.objects.get(pk=winner.pk)
+        sheet = models.PickSheet.objects.get(pk=sheet.pk)
+        self.assertEqual((0x0, 0x3), (winner.home_mask, winner.filled_mask))
+        self.assertEqual((0x2, 0x3), (sheet.home_mask, sheet.filled_mask))
+        self.assertEqual("GB", winner.get_team(1).pk)
+
+    def test_pack_games_command_fills_masks_for_existing_rows(self):
+        winner = models.Winner.objects.create(week=self.week, game1="GB", game3="BUF")
+        models.Winner.objects.update(home_mask=0, filled_mask=0)
+
+        call_command('pack_games', 'nfl.Winner', stdout=StringIO())
+        winner = models.Winner.objects.get(pk=winner.pk)
+        self.assertEqual((0x1, 0x5), (winner.home_mask, winner.filled_mask))
+
+class ScoringTests(TestCase):
+
+    def setUp(self):
+        today = datetime.datetime.now()
+        season = models.Season.objects.create(year="2011")
+        self.week1 = models.Week.objects.create(season=season, number=1, first_game=today, last_game=today)
+        self.week2 = models.Week.objects.create(season=season, number=2, first_game=today, last_game=today)
+        for number, (away, home) in enumerate([("NO", "GB"), ("ATL", "CHI"), ("BUF", "KC")]):
+            models.Game.objects.create(week=self.week1, number=number + 1, game_time=today, home_id=home, away_id=away)
+        # week 2 only has two games because of byes
+        for number, (away, home) in enumerate([("GB", "CAR"), ("CHI", "NO")]):
+            models.Game.objects.create(week=self.week2, number=number + 1, game_time=today, home_id=home, away_id=away)
+
+        models.Winner.objects.create(week=self.week1, game1="GB", game2="ATL", game3="KC")
+        models.Winner.objects.create(week=self.week2, game1="GB", game2="NO")
+
+        models.PickSheet.objects.create(entrant="aaron", week=self.week1, game1="GB", game2="CHI", game3="KC")
+        models.PickSheet.objects.create(entrant="aaron", week=self.week2, game1="GB", game2="NO")
+        models.PickSheet.objects.create(entrant="bob", week=self.week1, game1="NO", game2="ATL")
+        models.PickSheet.objects.create(entrant="bob", week=self.week2, game1="CAR")
+
+    def assert_season_scores(self):
+        table = scoring.score_season(self.week1.season)
+        self.assertEqual(["aaron", "bob"], table.entrants)
+        self.assertEqual([
+            (self.week1, 2, 1, 2, 1),
+            (self.week2, 2, 0, 4, 1),
+        ], table.for_entrant("aaron"))
+        self.assertEqual([
+            (self.week1, 1, 2, 1, 2),
+            (self.week2, 0, 2, 1, 4),
+        ], table.for_entrant("bob"))
+
+    def test_scores_season_against_winners(self):
+        self.assert_season_scores()
+
+    def test_scores_season_without_numpy(self):
+        original_numpy = scoring.numpy
+        scoring.numpy = None
+        try:
+            self.assert_season_scores()
+        finally:
+            scoring.numpy = original_numpy
+
+    def test_games_without_winner_dont_count(self):
+        models.Winner.objects.filter(week=self.week2).delete()
+        table = scoring.score_week(self.week2)
+        self.assertEqual([(self.week2, 0, 0, 0, 0)], table.for_entrant("aaron"))
+
+class TeamResultTests(TestCase):
+
+    def setUp(self):
+        today = datetime.datetime.now()
+        season = models.Season.objects.create(year="2011")
+        self.week1 = models.Week.objects.create(season=season, number=1, first_game=today, last_game=today)
+        self.week2 = models.Week.objects.create(season=season, number=2, first_game=today, last_game=today)
+        for number, (away, home) in enumerate([("NO", "GB"), ("ATL", "CHI")]):
+            models.Game.objects.create(week=self.week1, number=number + 1, game_time=today, home_id=home, away_id=away)
+        for number, (away, home) in enumerate([("GB", "NO"), ("CHI", "ATL")]):
+            models.Game.objects.create(week=self.week2, number=number + 1, game_time=today, home_id=home, away_id=away)
+
+    def get_results(self, week):
+        results = models.TeamResult.objects.filter(week=week)
+        return dict((r.team_id, (r.wins, r.losses, r.total_wins, r.total_losses)) for r in results)
+
+    def test_saving_winner_records_team_results(self):
+        models.Winner.objects.create(week=self.week1, game1="GB", game2="ATL")
+        self.assertEqual({
+            "GB": (1, 0, 1, 0), "NO": (0, 1, 0, 1),
+            "ATL": (1, 0, 1, 0), "CHI": (0, 1, 0, 1),
+        }, self.get_results(self.week1))
+
+    def test_keeps_running_totals_from_earlier_weeks(self):
+        models.Winner.objects.create(week=self.week1, game1="GB", game2="ATL")
+        models.Winner.objects.create(week=self.week2, game1="GB", game2="ATL")
+        self.assertEqual({
+            "GB": (1, 0, 2, 0), "NO": (0, 1, 0, 2),
+            "ATL": (1, 0, 2, 0), "CHI": (0, 1, 0, 2),
+        }, self.get_results(self.week2))
+
+    def test_changing_winner_carries_totals_forward(self):
+        winner = models.Winner.objects.create(week=self.week1, game1="GB", game2="ATL")
+        models.Winner.objects.create(week=self.week2, game1="GB", game2="ATL")
+
+        winner.game1 = "NO"
+        winner.save()
+        self.assertEqual((0, 1, 0, 1), self.get_results(self.week1)["GB"])
+        self.assertEqual({
+            "GB": (1, 0, 1, 1), "NO": (0, 1, 1, 1),
+            "ATL": (1, 0, 2, 0), "CHI": (0, 1, 0, 2),
+        }, self.get_results(self.week2))
+
+    def test_only_touches_teams_whose_result_changed(self):
+        winner = models.Winner.objects.create(week=self.week1, game1="GB", game2="ATL")
+        updated = dict(models.TeamResult.objects.values_list('team', 'updated_time'))
+
+        winner.game1 = "NO"
+        winner.save()
+        now_updated = dict(models.TeamResult.objects.values_list('team', 'updated_time'))
+        self.assertEqual(updated["ATL"], now_updated["ATL"])
+        self.assertNotEqual(updated["GB"], now_updated["GB"])
+
+    def test_undecided_games_dont_add_results(self):
+        models.Winner.objects.create(week=self.week1, game1="GB")
+        self.assertEqual(["GB", "NO"], sorted(self.get_results(self.week1)))
+
+    def test_deleting_winner_removes_its_results(self):
+        winner = models.Winner.objects.create(week=self.week1, game1="GB", game2="ATL")
+        models.Winner.objects.create(week=self.week2, game1="GB", game2="ATL")
+
+        winner.delete()
+        self.assertEqual((0, 0, 0, 0), self.get_results(self.week1)["GB"])
+        self.assertEqual((1, 0, 1, 0), self.get_results(self.week2)["GB"])
+
+class StandingsTests(TestCase):
+
+    def setUp(self):
+        today = datetime.datetime.now()
+        season = models.Season.objects.create(year="2011")
+        self.week1 = models.Week.objects.create(season=season, number=1, first_game=today, last_game=today)
+        self.week2 = models.Week.objects.create(season=season, number=2, first_game=today, last_game=today)
+        for number, (away, home) in enumerate([("NO", "GB"), ("ATL", "CHI")]):
+            models.Game.objects.create(week=self.week1, number=number + 1, game_time=today, home_id=home, away_id=away)
+        for number, (away, home) in enumerate([("GB", "CHI"), ("NO", "ATL")]):
+            models.Game.objects.create(week=self.week2, number=number + 1, game_time=today, home_id=home, away_id=away)
+        models.Winner.objects.create(week=self.week1, game1="GB", game2="ATL")
+
+    def get_teams(self, standings):
+        return [s.team_key for s in standings]
+
+    def test_ranks_division_by_record(self):
+        north = standings.division_standings(self.week1, "NFC-North")
+        self.assertEqual(["GB", "DET", "MIN", "CHI"], self.get_teams(north))
+        self.assertEqual([1, 2, 3, 4], [s.rank for s in north])
+        self.assertEqual((1, 0), (north[0].wins, north[0].losses))
+
+    def test_breaks_ties_head_to_head(self):
+        models.Winner.objects.create(week=self.week2, game1="CHI", game2="ATL")
+        north = standings.division_standings("2011-2", "NFC-North")
+        self.assertEqual(["CHI", "GB"], self.get_teams(north)[:2])
+        self.assertEqual((1, 0), (north[0].division_wins, north[0].division_losses))
+        self.assertEqual({"ATL": (0, 1), "GB": (1, 0)}, north[0].head_to_head)
+
+    def test_breaks_ties_by_division_record_then_abbreviation(self):
+        first = standings.Standing("AAA", "NFC-North", 1, 1)
+        second = standings.Standing("BBB", "NFC-North", 1, 1)
+        third = standings.Standing("CCC", "NFC-North", 1, 1)
+        second.division_wins = 1
+        self.assertEqual(["BBB", "AAA", "CCC"], self.get_teams(standings.rank([third, first, second])))
+
+    def test_builds_conference_from_divisions(self):
+        models.Winner.objects.create(week=self.week2, game1="CHI", game2="ATL")
+        nfc = standings.conference_standings(self.week2, "NFC")
+        self.assertEqual(["ATL", "CHI", "GB"], self.get_teams(nfc)[:3])
+        self.assertEqual(16, len(nfc))
+
+    def test_result_change_only_invalidates_affected_divisions(self):
+        namespaces = dict((key, models.TeamResult.standings_namespace("2011", key))
+                          for key in ("NFC-North", "NFC-South", "NFC-East"))
+        versions = dict((key, utils.get_version(ns)) for key, ns in namespaces.items())
+        standings.division_standings(self.week2, "NFC-North")
+
+        models.Winner.objects.create(week=self.week2, game1="GB")
+        self.assertNotEqual(versions["NFC-North"], utils.get_version(namespaces["NFC-North"]))
+        self.assertEqual(versions["NFC-South"], utils.get_version(namespaces["NFC-South"]))
+        self.assertEqual(versions["NFC-East"], utils.get_version(namespaces["NFC-East"]))
+        self.assertEqual((2, 0), (standings.division_standings(self.week2, "NFC-North")[0].wins,
+                                  standings.division_standings(self.week2, "NFC-North")[0].losses))
+
+    def test_records_match_team_results_for_generated_season(self):
+        generator.generate_data([2001])
+        table = standings.week_standings("2001-17")
+        totals = dict((r.team_id, (r.total_wins, r.total_losses))
+                      for r in models.TeamResult.objects.filter(week="2001-17"))
+        self.assertEqual(8, len(table))
+        for division in table.values():
+            for standing in division:
+                self.assertEqual(totals[standing.team_key], (standing.wins, standing.losses))
+                self.assertEqual(17, sum(w + l for w, l in standing.head_to_head.values()))
+
+class JsonViewTests(TestCase):
+    urls = 'nfl.urls'
+
+    def setUp(self):
+        self.original_cache = utils.cache
+        utils.cache = get_cache('django.core.cache.backends.locmem.LocMemCache')
+        utils.cache.clear()
+        today = datetime.datetime(2011, 9, 8, 20, 30)
+        season = models.Season.objects.create(year="2011")
+        self.week = models.Week.objects.create(season=season, number=1, first_game=today, last_game=today)
+        self.game = models.Game.objects.create(week=self.week, number=1, game_time=today, home_id="GB", away_id="NO")
+
+    def tearDown(self):
+        utils.cache = self.original_cache
+
+    def get_json(self, path):
+        response = self.client.get(path)
+        self.assertEqual('application/json', response['Content-Type'])
+        return simplejson.loads(response.content)
+
+    def test_returns_teams(self):
+        teams = self.get_json('/teams.json')
+        self.assertEqual(32, len(teams))
+        self.assertTrue({'abbr': 'GB', 'name': 'Green Bay', 'division': 'NFC-North'} in teams)
+
+    def test_returns_week_schedule(self):
+        self.assertEqual([{'number': 1, 'away': 'NO', 'home': 'GB', 'game_time': '2011-09-08T20:30:00',
+                           'is_active': True}], self.get_json('/weeks/2011-1/schedule.json'))
+
+    def test_returns_404_for_unknown_week(self):
+        response = self.client.get('/weeks/2011-2/schedule.json')
+        self.assertEqual(404, response.status_code)
+        self.assertEqual({'error': 'No week 2011-2.'}, simplejson.loads(response.content))
+
+    def test_returns_winner_and_results(self):
+        self.assertEqual({'week': '2011-1', 'games': {}}, self.get_json('/weeks/2011-1/winner.json'))
+        models.Winner.objects.create(week=self.week, game1="GB")
+
+        self.assertEqual({'week': '2011-1', 'games': {'1': 'GB'}}, self.get_json('/weeks/2011-1/winner.json'))
+        results = self.get_json('/weeks/2011-1/results.json')
+        self.assertEqual([('GB', 1, 0), ('NO', 0, 1)], [(r['team'], r['wins'], r['losses']) for r in results])
+        north = self.get_json('/weeks/2011-1/standings.json')['NFC-North']
+        self.assertEqual({'team': 'GB', 'rank': 1, 'wins': 1, 'losses': 0,
+                          'division_wins': 0, 'division_losses': 0}, north[0])
+
+    def test_sets_etag_and_last_modified(self):
+        response = self.client.get('/weeks/2011-1/schedule.json')
+        self.assertEqual('"%s"' % hashlib.md5(response.content).hexdigest(), response['ETag'])
+        self.assertTrue(response.has_header('Last-Modified'))
+
+    def test_returns_not_modified_from_cache(self):
+        etag = self.client.get('/weeks/2011-1/schedule.json')['ETag']
+        with self.assertNumQueries(0):
+            response = self.client.get('/weeks/2011-1/schedule.json', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(304, response.status_code)
+
+    def test_changes_etag_when_data_changes(self):
+        etag = self.client.get('/weeks/2011-1/schedule.json')['ETag']
+        self.game.home_id = "CHI"
+        self.game.save()
+        response = self.client.get('/weeks/2011-1/schedule.json', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(200, response.status_code)
+        self.assertNotEqual(etag, response['ETag'])
+
+    def test_only_allows_get(self):
+        self.assertEqual(405, self.client.post('/teams.json').status_code)
+
+class AdminQueryCountTests(TestCase):
+    """
+    Each changelist should make the same number of queries whatever
+    the page size.
+    """
+
+    def setUp(self):
+        generator.generate_data([2001, 2002])
+        self.user = User.objects.create_superuser('admin', 'admin@example.com', 'admin')
+
+    def count_changelist_queries(self, model, per_page):
+        model_admin = nfl_admin.admin.site._registry[model]
+        request = RequestFactory().get('/admin/nfl/%s/' % model._meta.module_name)
+        request.user = self.user
+        original_per_page = model_admin.list_per_page
+        model_admin.list_per_page = per_page
+        try:
+            model_admin.changelist_view(request) # fill the caches
+            connection.use_debug_cursor = True
+            reset_queries()
+            model_admin.changelist_view(request)
+            return len(connection.queries)
+        finally:
+            connection.use_debug_cursor = None
+            model_admin.list_per_page = original_per_page
+
+    def assertConstantQueries(self, model):
+        self.assertEqual(self.count_changelist_queries(model, 1),
+                         self.count_changelist_queries(model, 8))
+
+    def test_division_changelist(self):
+        self.assertConstantQueries(models.Division)
+
+    def test_season_changelist(self):
+        self.assertConstantQueries(models.Season)
+
+    def test_team_changelist(self):
+        self.assertConstantQueries(models.Team)
+
+    def test_week_changelist(self):
+        self.assertConstantQueries(models.Week)
+
+    def test_game_changelist(self):
+        self.assertConstantQueries(models.Game)
+
+    def test_winner_changelist(self):
+        self.assertConstantQueries(models.Winner)
+
+    def test_team_result_changelist(self):
+        self.assertConstantQueries(models.TeamResult)
+
+class AdminInvalidationTests(TestCase):
+    """
+    Saves made through the admin should bump the cache namespaces once
+    the view is done, not while its transaction is still open.
+    """
+
+    def setUp(self):
+        generator.generate_data([2011])
+        User.objects.create_superuser('admin', 'admin@example.com', 'admin')
+        self.client.login(username='admin', password='admin')
+        self.seen = []
+
+    def record_version(self, sender, **kwargs):
+        self.seen.append(utils.get_version(models.Team.CACHE_NAMESPACE))
+
+    def test_bumps_namespace_after_the_save(self):
+        team = models.Team.objects.all()[0]
+        before = utils.get_version(models.Team.CACHE_NAMESPACE)
+        post_save.connect(self.record_version, sender=models.Team)
+        try:
+            response = self.client.post('/admin/nfl/team/%s/' % team.pk, {
+                'abbr': team.pk,
+                'name': 'Renamed',
+                'division': team.division_id,
+                'is_active': 'on',
+            })
+        finally:
+            post_save.disconnect(self.record_version, sender=models.Team)
+
+        self.assertEqual(302, response.status_code)
+        self.assertEqual([before], self.seen)
+        self.assertNotEqual(before, utils.get_version(models.Team.CACHE_NAMESPACE))
+
+class ScheduleImporterTests(TestCase):
+    fixture_path = os.path.join(os.path.dirname(models.__file__), 'fixtures', '2011_games.json')
+
+    def test_reads_json_array_a_piece_at_a_time(self):
+        stream = StringIO('[{"a": 1}, {"b": [2, 3]},\n {"c": "]"}]')
+        self.assertEqual([{"a": 1}, {"b": [2, 3]}, {"c": "]"}],
+                         list(importer.iter_json_objects(stream, read_size=4)))
+
+    def test_raises_error_for_invalid_json(self):
+        with self.assertRaises(importer.ScheduleImportError):
+            list(importer.iter_json_objects(StringIO('[{"a": }]')))
+
+    def test_imports_json_fixture(self):
+        with open(self.fixture_path) as stream:
+            self.assertEqual((17, 256), importer.import_schedule(stream, chunk_size=100))
+
+        game = models.Game.objects.get(pk="2011-1-1")
+        self.assertEqual(("GB", "NO"), (game.home_id, game.away_id))
+        self.assertEqual(datetime.datetime(2011, 9, 8, 20, 30), game.game_time)
+        self.assertEqual(datetime.datetime(2011, 9, 12, 22, 15), models.Week.objects.get(pk="2011-1").last_game)
+        self.assertTrue(models.Season.objects.filter(pk="2011").exists())
+
+    def test_importing_again_replaces_existing_rows(self):
+        with open(self.fixture_path) as stream:
+            importer.import_schedule(stream)
+        with open(self.fixture_path) as stream:
+            importer.import_schedule(stream)
+        self.assertEqual(17, models.Week.objects.count())
+        self.assertEqual(256, models.Game.objects.count())
+
+    def test_imports_csv_and_works_out_weeks(self):
+        stream = StringIO("season,week,number,away,home,game_time\n"
+                          "2012,1,1,DAL,NYG,2012-09-05 20:30\n"
+                          "2012,1,2,IND,CHI,2012-09-09 13:00\n"
+                          "2012,2,1,GB,CHI,2012-09-13 20:20\n")
+        self.assertEqual((2, 3), importer.import_schedule(stream, 'csv'))
+
+        week = models.Week.objects.get(pk="2012-1")
+        self.assertEqual(datetime.datetime(2012, 9, 5, 20, 30), week.first_game)
+        self.assertEqual(datetime.datetime(2012, 9, 9, 13), week.last_game)
+        self.assertEqual(["2012-1-1", "2012-1-2"], [g.pk for g in models.Game.week_schedule(week)])
+
+    def test_partial_csv_keeps_range_of_existing_week(self):
+        with open(self.fixture_path) as stream:
+            importer.import_schedule(stream)
+
+        stream = StringIO("season,week,number,away,home,game_time\n"
+                          "2011,1,5,PHI,STL,2011-09-11 16:15\n")
+        importer.import_schedule(stream, 'csv')
+        week = models.Week.objects.get(pk="2011-1")
+        self.assertEqual((datetime.datetime(2011, 9, 8, 20, 30), datetime.datetime(2011, 9, 12, 22, 15)),
+                         (week.first_game, week.last_game))
+
+        stream = StringIO("season,week,number,away,home,game_time\n"
+                          "2011,1,1,NO,GB,2011-09-11 13:00\n")
+        importer.import_schedule(stream, 'csv')
+        week = models.Week.objects.get(pk="2011-1")
+        self.assertEqual((datetime.datetime(2011, 9, 11, 13), datetime.datetime(2011, 9, 12, 22, 15)),
+                         (week.first_game, week.last_game))
+
+    def test_invalidates_cached_schedules(self):
+        season = models.Season.objects.create(year="2011")
+        week = models.Week.objects.create(season=season, number=1, first_game=datetime.datetime.now(),
+                                          last_game=datetime.datetime.now())
+        self.assertEqual([], models.Game.week_schedule(week))
+
+        with open(self.fixture_path) as stream:
+            importer.import_schedule(stream)
+        self.assertEqual(16, len(models.Game.week_schedule(week)))
+
+    def test_invalidates_schedules_of_games_only_fixture(self):
+        with open(self.fixture_path) as stream:
+            importer.import_schedule(stream)
+        week = models.Week.objects.get(pk="2011-1")
+        self.assertEqual(("GB", "NO"), (models.Game.week_schedule(week)[0].home_id,
+                                        models.Game.week_schedule(week)[0].away_id))
+
+        stream = StringIO('[{"model": "nfl.game", "fields": {"week": "2011-1", "number": 1, "away": "GB", '
+                          '"home": "NO", "game_time": "2011-09-08 20:30:00"}}]')
+        self.assertEqual((0, 1), importer.import_schedule(stream))
+        game = models.Game.week_schedule(week)[0]
+        self.assertEqual(("NO", "GB"), (game.home_id, game.away_id))
+
+    def test_importing_games_repacks_winners(self):
+        with open(self.fixture_path) as stream:
+            importer.import_schedule(stream)
+        winner = models.Winner.objects.create(week_id="2011-1", game1="GB")
+        self.assertEqual((0x1, 0x1), (winner.home_mask, winner.filled_mask))
+
+        stream = StringIO('[{"model": "nfl.game", "fields": {"week": "2011-1", "number": 1, "away": "GB", '
+                          '"home": "NO", "game_time": "2011-09-08 20:30:00"}}]')
+        importer.import_schedule(stream)
+        winner = models.Winner.objects.get(pk=winner.pk)
+        self.assertEqual((0x0, 0x1), (winner.home_mask, winner.filled_mask))
+
+    def test_import_schedule_command(self):
+        out = StringIO()
+        call_command('import_schedule', self.fixture_path, stdout=out)
+        self.assertEqual("Imported 17 weeks and 256 games.\n", out.getvalue())
+
+class DataGeneratorTests(TestCase):
+
+    def test_generates_seasons_of_schedules_and_results(self):
+        counts = generator.generate_data([2001, 2002], entrants=3)
+        self.assertEqual({'seasons': 2, 'weeks': 34, 'games': 544, 'winners': 34,
+                          'team_results': 1088, 'pick_sheets': 51}, counts)
+
+        week = models.Week.objects.get(pk="2002-1")
+        self.assertEqual(datetime.datetime(2002, 9, 5, 20, 30), week.first_game)
+        teams = set()
+        for game in models.Game.week_schedule(week):
+            teams.update([game.home_id, game.away_id])
+        self.assertEqual(32, len(teams))
+
+        last_results = models.TeamResult.objects.filter(week="2001-17")
+        self.assertEqual([17] * 32, [r.total_wins + r.total_losses for r in last_results])
+        self.assertEqual(16 * 17, sum(r.total_wins for r in last_results))
+
+    def test_packs_winners_and_pick_sheets(self):
+        generator.generate_data([2001], entrants=2)
+        for model in (models.Winner, models.PickSheet):
+            for row in model.objects.filter(week="2001-3"):
+                self.assertEqual((row.home_mask, row.filled_mask), row.pack(row.get_picks(), row.get_schedule()))
+        self.assertEqual(["entrant000001", "entrant000002"],
+                         list(models.PickSheet.objects.filter(week="2001-3").values_list('entrant', flat=True)))
+
+    def test_same_seed_generates_same_data(self):
+        def generate():
+            generator.generate_data([2001], entrants=2, seed=5)
+            picks = list(models.PickSheet.objects.order_by('entrant', 'week').values_list('home_mask', flat=True))
+            games = list(models.Game.objects.order_by('pk').values_list('home', 'away'))
+            models.Season.objects.filter(pk="2001").delete()
+            return picks, games
+        self.assertEqual(generate(), generate())
+
+    def test_refuses_to_generate_existing_season(self):
+        models.Season.objects.create(year="2001")
+        with self.assertRaises(generator.DataGenerationError):
+            generator.generate_data([2001, 2002])
+
+    def test_generate_data_command(self):
+        out = StringIO()
+        call_command('generate_data', seasons=1, start_year=2001, entrants=1, stdout=out)
+        self.assertTrue(out.getvalue().startswith(
+            "Generated 272 games, 17 pick sheets, 1 seasons, 544 team results, 17 weeks, 17 winners in "))
+
+class PickSheetSubmissionTests(TestCase):
+    urls = 'nfl.urls'
+
+    def setUp(self):
+        today = datetime.datetime(2011, 9, 8, 20, 30)
+        season = models.Season.objects.create(year="2011")
+        self.week = models.Week.objects.create(season=season, number=1, first_game=today, last_game=today)
+        models.Game.objects.create(week=self.week, number=1, game_time=today, home_id="GB", away_id="NO")
+        models.Game.objects.create(week=self.week, number=2, game_time=today, home_id="CHI", away_id="ATL")
+
+    def test_saves_json_pick_sheets(self):
+        stream = StringIO('[{"entrant": "jim", "week": "2011-1", "game1": "gb", "game2": "ATL"},'
+                          ' {"entrant": "bob", "week": "2011-1", "game1": "NO"}]')
+        self.assertEqual((2, []), picks.submit_pick_sheets(stream))
+
+        sheet = models.PickSheet.objects.get(entrant="jim")
+        self.assertEqual(("GB", "ATL", ""), (sheet.game1, sheet.game2, sheet.game3))
+        self.assertEqual((1, 3), (sheet.home_mask, sheet.filled_mask))
+        sheet = models.PickSheet.objects.get(entrant="bob")
+        self.assertEqual(("NO", ""), (sheet.game1, sheet.game2))
+        self.assertEqual((0, 1), (sheet.home_mask, sheet.filled_mask))
+
+    def test_saves_csv_pick_sheets(self):
+        stream = StringIO("entrant,week,game1,game2\njim,2011-1,GB,CHI\nbob,2011-1,,ATL\n")
+        self.assertEqual((2, []), picks.submit_pick_sheets(stream, 'csv'))
+        self.assertEqual(["bob", "jim"], list(models.PickSheet.objects.order_by('entrant')
+                                              .values_list('entrant', flat=True)))
+
+    def test_returns_errors_for_invalid_sheets(self):
+        stream = StringIO('[{"entrant": "jim", "week": "2011-2", "game1": "GB"},'
+                          ' {"entrant": "bob", "week": "2011-1", "game1": "CHI", "game3": "GB"},'
+                          ' {"entrant": "", "week": "2011-1"},'
+                          ' {"entrant": "sue", "week": "2011-1", "game1": "GB"}]')
+        saved, errors = picks.submit_pick_sheets(stream)
+
+        self.assertEqual(1, saved)
+        self.assertEqual([1, 2, 3], [e['row'] for e in errors])
+        self.assertEqual(["There's no week 2011-2."], errors[0]['errors'])
+        self.assertEqual(["CHI isn't playing in game 1 (GB vs. NO).", "There's no game 3 in week 2011-1."],
+                         errors[1]['errors'])
+        self.assertEqual(["An entrant is required."], errors[2]['errors'])
+        self.assertEqual(["sue"], list(models.PickSheet.objects.values_list('entrant', flat=True)))
+
+    def test_replaces_existing_sheets_keeping_created_time(self):
+        created_time = datetime.datetime(2011, 9, 1, 12, 0)
+        original = models.PickSheet.objects.create(entrant="jim", week=self.week, game1="GB")
+        models.PickSheet.objects.filter(entrant="jim").update(created_time=created_time)
+
+        picks.submit_pick_sheets(StringIO('[{"entrant": "jim", "week": "2011-1", "game1": "NO"}]'))
+        sheet = models.PickSheet.objects.get(entrant="jim")
+        self.assertEqual(original.pk, sheet.pk)
+        self.assertEqual("NO", sheet.game1)
+        self.assertEqual((0, 1), (sheet.home_mask, sheet.filled_mask))
+        self.assertEqual(created_time, sheet.created_time)
+
+    def test_updates_existing_sheets_in_place_and_inserts_new_ones(self):
+        jim = models.PickSheet.objects.create(entrant="jim", week=self.week, game1="GB")
+        bob = models.PickSheet.objects.create(entrant="bob", week=self.week, game2="ATL")
+        stream = StringIO('[{"entrant": "jim", "week": "2011-1", "game1": "NO", "game2": "CHI"},'
+                          ' {"entrant": "bob", "week": "2011-1", "game1": "NO", "game2": "CHI"},'
+                          ' {"entrant": "sue", "week": "2011-1", "game1": "GB"}]')
+        self.assertEqual((3, []), picks.submit_pick_sheets(stream))
+
+        sheets = dict((s.entrant, s) for s in models.PickSheet.objects.all())
+        self.assertEqual(3, len(sheets))
+        self.assertEqual((jim.pk, bob.pk), (sheets["jim"].pk, sheets["bob"].pk))
+        for entrant in ("jim", "bob"):
+            self.assertEqual(("NO", "CHI"), (sheets[entrant].game1, sheets[entrant].game2))
+            self.assertEqual((2, 3), (sheets[entrant].home_mask, sheets[entrant].filled_mask))
+        self.assertEqual(("GB", ""), (sheets["sue"].game1, sheets["sue"].game2))
+
+    def test_raises_error_for_unreadable_file(self):
+        with self.assertRaises(picks.PickSheetError):
+            picks.submit_pick_sheets(StringIO("name,game1\njim,GB\n"), 'csv')
+        with self.assertRaises(picks.PickSheetError):
+            picks.submit_pick_sheets(StringIO('[1, 2]'))
+
+    def test_import_picks_command(self):
+        path = tempfile.mktemp(suffix='.csv')
+        with open(path, 'w') as stream:
+            stream.write("entrant,week,game1\njim,2011-1,GB\nbob,2011-1,DAL\n")
+        out, err = StringIO(), StringIO()
+        try:
+            call_command('import_picks', path, stdout=out, stderr=err)
+        finally:
+            os.remove(path)
+        self.assertEqual("Saved 1 pick sheets, 1 with errors.\n", out.getvalue())
+        self.assertEqual("Row 3 (bob, 2011-1): DAL isn't playing in game 1 (GB vs. NO).\n", err.getvalue())
+
+    def test_view_requires_permission(self):
+        User.objects.create_user('jim', 'jim@example.com', 'jim')
+        self.client.login(username='jim', password='jim')
+        response = self.client.post('/picks.json', '[]', content_type='application/json')
+        self.assertEqual(403, response.status_code)
+
+    def test_view_saves_posted_sheets(self):
+        user = User.objects.create_user('jim', 'jim@example.com', 'jim')
+        user.user_permissions.add(Permission.objects.get(codename='add_picksheet'))
+        self.client.login(username='jim', password='jim')
+
+        response = self.client.post('/picks.json', "entrant,week,game1\njim,2011-1,GB\nbob,2011-1,DAL\n",
+                                    content_type='text/csv')
+        self.assertEqual(200, response.status_code)
+        result = simplejson.loads(response.content)
+        self.assertEqual(1, result['saved'])
+        self.assertEqual([3], [e['row'] for e in result['errors']])
+
+        response = self.client.post('/picks.json', '{"entrant": ', content_type='application/json')
+        self.assertEqual(400, response.status_code)
+
+class ScoreFeedTests(TestCase):
+
+    def setUp(self):
+        self.original_cache = utils.cache
+        utils.cache = get_cache('django.core.cache.backends.locmem.LocMemCache')
+        utils.cache.clear()
+        today = datetime.datetime(2011, 9, 8, 20, 30)
+        season = models.Season.objects.create(year="2011")
+        for number in (1, 2):
+            week = models.Week.objects.create(season=season, number=number, first_game=today, last_game=today)
+            models.Game.objects.create(week=week, number=1, game_time=today, home_id="GB", away_id="NO")
+            models.Game.objects.create(week=week, number=2, game_time=today, home_id="CHI", away_id="ATL")
+
+    def tearDown(self):
+        utils.cache = self.original_cache
+
+    def lines(self, *events):
+        return StringIO("".join(simplejson.dumps(event) + "\n" for event in events))
+
+    def test_applies_game_final_events(self):
+        source = feed.FileSource(self.lines({"game": "2011-1-1", "winner": "gb"},
+                                            {"game": "2011-1-2", "winner": "ATL"}))
+        counts = feed.ingest(source, window=5)
+
+        self.assertEqual({'events': 2, 'batches': 1, 'winners': 1, 'errors': 0}, counts)
+        winner = models.Winner.objects.get(week="2011-1")
+        self.assertEqual(("GB", "ATL"), (winner.game1, winner.game2))
+        self.assertEqual((1, 3), (winner.home_mask, winner.filled_mask))
+        self.assertEqual((1, 0), models.TeamResult.objects.filter(team="GB", week="2011-1")
+                                                         .values_list('wins', 'losses')[0])
+
+    def test_last_event_for_a_game_wins(self):
+        feed.ingest(feed.FileSource(self.lines({"game": "2011-1-1", "winner": "GB"},
+                                               {"game": "2011-1-1", "winner": "NO"})), window=5)
+        self.assertEqual("NO", models.Winner.objects.get(week="2011-1").game1)
+
+    def test_bumps_each_namespace_once_per_batch(self):
+        versions = dict((n, utils.get_version(n)) for n in ("2011-results", "2011-NFC-North-standings"))
+        source = feed.FileSource(self.lines({"game": "2011-1-1", "winner": "GB"},
+                                            {"game": "2011-2-1", "winner": "GB"}))
+        self.assertEqual(1, feed.ingest(source, window=5)['batches'])
+
+        for namespace, version in versions.items():
+            self.assertEqual(version + 1, utils.get_version(namespace))
+        self.assertEqual(2, models.TeamResult.objects.get(team="GB", week="2011-2").total_wins)
+
+    def test_applies_batches_as_window_passes(self):
+        ingestor = feed.ScoreFeedIngestor(iter([]), window=0)
+        ingestor.apply_batch([simplejson.dumps({"game": "2011-1-1", "winner": "GB"})])
+        ingestor.apply_batch([simplejson.dumps({"game": "2011-1-1", "winner": ""})])
+        self.assertEqual(2, ingestor.counts['batches'])
+        self.assertEqual([(0, 0)], list(models.TeamResult.objects.filter(team="GB", week="2011-1")
+                                                                 .values_list('wins', 'losses')))
+
+    def test_counts_events_it_cant_apply(self):
+        source = feed.FileSource(self.lines({"game": "2011-3-1", "winner": "GB"},
+                                            {"game": "2011-1-1", "winner": "DAL"},
+                                            {"game": "2011-1-9", "winner": "GB"},
+                                            {"winner": "GB"}))
+        counts = feed.ingest(source, window=5)
+        self.assertEqual({'events': 4, 'batches': 1, 'winners': 0, 'errors': 4}, counts)
+        self.assertFalse(models.Winner.objects.exists())
+
+    def test_raises_error_when_source_fails(self):
+        with self.assertRaises(feed.ScoreFeedError):
+            feed.ingest(feed.FileSource('/nonexistent/scores.txt'))
+
+    def test_reads_socket_source(self):
+        server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        server.bind(('127.0.0.1', 0))
+        server.listen(1)
+
+        def send():
+            connection, address = server.accept()
+            connection.sendall(self.lines({"game": "2011-1-1", "winner": "GB"}).getvalue())
+            connection.close()
+        sender = threading.Thread(target=send)
+        sender.start()
+        try:
+            counts = feed.ingest(feed.SocketSource('127.0.0.1', server.getsockname()[1], timeout=5))
+        finally:
+            sender.join()
+            server.close()
+        self.assertEqual(1, counts['winners'])
+        self.assertEqual("GB", models.Winner.objects.get(week="2011-1").game1)
+
+    def test_ingest_scores_command(self):
+        path = tempfile.mktemp(suffix='.txt')
+        with open(path, 'w') as stream:
+            stream.write(self.lines({"game": "2011-1-1", "winner": "GB"}).getvalue())
+        out = StringIO()
+        try:
+            call_command('ingest_scores', path, window=0.1, stdout=out)
+        finally:
+            os.remove(path)
+        self.assertEqual("Applied 1 events in 1 batches, 1 winners saved, 0 errors.\n", out.getvalue())
+
+class SnapshotTests(TestCase):
+
+    def setUp(self):
+        self.original_cache = utils.cache
+        utils.cache = get_cache('django.core.cache.backends.locmem.LocMemCache')
+        utils.cache.clear()
+        generator.generate_data([2011])
+        models.Season.objects.filter(pk="2011").update(is_active=True)
+        models.Week.invalidate_season("2011")
+
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'snapshot.bin')
+        self.original_path = getattr(settings, 'NFL_SNAPSHOT', None)
+        settings.NFL_SNAPSHOT = self.path
+        snapshot._snapshots.clear()
+        self.original_interval = snapshot.CHECK_INTERVAL
+        snapshot.CHECK_INTERVAL = 0
+
+    def tearDown(self):
+        utils.cache = self.original_cache
+        settings.NFL_SNAPSHOT = self.original_path
+        snapshot._snapshots.clear()
+        snapshot.CHECK_INTERVAL = self.original_interval
+        shutil.rmtree(self.directory)
+
+    def games(self, games):
+        return [(g.pk, g.number, g.home_id, g.away_id, g.game_time, g.is_active) for g in games]
+
+    def test_exports_season_and_reads_it_back(self):
+        counts = snapshot.export_snapshot(self.path)
+        self.assertEqual({'divisions': 8, 'teams': 32, 'weeks': 17, 'games': 272, 'results': 544}, counts)
+
+        opened = snapshot.load(self.path)
+        self.assertEqual("2011", opened.season_key)
+        self.assertEqual(sorted((t.abbr, t.name, t.division_id) for t in models.Team.all_teams()),
+                         sorted((t.abbr, t.name, t.division_id) for t in opened.all_teams()))
+        self.assertEqual([(w.pk, w.number, w.first_game, w.last_game) for w in models.Week.active_weeks()],
+                         [(w.pk, w.number, w.first_game, w.last_game) for w in opened.active_weeks()])
+        week = models.Week.objects.get(pk="2011-5")
+        self.assertEqual(self.games(models.Game.week_schedule(week)), self.games(opened.week_schedule("2011-5")))
+        self.assertEqual(list(models.TeamResult.objects.filter(week=week).order_by('team')
+                              .values_list('team', 'wins', 'losses', 'total_wins', 'total_losses')),
+                         [(r.team_id, r.wins, r.losses, r.total_wins, r.total_losses)
+                          for r in opened.week_results("2011-5")])
+        self.assertEqual(None, opened.week_schedule("2011-18"))
+
+    def test_accessors_read_snapshot_without_queries(self):
+        snapshot.export_snapshot(self.path)
+        week = models.Week(primary_key="2011-3")
+        snapshot.all_teams()
+
+        with self.assertNumQueries(0):
+            self.assertEqual(32, len(snapshot.all_teams()))
+            self.assertEqual(17, len(snapshot.active_weeks()))
+            self.assertEqual(16, len(snapshot.week_schedule(week)))
+            self.assertEqual(32, len(snapshot.week_results(week)))
+
+    def test_falls_back_to_database_without_snapshot(self):
+        week = models.Week.objects.get(pk="2011-3")
+        self.assertEqual(self.games(models.Game.week_schedule(week)), self.games(snapshot.week_schedule(week)))
+        self.assertEqual(17, len(snapshot.active_weeks()))
+
+    def test_ignores_snapshot_older_than_database(self):
+        snapshot.export_snapshot(self.path)
+        models.Game.objects.filter(pk="2011-1-1").update(updated_time=datetime.datetime.now() +
+                                                                      datetime.timedelta(minutes=1))
+        self.assertEqual(None, snapshot.load(self.path))
+        self.assertEqual(None, snapshot.get_snapshot(models.Team.CACHE_NAMESPACE))
+
+    def test_ignores_snapshot_of_a_season_that_isnt_active(self):
+        snapshot.export_snapshot(self.path)
+        models.Season.objects.create(year="2012", is_active=True)
+        models.Week.objects.create(season_id="2012", number=1, first_game=datetime.datetime(2012, 9, 5),
+                                   last_game=datetime.datetime(2012, 9, 10))
+        snapshot._snapshots.clear()
+
+        self.assertEqual(None, snapshot.load(self.path))
+        self.assertEqual(["2012-1"], [w.pk for w in snapshot.active_weeks()])
+
+    def test_falls_back_when_data_changes_after_loading(self):
+        snapshot.export_snapshot(self.path)
+        week = models.Week.objects.get(pk="2011-1")
+        self.assertEqual(16, len(snapshot.week_schedule(week)))
+
+        models.Game.objects.get(pk="2011-1-16").delete()
+        self.assertEqual(15, len(snapshot.week_schedule(week)))
+        self.assertEqual(16, len(snapshot.week_schedule(models.Week(primary_key="2011-2"))))
+
+    def test_falls_back_when_data_changes_before_loading(self):
+        snapshot.export_snapshot(self.path)
+        models.Game.objects.get(pk="2011-1-16").delete()
+
+        week = models.Week.objects.get(pk="2011-1")
+        self.assertEqual(15, len(snapshot.week_schedule(week)))
+        self.assertEqual(16, len(snapshot.week_schedule(models.Week(primary_key="2011-2"))))
+
+    def test_checks_file_and_versions_once_per_interval(self):
+        snapshot.export_snapshot(self.path)
+        snapshot.CHECK_INTERVAL = 60
+        week = models.Week(primary_key="2011-3")
+        snapshot.week_schedule(week)
+
+        calls = []
+        original_get_version = utils.get_version
+        def get_version(namespace):
+            calls.append(namespace)
+            return original_get_version(namespace)
+        utils.get_version = get_version
+        try:
+            for i in range(3):
+                self.assertEqual(16, len(snapshot.week_schedule(week)))
+        finally:
+            utils.get_version = original_get_version
+        self.assertEqual([], calls)
+
+    def test_ignores_files_that_arent_snapshots(self):
+        with open(self.path, 'wb') as stream:
+            stream.write("not a snapshot")
+        self.assertEqual(None, snapshot.load(self.path))
+        self.assertEqual(32, len(snapshot.all_teams()))
+
+    def test_export_snapshot_command(self):
+        out = StringIO()
+        call_command('export_snapshot', self.path, stdout=out)
+        self.assertEqual("Exported 8 divisions, 272 games, 544 results, 32 teams, 17 weeks to %s.\n" % self.path,
+                         out.getvalue())
+        self.assertEqual("2011", snapshot.load(self.path).season_key)
+
+class BaseGamesFormTests(TestCase):
+
+    def setUp(self):
+        today = datetime.datetime.now()
+        season = models.Season.objects.create(year="2011", is_active=True)
+        self.week = models.Week.objects.create(season=season, number=1, first_game=today, last_game=today)
+        for number, (away, home) in enumerate([("NO", "GB"), ("ATL", "CHI")]):
+            models.Game.objects.create(week=self.week, number=number + 1, game_time=today, home_id=home, away_id=away)
+        fields = ['week'] + ['game%s' % n for n in range(1, 17)]
+        self.form_class = modelform_factory(models.Winner, form=forms.BaseGamesForm, fields=fields)
+
+    def test_for_week_builds_game_fields_once(self):
+        form_class = self.form_class.for_week(self.week)
+        self.assertEqual(('game1', 'game2'), form_class.game_fields)
+        self.assertEqual([("NO", "New Orleans"), ("GB", "Green Bay")], form_class.base_fields['game1'].choices)
+        self.assertTrue(form_class is self.form_class.for_week(self.week))
+
+    def test_subclasses_can_override_label_and_widget_hooks(self):
+        class LabelledForm(self.form_class):
+            def _get_label(self, team):
+                return "%s (%s)" % (team, team.abbr)
+
+            def get_game_choice_widget(self):
+                return django_forms.Select()
+
+        form = LabelledForm(initial={'week': self.week.pk})
+        self.assertEqual([("NO", "New Orleans (NO)"), ("GB", "Green Bay (GB)")], form.fields['game1'].choices)
+        self.assertFalse(isinstance(form.fields['game1'].widget, django_forms.RadioSelect))
+
+    def test_for_week_rebuilds_form_when_schedule_changes(self):
+        form_class = self.form_class.for_week(self.week)
+        models.Game.objects.create(week=self.week, number=3, game_time=datetime.datetime.now(), home_id="KC", away_id="BUF")
+        self.assertEqual(('game1', 'game2', 'game3'), self.form_class.for_week(self.week).game_fields)
+        self.assertFalse(form_class is self.form_class.for_week(self.week))
+
+    def test_week_form_saves_game_picks(self):
+        form_class = self.form_class.for_week(self.week)
+        form = form_class({'week': self.week.pk, 'game1': "GB", 'game2': "ATL"})
+        self.assertTrue(form.is_valid(), form.errors)
+        winner = form.save()
+        self.assertEqual(("GB", "ATL"), (winner.game1, winner.game2))
+
+    def test_form_adds_current_week_game_fields(self):
+        form = self.form_class(initial={'week': self.week.pk})
+        self.assertTrue(isinstance(form.fields['game1'], django_forms.ChoiceField))
+        self.assertTrue(isinstance(form.fields['game3'], django_forms.CharField))
+        self.assertTrue('game2' in form._meta.fields)
+
+    def test_form_classes_with_the_same_hooks_share_game_fields(self):
+        other_class = modelform_factory(models.Winner, form=forms.BaseGamesForm)
+        self.assertTrue(self.form_class.week_game_fields(self.week) is other_class.week_game_fields(self.week))
+
+    def test_admin_form_follows_the_request(self):
+        class ReadOnlyWeekAdmin(nfl_admin.WinnerAdmin):
+            def get_readonly_fields(self, request, obj=None):
+                return ['week'] if 'locked' in request.GET else []
+
+        model_admin = ReadOnlyWeekAdmin(models.Winner, nfl_admin.admin.site)
+        user = User.objects.create_superuser('admin', 'admin@example.com', 'admin')
+        requests = [RequestFactory().get('/'), RequestFactory().get('/?locked=1')]
+        for request in requests:
+            request.user = user
+        self.assertTrue('week' in model_admin.get_form(requests[0]).base_fields)
+        self.assertFalse('week' in model_admin.get_form(requests[1]).base_fields)
+
+    def test_instantiating_forms_doesnt_grow_shared_state(self):
+        fields_count = len(self.form_class._meta.fields)
+        for i in range(100):
+            self.form_class(initial={'week': self.week.pk})
+        gc.collect()
+        object_count = len(gc.get_objects())
+
+        for i in range(2000):
+            form = self.form_class(initial={'week': self.week.pk})
+        del form
+        gc.collect()
+
+        self.assertEqual(fields_count, len(self.form_class._meta.fields))
+        self.assertEqual(17, len(self.form_class.for_week(self.week)._meta.fields))
+        self.assertEqual(1, len(self.form_class._week_forms))
+        # each form is made of hundreds of objects, so this would be in
+        # the hundreds of thousands if forms were being kept around.
+        self.assertTrue(len(gc.get_objects()) - object_count < 1000)
+
+class ScheduleGameWidgetTests(TestCase):
+
+    def setUp(self):
+        self.original_cache = forms.fragment_cache
+        forms.fragment_cache = utils.LocalCache()
+        self.widget = django_forms.RadioSelect(renderer=forms.ScheduleGameWidget,
+                                               choices=[("NO", "New Orleans"), ("GB", "Green Bay")])
+
+    def tearDown(self):
+        forms.fragment_cache = self.original_cache
+
+    def test_caches_rendered_pick_list(self):
+        html = self.widget.render('game1', "GB", attrs={'id': 'id_game1'})
+        self.assertTrue('<ul class="radiolist inline"><li><label for="id_game1_0">' in html)
+        self.assertEqual(1, len(forms.fragment_cache))
+        self.assertEqual(html, self.widget.render('game1', "GB", attrs={'id': 'id_game1'}))
+        self.assertEqual(1, forms.fragment_cache.hits)
+
+    def test_renders_same_markup_as_without_cache(self):
+        html = self.widget.render('game1', "GB", attrs={'id': 'id_game1'})
+        forms.fragment_cache = None
+        self.assertEqual(html, self.widget.render('game1', "GB", attrs={'id': 'id_game1'}))
+
+    def test_keeps_separate_markup_per_selected_team(self):
+        self.widget.render('game1', "GB")
+        html = self.widget.render('game1', "NO")
+        checked = [li for li in html.split('<li>') if 'checked' in li]
+        self.assertEqual(1, len(checked))
+        self.assertTrue('value="NO"' in checked[0])
+        self.assertEqual(2, len(forms.fragment_cache))
 
 class ResultMixinTests(TestCase):
 
@@ -252,6 +1486,42 @@ class ResultMixinTests(TestCase):
         result = models.ResultMixin(total_wins=0, total_losses=0)
         self.assertEqual(None, result.win_percent)
 
+class ResultLeaderboardTests(TestCase):
+
+    def setUp(self):
+        today = datetime.datetime(2011, 9, 8, 20, 30)
+        season = models.Season.objects.create(year="2011")
+        self.week = models.Week.objects.create(season=season, number=2, first_game=today, last_game=today)
+        other_week = models.Week.objects.create(season=season, number=1, first_game=today, last_game=today)
+        for team, wins, losses in (("GB", 2, 0), ("NO", 1, 0), ("CHI", 1, 1), ("ATL", 0, 0), ("DAL", 1, 2),
+                                   ("NYG", 1, 1)):
+            models.TeamResult.objects.create(team_id=team, week=self.week, total_wins=wins, total_losses=losses)
+        models.TeamResult.objects.create(team_id="DET", week=other_week, total_wins=1, total_losses=0)
+
+    def test_ranks_week_in_database(self):
+        leaderboard = models.TeamResult.objects.filter(week=self.week).leaderboard()
+        self.assertEqual([("GB", 1), ("NO", 1), ("CHI", 3), ("NYG", 3), ("DAL", 5), ("ATL", 6)],
+                         [(r.team_id, r.rank) for r in leaderboard])
+
+    def test_selects_games_played_and_win_pct(self):
+        results = dict((r.team_id, r) for r in models.TeamResult.objects.with_standing())
+        self.assertEqual((3, 33.33), (results["DAL"].games_played, round(results["DAL"].win_pct, 2)))
+        self.assertEqual((0, None), (results["ATL"].games_played, results["ATL"].win_pct))
+        self.assertEqual(1, results["DET"].rank)
+        self.assertAlmostEqual(results["DAL"].win_percent, results["DAL"].win_pct)
+
+    def test_returns_top_results_for_week(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(["GB", "NO", "CHI"], [r.team_id for r in models.TeamResult.objects.top(self.week, 3)])
+
+    def test_pages_by_key(self):
+        qs = models.TeamResult.objects.filter(week=self.week).leaderboard()
+        teams, page = [], list(qs[:2])
+        while page:
+            teams.extend(r.team_id for r in page)
+            page = list(qs.after(page[-1])[:2])
+        self.assertEqual(["GB", "NO", "CHI", "NYG", "DAL", "ATL"], teams)
+
 class TimeZoneTests(TestCase):
 
     def test_changes_utc_to_central_standard(self):
@@ -312,6 +1582,26 @@ class TimeZoneTests(TestCase):
         self.assertEqual(18, dst_trigger.day)
         self.assertEqual(6, dst_trigger.weekday())
 
+    def test_memoizes_dst_transitions_per_year(self):
+        zone = tz.StandardAmericanZone(-5, 'Test')
+        expected = (datetime.datetime(2011, 3, 13), datetime.datetime(2011, 11, 6))
+        self.assertEqual(expected, zone.get_transitions(2011))
+        self.assertEqual({2011: expected}, zone._transitions)
+
+    def test_convert_many_matches_converting_one_at_a_time(self):
+        start = datetime.datetime(2011, 3, 12)
+        times = [start + datetime.timedelta(hours=7 * i) for i in range(1300)]
+        for to_zone in (tz.UTC, tz.PACIFIC):
+            expected = [t.replace(tzinfo=tz.EASTERN).astimezone(to_zone) for t in times]
+            converted = tz.convert_many(times, tz.EASTERN, to_zone)
+            self.assertEqual([t.replace(tzinfo=None) for t in expected],
+                             [t.replace(tzinfo=None) for t in converted])
+
+    def test_convert_many_returns_aware_datetimes_in_new_zone(self):
+        converted = tz.convert_many([datetime.datetime(2011, 9, 11, 13)])
+        self.assertEqual([datetime.datetime(2011, 9, 11, 17, tzinfo=tz.UTC)], converted)
+        self.assertEqual(tz.UTC, converted[0].tzinfo)
+
 class CacheUtilsTests(TestCase):
     """
     This test will fail if you don't have a cache set up in settings.py
@@ -327,3 +1617,254 @@ class CacheUtilsTests(TestCase):
         #Test an existing value
         cache.set('b','b')
         self.assertEqual(utils.get_or_add_qs('b','c'),'b')
+
+    def test_get_or_add_qs_stores_value_under_namespace_version(self):
+        utils.get_or_add_qs('c', 'c', namespace='letters')
+        self.assertEqual(None, cache.get('c'))
+        self.assertEqual(['c'], cache.get('c', version=utils.get_version('letters')))
+
+    def test_get_or_add_qs_rebuilds_value_after_namespace_is_bumped(self):
+        self.assertEqual(['d'], utils.get_or_add_qs('d', 'd', namespace='letters'))
+        self.assertEqual(['d'], utils.get_or_add_qs('d', 'e', namespace='letters'))
+
+        utils.bump_version('letters')
+        self.assertEqual(['e'], utils.get_or_add_qs('d', 'e', namespace='letters'))
+
+    def test_get_or_add_calls_build_only_when_value_missing(self):
+        calls = []
+        def build():
+            calls.append(1)
+            return ('etag', 'body')
+        self.assertEqual(('etag', 'body'), utils.get_or_add('doc', build, namespace='letters'))
+        self.assertEqual(('etag', 'body'), utils.get_or_add('doc', build, namespace='letters'))
+        self.assertEqual(1, len(calls))
+
+    def test_bump_version_creates_new_version_when_missing(self):
+        version = utils.get_version('letters')
+        cache.delete(utils.VERSION_KEY % 'letters')
+        self.assertNotEqual(version, utils.bump_version('letters'))
+
+    def test_bumped_version_keeps_version_timeout(self):
+        original_cache = utils.cache
+        utils.cache = get_cache('django.core.cache.backends.locmem.LocMemCache')
+        try:
+            utils.get_version('letters')
+            utils.bump_version('letters')
+            key = utils.cache.make_key(utils.VERSION_KEY % 'letters')
+            expires = utils.cache._expire_info[key]
+            self.assertTrue(expires > time.time() + utils.VERSION_TIMEOUT - 60)
+        finally:
+            utils.cache = original_cache
+
+    def test_get_or_add_qs_uses_ttl_policy_for_timeout(self):
+        policy_values = []
+        def policy(val):
+            policy_values.append(val)
+            return 120
+        start = time.time()
+        self.assertEqual(['f'], utils.get_or_add_qs('f', 'f', lock=True, ttl=policy))
+        self.assertEqual([['f']], policy_values)
+        entry = cache.get('f')
+        self.assertTrue(start + 120 <= entry.expires < time.time() + 120)
+
+        utils.get_or_add_qs('f', 'g', lock=True, ttl=policy)
+        self.assertEqual(1, len(policy_values))
+
+    def test_expire_at_next_keeps_value_until_next_upcoming_time(self):
+        now = tz.get_current_time(tz.EASTERN).replace(tzinfo=None)
+        Game = collections.namedtuple('Game', 'game_time')
+        policy = utils.expire_at_next('game_time')
+        games = [Game(now - datetime.timedelta(hours=1)), Game(now + datetime.timedelta(hours=3)),
+                 Game(now + datetime.timedelta(hours=2))]
+        self.assertTrue(7100 < policy(games) <= 7200)
+
+    def test_expire_at_next_is_bounded(self):
+        now = tz.get_current_time(tz.EASTERN).replace(tzinfo=None)
+        Game = collections.namedtuple('Game', 'game_time')
+        policy = utils.expire_at_next('game_time')
+        self.assertEqual(utils.MAX_TIMEOUT, policy([Game(now - datetime.timedelta(days=1))]))
+        self.assertEqual(utils.MAX_TIMEOUT, policy([]))
+        self.assertEqual(utils.MIN_TIMEOUT, policy([Game(now + datetime.timedelta(seconds=5))]))
+        self.assertEqual(utils.MAX_TIMEOUT, policy([Game(now + datetime.timedelta(days=90))]))
+
+    def test_deferred_bumps_bump_each_namespace_once_at_the_end(self):
+        version = utils.get_version('letters')
+        with utils.deferred_bumps():
+            with utils.deferred_bumps():
+                utils.bump_version('letters')
+            utils.bump_version('letters')
+            self.assertEqual(version, utils.get_version('letters'))
+        self.assertEqual(version + 1, utils.get_version('letters'))
+
+class LocalCacheTests(TestCase):
+
+    def setUp(self):
+        self.original_cache = utils.local_cache
+        utils.local_cache = utils.LocalCache(timeout=60)
+
+    def tearDown(self):
+        utils.local_cache = self.original_cache
+
+    def test_drops_least_recently_used_entry_when_full(self):
+        local = utils.LocalCache(max_entries=2)
+        local.set('a', 1)
+        local.set('b', 2)
+        local.get('a')
+        local.set('c', 3)
+        self.assertEqual(1, local.get('a'))
+        self.assertEqual(None, local.get('b'))
+        self.assertEqual(3, local.get('c'))
+
+    def test_expires_entries_after_timeout(self):
+        local = utils.LocalCache()
+        local.set('a', 1, timeout=-1)
+        self.assertEqual(None, local.get('a'))
+
+    def test_counts_hits_and_misses(self):
+        local = utils.LocalCache()
+        local.set('a', 1)
+        local.get('a')
+        local.get('b')
+        self.assertEqual({'hits': 1, 'misses': 1, 'size': 1}, local.stats())
+
+    def test_get_or_add_qs_serves_namespaced_values_from_local_cache(self):
+        self.assertEqual(['f'], utils.get_or_add_qs('f', 'f', namespace='letters'))
+        cache.delete('f', version=utils.get_version('letters'))
+        self.assertEqual(['f'], utils.get_or_add_qs('f', 'g', namespace='letters'))
+
+    def test_bump_version_invalidates_local_values(self):
+        utils.get_or_add_qs('h', 'h', namespace='letters')
+        utils.bump_version('letters')
+        self.assertEqual(['i'], utils.get_or_add_qs('h', 'i', namespace='letters'))
+
+class SlowQuerySet(object):
+    """
+    Stands in for a queryset that takes a while to evaluate and
+    counts how many times it's been evaluated.
+    """
+
+    def __init__(self, value, delay=0.2):
+        self.value = value
+        self.delay = delay
+        self.evaluations = 0
+
+    def __iter__(self):
+        self.evaluations += 1
+        time.sleep(self.delay)
+        return iter(self.value)
+
+class StampedeProtectionTests(TestCase):
+    """
+    Threads don't share the test database, so these use a local memory
+    cache instead of the one in settings.
+    """
+
+    def setUp(self):
+        self.original_cache = utils.cache
+        utils.cache = get_cache('django.core.cache.backends.locmem.LocMemCache')
+
+    def tearDown(self):
+        utils.cache = self.original_cache
+
+    def test_only_one_concurrent_caller_evaluates_queryset(self):
+        qs = SlowQuerySet(['a', 'b'])
+        results = []
+
+        def get_value():
+            results.append(utils.get_or_add_qs('stampede', qs, lock=True))
+
+        threads = [threading.Thread(target=get_value) for i in range(10)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(1, qs.evaluations)
+        self.assertEqual([['a', 'b']] * 10, results)
+
+    def test_serves_stale_value_while_another_caller_rebuilds(self):
+        stale = utils.CachedValue(['old'], time.time() - 1, 0)
+        utils.cache.set('stale', stale)
+        utils.cache.add(utils.LOCK_KEY % 'stale', 1)
+
+        qs = SlowQuerySet(['new'], delay=0)
+        self.assertEqual(['old'], utils.get_or_add_qs('stale', qs, lock=True))
+        self.assertEqual(0, qs.evaluations)
+
+    def test_rebuilds_stale_value_when_lock_is_free(self):
+        utils.cache.set('stale', utils.CachedValue(['old'], time.time() - 1, 0))
+        qs = SlowQuerySet(['new'], delay=0)
+        self.assertEqual(['new'], utils.get_or_add_qs('stale', qs, lock=True))
+        self.assertEqual(None, utils.cache.get(utils.LOCK_KEY % 'stale'))
+
+    def test_early_refresh_rebuilds_value_before_it_expires(self):
+        utils.cache.set('early', utils.CachedValue(['old'], time.time() + 1, 1e6))
+        qs = SlowQuerySet(['new'], delay=0)
+        self.assertEqual(['old'], utils.get_or_add_qs('early', qs, lock=True))
+        self.assertEqual(['new'], utils.get_or_add_qs('early', qs, lock=True, early_refresh=100))
+
+    def test_plain_lookup_unwraps_value_stored_with_lock(self):
+        utils.get_or_add_qs('mixed', SlowQuerySet(['a'], delay=0), lock=True)
+        self.assertEqual(['a'], utils.get_or_add_qs('mixed', 'b'))
+
+class StatsTests(TestCase):
+
+    def setUp(self):
+        self.original_cache = utils.cache
+        utils.cache = get_cache('django.core.cache.backends.locmem.LocMemCache')
+        utils.cache.clear()
+        stats.enabled = True
+
+    def tearDown(self):
+        stats.enabled = False
+        stats.finish()
+        utils.cache = self.original_cache
+
+    def test_counts_hits_and_misses_by_key_family(self):
+        with stats.collect() as collected:
+            utils.get_or_add_qs('2011-1-schedule', SlowQuerySet(['a'], delay=0))
+            utils.get_or_add_qs('2011-1-schedule', SlowQuerySet(['a'], delay=0))
+            utils.get_or_add_qs('2011-2-schedule', SlowQuerySet(['b'], delay=0), lock=True)
+
+        family = collected.as_dict()['cache']['*-schedule']
+        self.assertEqual(3, family['calls'])
+        self.assertEqual(1, family['hits'])
+        self.assertEqual(2, family['misses'])
+
+    def test_doesnt_count_values_that_arent_querysets(self):
+        with stats.collect() as collected:
+            utils.get_or_add('2011-1-document', lambda: ('etag', 'body'))
+
+        self.assertEqual({}, collected.as_dict()['cache'])
+
+    def test_counts_queries_of_model_lookups(self):
+        with stats.collect() as collected:
+            models.Team.all_teams()
+            models.Team.all_teams()
+
+        queries = collected.as_dict()['queries']['Team.all_teams']
+        self.assertEqual({'calls': 2, 'queries': 1}, queries)
+        self.assertEqual(1, collected.as_dict()['cache']['all_teams']['misses'])
+
+    def test_collects_nothing_when_disabled(self):
+        stats.enabled = False
+        with stats.collect() as collected:
+            models.Team.all_teams()
+        self.assertEqual(None, collected)
+
+    def test_middleware_logs_stats_for_request(self):
+        middleware = stats.StatsMiddleware()
+        request = RequestFactory().get('/picks/')
+        messages = []
+        original_info = stats.logger.info
+        stats.logger.info = lambda *args: messages.append(args[0] % args[1:])
+        try:
+            middleware.process_request(request)
+            models.Team.all_teams()
+            response = middleware.process_response(request, HttpResponse())
+        finally:
+            stats.logger.info = original_info
+
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(1, len(messages))
+        self.assertTrue(messages[0].startswith('GET /picks/ {"cache": {"all_teams"'))
@@ -31,11 +31,29 @@ class Zone(tzinfo):
 
 class StandardAmericanZone(Zone):
 
+    def __init__(self, offset, name):
+        super(StandardAmericanZone, self).__init__(offset, name)
+        self._transitions = {}
+
     def dst(self, dt):
-        if self.get_dst_start(dt) <= dt.replace(tzinfo=None) < self.get_dst_end(dt):
+        start, end = self.get_transitions(dt.year)
+        if start <= dt.replace(tzinfo=None) < end:
             return timedelta(hours=1)
         return timedelta(0)
 
+    def get_transitions(self, year):
+        """
+        Returns when daylight savings starts and ends for the year. They're
+        only worked out once per year since every utcoffset call needs them.
+        """
+        try:
+            return self._transitions[year]
+        except KeyError:
+            dt = datetime(year, 1, 1)
+            transitions = (self.get_dst_start(dt), self.get_dst_end(dt))
+            self._transitions[year] = transitions
+            return transitions
+
     def get_dst_start(self, dt):
         """
         Daylight savings starts second Sunday in March
@@ -71,6 +89,23 @@ def get_current_time(tz=EASTERN):
     utc_time = datetime.utcnow().replace(tzinfo=UTC)
     return utc_time.astimezone(tz)
 
+def convert_many(datetimes, from_zone=EASTERN, to_zone=UTC):
+    """
+    Converts a list of naive datetimes (eg. a week's game times) from one
+    zone to another in a single pass. Does the same as calling
+    dt.replace(tzinfo=from_zone).astimezone(to_zone) on each one without
+    going through utcoffset for every step of the conversion.
+    """
+    from_standard = timedelta(hours=from_zone.offset)
+    to_standard = timedelta(hours=to_zone.offset)
+    converted = []
+    for dt in datetimes:
+        dt = dt.replace(tzinfo=None)
+        local = dt - from_standard - from_zone.dst(dt) + to_standard
+        local += to_zone.dst(local)
+        converted.append(local.replace(tzinfo=to_zone))
+    return converted
+
 def get_datetime_from_string(date_string):
     # For some reason appengine doesn't like me using strptime...
 #    return datetime.datetime.strptime(date_string, "%m/%d/%Y")
@@ -0,0 +1,12 @@
+from django.conf.urls.defaults import patterns, url
+
+WEEK_KEY = r'(?P<week_key>\d{4}-\d{1,2})'
+
+urlpatterns = patterns('nfl.views',
+    url(r'^teams\.json$', 'teams', name='nfl-teams'),
+    url(r'^picks\.json$', 'submit_pick_sheets', name='nfl-submit-pick-sheets'),
+    url(r'^weeks/%s/schedule\.json$' % WEEK_KEY, 'week_schedule', name='nfl-week-schedule'),
+    url(r'^weeks/%s/winner\.json$' % WEEK_KEY, 'week_winner', name='nfl-week-winner'),
+    url(r'^weeks/%s/results\.json$' % WEEK_KEY, 'week_results', name='nfl-week-results'),
+    url(r'^weeks/%s/standings\.json$' % WEEK_KEY, 'week_standings', name='nfl-week-standings'),
+)
@@ -1,16 +1,403 @@
+import itertools
+import math
+import random
+import threading
+import time
 
+from django.conf import settings
 from django.core.cache import cache
+from django.core.cache.backends.memcached import BaseMemcachedCache
+from django.db import connections, router, transaction
+from django.db.models import AutoField
+from django.db.models.sql import DeleteQuery
+from django.utils.datastructures import SortedDict
+
+from nfl import stats, tz
+
+# Version keys live much longer than anything cached under them. If one
+# does get evicted it is re-seeded with a random value, so entries stored
+# under an earlier version can never be read again by mistake.
+VERSION_KEY = 'nfl-version:%s'
+VERSION_TIMEOUT = 60 * 60 * 24 * 365
+
+class LocalCache(object):
+    """
+    A small, thread safe LRU cache kept in process memory. Entries
+    expire after `timeout` seconds and the least recently used entry is
+    dropped once there are more than `max_entries`.
+    """
+
+    def __init__(self, max_entries=256, timeout=5):
+        self.max_entries = max_entries
+        self.timeout = timeout
+        self.hits = 0
+        self.misses = 0
+        self._data = SortedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                expires, value = self._data.pop(key)
+            except KeyError:
+                self.misses += 1
+                return default
+            if expires < time.time():
+                self.misses += 1
+                return default
+            self._data[key] = (expires, value)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, timeout=None):
+        if timeout is None:
+            timeout = self.timeout
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = (time.time() + timeout, value)
+            while len(self._data) > self.max_entries:
+                del self._data[self._data.keyOrder[0]]
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.hits = self.misses = 0
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self)}
+
+def get_local_cache():
+    """
+    Builds the process local cache from the NFL_LOCAL_CACHE setting, eg:
+        NFL_LOCAL_CACHE = {'MAX_ENTRIES': 256, 'TIMEOUT': 5}
+    Returns None (no local cache) when the setting is missing.
+    """
+    options = getattr(settings, 'NFL_LOCAL_CACHE', None)
+    if options is None:
+        return None
+    return LocalCache(max_entries=options.get('MAX_ENTRIES', 256),
+                      timeout=options.get('TIMEOUT', 5))
+
+# Namespaced values are kept here in front of the django cache. They're
+# keyed by namespace version, so a bump in this process is seen right away
+# and one made by another process is seen once the local copy of the
+# version expires (TIMEOUT seconds at the most).
+local_cache = get_local_cache()
+
+def get_version(namespace):
+    """
+    Returns the current version of a cache namespace, creating it
+    when it doesn't exist yet.
+    """
+    if local_cache is not None:
+        version = local_cache.get(('version', namespace))
+        if version is not None:
+            return version
+
+    key = VERSION_KEY % namespace
+    version = cache.get(key)
+    if version is None:
+        version = random.getrandbits(48)
+        if not cache.add(key, version, VERSION_TIMEOUT):
+            version = cache.get(key, version)
+
+    if local_cache is not None:
+        local_cache.set(('version', namespace), version)
+    return version
+
+def bump_version(namespace):
+    """
+    Invalidates everything cached under the namespace by moving it
+    to a new version. Inside deferred_bumps() this is held back until
+    the end of the block (and returns None).
+    """
+    namespaces = getattr(_deferred, 'namespaces', None)
+    if namespaces is not None:
+        namespaces.add(namespace)
+        return None
+    return _bump_version(namespace)
+
+def _bump_version(namespace):
+    key = VERSION_KEY % namespace
+    try:
+        version = cache.incr(key)
+    except ValueError:
+        version = random.getrandbits(48)
+        cache.set(key, version, VERSION_TIMEOUT)
+    else:
+        # memcached keeps the expiry through incr. The other backends
+        # get and set the value again with the default timeout, so the
+        # version would expire (and the namespace with it) minutes later.
+        if not isinstance(cache, BaseMemcachedCache):
+            cache.set(key, version, VERSION_TIMEOUT)
+
+    if local_cache is not None:
+        local_cache.set(('version', namespace), version)
+    return version
+
+_deferred = threading.local()
+
+class deferred_bumps(object):
+    """
+    Context manager that holds back the bump_version calls made by this
+    thread inside it and makes each one once on the way out, so a batch of
+    saves invalidates every namespace it touched a single time. Wrap it
+    around the transaction so nothing is rebuilt from uncommitted rows.
+    Nested blocks are bumped by the outermost one.
+    """
+
+    def __enter__(self):
+        if getattr(_deferred, 'namespaces', None) is None:
+            _deferred.namespaces = set()
+            self.namespaces = _deferred.namespaces
+        else:
+            self.namespaces = None
+
+    def __exit__(self, *exc_info):
+        if self.namespaces is None:
+            return
+        _deferred.namespaces = None
+        for namespace in sorted(self.namespaces):
+            _bump_version(namespace)
+
+# Used by get_or_add(lock=True). Values are kept STALE_TIMEOUT seconds
+# past their timeout so they can still be served while one caller rebuilds
+# them. Callers that find neither a value nor the lock wait up to
+# LOCK_TIMEOUT seconds for the caller holding the lock.
+LOCK_KEY = '%s:lock'
+LOCK_TIMEOUT = 30
+LOCK_POLL_INTERVAL = 0.05
+STALE_TIMEOUT = 60 * 60
+
+class CachedValue(object):
+    """
+    Wraps a value stored by get_or_add(lock=True) with the time it
+    goes stale and how many seconds it took to build.
+    """
+
+    def __init__(self, value, expires, delta):
+        self.value = value
+        self.expires = expires
+        self.delta = delta
+
+    def is_stale(self, early_refresh=0):
+        """
+        With early_refresh the value is randomly treated as stale a little
+        before it expires, more likely the closer it gets and the longer it
+        takes to build, so one caller usually rebuilds it before anyone
+        finds it expired.
+        """
+        now = time.time()
+        if early_refresh:
+            now -= self.delta * early_refresh * math.log(1 - random.random())
+        return now >= self.expires
+
+# Timeouts worked out by a ttl policy are kept between these bounds.
+# Memcached reads a timeout of more than 30 days as a unix time, so
+# nothing is cached for longer than that.
+MIN_TIMEOUT = 60
+MAX_TIMEOUT = 60 * 60 * 24 * 30
+
+def bounded_timeout(seconds, minimum=MIN_TIMEOUT, maximum=MAX_TIMEOUT):
+    return int(max(minimum, min(maximum, seconds)))
+
+def expire_at_next(attname, zone=tz.EASTERN):
+    """
+    Returns a ttl policy for get_or_add_qs that keeps a list of objects
+    until the next of their `attname` datetimes (naive, in `zone`) that's
+    still to come, or for MAX_TIMEOUT once they've all passed. Eg.
+    expire_at_next('game_time') keeps a week's schedule until kickoff.
+    """
+    def policy(objects):
+        now = tz.get_current_time(tz.UTC)
+        instants = tz.convert_many([getattr(obj, attname) for obj in objects], zone, tz.UTC)
+        upcoming = [instant for instant in instants if instant > now]
+        if not upcoming:
+            return MAX_TIMEOUT
+        return bounded_timeout((min(upcoming) - now).total_seconds())
+    return policy
+
+def _timeout(val, ttl, timeout):
+    if ttl is not None:
+        return ttl(val)
+    return timeout
+
+def _evaluate(key, qs):
+    if not stats.enabled:
+        return list(qs) # force qs to be evaluated
+    start = time.time()
+    val = list(qs)
+    stats.record_miss(key, time.time() - start)
+    return val
+
+def _build_value(key, build, version, timeout, ttl=None):
+    start = time.time()
+    val = build()
+    delta = time.time() - start
+    timeout = _timeout(val, ttl, timeout)
+    entry = CachedValue(val, start + delta + timeout, delta)
+    cache.set(key, entry, timeout + STALE_TIMEOUT, version=version)
+    return val
+
+def _get_or_rebuild(key, build, early_refresh=0, timeout=None, version=None, ttl=None):
+    """
+    Only the caller that gets the lock key builds the value, everyone
+    else gets the stale value or waits for the new one.
+    """
+    if timeout is None:
+        timeout = cache.default_timeout
+    lock_key = LOCK_KEY % key
+
+    entry = cache.get(key, version=version)
+    if entry is not None and not isinstance(entry, CachedValue):
+        return entry
+    if entry is not None and not entry.is_stale(early_refresh):
+        return entry.value
+
+    if cache.add(lock_key, 1, LOCK_TIMEOUT, version=version):
+        try:
+            return _build_value(key, build, version, timeout, ttl)
+        finally:
+            cache.delete(lock_key, version=version)
+
+    if entry is not None:
+        return entry.value
+
+    waited = 0
+    while waited < LOCK_TIMEOUT:
+        time.sleep(LOCK_POLL_INTERVAL)
+        waited += LOCK_POLL_INTERVAL
+        entry = cache.get(key, version=version)
+        if entry is not None:
+            return getattr(entry, 'value', entry)
+    return _build_value(key, build, version, timeout, ttl)
+
+def get_or_add(key, build, namespace=None, lock=False, early_refresh=0, ttl=None, **kwargs):
+    """
+    Fetch a given key from the cache. If the key does not exist, call
+    build() and store what it returns in cache.
+
+    namespace: when given, the key is stored under the namespace's
+        current version so bumping the namespace invalidates it. These
+        values are also kept in the process local cache (when it's
+        enabled), so treat the returned value as read only.
+    lock: only let one caller build the value when it's missing or has
+        expired. Others are served the expired value while it's rebuilt
+        (or wait for it when there isn't one).
+    early_refresh: with lock, rebuild values a little before they expire.
+        1 is a sensible setting, larger values refresh earlier.
+    ttl: a policy called with the built value that returns how many
+        seconds to keep it, in place of a fixed timeout. See
+        expire_at_next.
+    """
+    local_key = None
+    if namespace is not None:
+        kwargs['version'] = get_version(namespace)
+        if local_cache is not None:
+            local_key = (key, kwargs['version'])
+            val = local_cache.get(local_key)
+            if val is not None:
+                return val
+
+    if lock:
+        val = _get_or_rebuild(key, build, early_refresh, ttl=ttl, **kwargs)
+    else:
+        val = cache.get(key, version=kwargs.get('version'))
+        if isinstance(val, CachedValue):
+            val = val.value
+        if val is None:
+            val = build()
+            kwargs['timeout'] = _timeout(val, ttl, kwargs.get('timeout'))
+            cache.add(key, val, **kwargs)
+
+    if local_key is not None:
+        local_cache.set(local_key, val)
+    return val
 
 # A similar feature might make it into a future version of django,
 # but for now we'll just use it here.
 # https://code.djangoproject.com/attachment/ticket/12982/
 def get_or_add_qs(key, qs, **kwargs):
     """
-    Fetch a given key from the cache. If the key does not exist,
-    evaluate the queryset and store the results in cache.
+    get_or_add for a queryset, which is evaluated into a list when the
+    key is missing. Takes the same arguments as get_or_add, and the
+    calls and misses are recorded in stats.
+    """
+    if stats.enabled:
+        stats.record_call(key)
+    return get_or_add(key, lambda: _evaluate(key, qs), **kwargs)
+
+def bulk_create(model, objs, batch_size=500):
+    """
+    Inserts objs in batches without calling save() or sending signals.
+    Uses the manager's bulk_create when django has one, otherwise
+    a single executemany per batch.
+    """
+    objs = list(objs)
+    manager = model._default_manager
+    for start in range(0, len(objs), batch_size):
+        batch = objs[start:start + batch_size]
+        if hasattr(manager, 'bulk_create'):
+            manager.bulk_create(batch)
+        else:
+            _insert_many(model, batch)
+
+def bulk_delete(model, pks):
+    """
+    Deletes rows by primary key without fetching them, following
+    relations or sending signals.
+    """
+    pks = list(pks)
+    if pks:
+        using = router.db_for_write(model)
+        DeleteQuery(model).delete_batch(pks, using)
+        transaction.commit_unless_managed(using=using)
+
+def insert_rows(model, field_names, rows, batch_size=500):
+    """
+    Inserts rows of values that are already in their database form
+    (strings, numbers, and datetimes from connection.ops) without building
+    model instances, which is much faster for very large numbers of rows.
+    Fields that are left out need a default in the database.
     """
-    val = cache.get(key)
-    if val is None:
-        val = list(qs) # force qs to be evaluated
-        cache.add(key, val, **kwargs)
-    return val
\ No newline at end of file
+    fields = [model._meta.get_field(name) for name in field_names]
+    rows = iter(rows)
+    while True:
+        batch = list(itertools.islice(rows, batch_size))
+        if not batch:
+            break
+        _execute_insert(model, fields, batch)
+
+def _insert_many(model, objs):
+    connection = connections[router.db_for_write(model)]
+    fields = [f for f in model._meta.local_fields if not isinstance(f, AutoField)]
+    params = []
+    for obj in objs:
+        params.append([f.get_db_prep_save(_pre_save(f, obj), connection=connection) for f in fields])
+    _execute_insert(model, fields, params)
+
+def _execute_insert(model, fields, params):
+    using = router.db_for_write(model)
+    connection = connections[using]
+    qn = connection.ops.quote_name
+
+    sql = "INSERT INTO %s (%s) VALUES (%s)" % (
+        qn(model._meta.db_table),
+        ", ".join(qn(f.column) for f in fields),
+        ", ".join(["%s"] * len(fields)),
+    )
+    connection.cursor().executemany(sql, params)
+    transaction.commit_unless_managed(using=using)
+
+def _pre_save(field, obj):
+    # keeps a created time that's already set (eg. when replacing a row)
+    if getattr(field, 'auto_now_add', False) and getattr(obj, field.attname) is not None:
+        return getattr(obj, field.attname)
+    return field.pre_save(obj, True)
@@ -0,0 +1,152 @@
+"""
+JSON for teams and for a week's schedule, winner, team results and
+standings, and for submitting pick sheets in bulk.
+
+Each document is serialized once and cached, along with its ETag (a hash
+of the body) and Last-Modified (the latest updated_time of the rows in
+it), under the same cache namespace as the data it comes from. A
+conditional GET for a document that hasn't changed is answered with a
+304 from the cache alone.
+"""
+import datetime
+import hashlib
+import time
+from StringIO import StringIO
+
+from django.http import Http404, HttpResponse, HttpResponseBadRequest, HttpResponseForbidden, HttpResponseNotFound
+from django.utils import simplejson
+from django.views.decorators.http import condition, require_GET, require_POST
+
+from nfl import models, picks, standings, utils
+
+CONTENT_TYPE = 'application/json'
+
+def get_week(week_key):
+    try:
+        return models.Week.current_week(week_key)
+    except models.Week.DoesNotExist:
+        raise Http404("No week %s." % week_key)
+
+def latest_update(objects):
+    """
+    Returns the latest updated_time of the objects in UTC.
+    """
+    times = [obj.updated_time for obj in objects]
+    if not times:
+        return None
+    # updated_time is in the server's local time (settings.TIME_ZONE)
+    return datetime.datetime.utcfromtimestamp(time.mktime(max(times).timetuple()))
+
+def get_document(key, namespace, build):
+    """
+    Returns (etag, last modified, body) for a document, calling build()
+    for (data, last modified) only when it isn't cached.
+    """
+    def render():
+        data, last_modified = build()
+        body = simplejson.dumps(data, separators=(',', ':'))
+        return hashlib.md5(body).hexdigest(), last_modified, body
+    return utils.get_or_add(key, render, namespace=namespace, lock=True)
+
+def json_view(document):
+    """
+    Makes a conditional GET view out of a function returning the
+    (etag, last modified, body) for a request.
+    """
+    def get(request, *args, **kwargs):
+        # the etag, the last modified time and the response all come from
+        # the same document, so it's only looked up once per request
+        if not hasattr(request, '_nfl_document'):
+            request._nfl_document = document(*args, **kwargs)
+        return request._nfl_document
+
+    @condition(etag_func=lambda request, *args, **kwargs: get(request, *args, **kwargs)[0],
+               last_modified_func=lambda request, *args, **kwargs: get(request, *args, **kwargs)[1])
+    def conditional_view(request, *args, **kwargs):
+        return HttpResponse(get(request, *args, **kwargs)[2], content_type=CONTENT_TYPE)
+
+    @require_GET
+    def view(request, *args, **kwargs):
+        try:
+            return conditional_view(request, *args, **kwargs)
+        except Http404 as e:
+            body = simplejson.dumps({'error': str(e)})
+            return HttpResponseNotFound(body, content_type=CONTENT_TYPE)
+    view.__name__ = document.__name__
+    view.__doc__ = document.__doc__
+    return view
+
+@json_view
+def teams():
+    def build():
+        teams = models.Team.all_teams()
+        data = [{'abbr': t.abbr, 'name': t.name, 'division': t.division_id} for t in teams]
+        return data, latest_update(teams)
+    return get_document('teams.json', models.Team.CACHE_NAMESPACE, build)
+
+@json_view
+def week_schedule(week_key):
+    """
+    Game times are Eastern time.
+    """
+    def build():
+        games = models.Game.week_schedule(get_week(week_key))
+        data = [{'number': g.number, 'away': g.away_id, 'home': g.home_id,
+                 'game_time': g.game_time.strftime('%Y-%m-%dT%H:%M:%S'),
+                 'is_active': g.is_active} for g in games]
+        return data, latest_update(games)
+    namespace = models.Game.schedule_namespace(week_key)
+    return get_document(namespace + '.json', namespace, build)
+
+@json_view
+def week_winner(week_key):
+    def build():
+        winners = list(models.Winner.objects.filter(week=get_week(week_key)))
+        games = {}
+        for winner in winners:
+            games = dict((str(n), team) for n, team in winner.get_picks().items() if team)
+        return {'week': week_key, 'games': games}, latest_update(winners)
+    namespace = models.Winner.week_namespace(week_key)
+    return get_document(namespace + '.json', namespace, build)
+
+@json_view
+def week_results(week_key):
+    def build():
+        results = list(models.TeamResult.objects.filter(week=get_week(week_key)).order_by('team'))
+        data = [{'team': r.team_id, 'wins': r.wins, 'losses': r.losses,
+                 'total_wins': r.total_wins, 'total_losses': r.total_losses} for r in results]
+        return data, latest_update(results)
+    namespace = models.TeamResult.results_namespace(week_key.split('-')[0])
+    return get_document("%s-results.json" % week_key, namespace, build)
+
+@json_view
+def week_standings(week_key):
+    def build():
+        week = get_week(week_key)
+        data = {}
+        for division_key, table in standings.week_standings(week).items():
+            data[division_key] = [{'team': s.team_key, 'rank': s.rank, 'wins': s.wins, 'losses': s.losses,
+                                   'division_wins': s.division_wins, 'division_losses': s.division_losses}
+                                  for s in table]
+        results = models.TeamResult.objects.filter(week__season=week.season_id, week__number__lte=week.number)
+        return data, latest_update(results.order_by('-updated_time')[:1])
+    namespace = models.TeamResult.results_namespace(week_key.split('-')[0])
+    return get_document("%s-standings.json" % week_key, namespace, build)
+
+@require_POST
+def submit_pick_sheets(request):
+    """
+    Saves the pick sheets posted as JSON, or as CSV with a text/csv
+    content type (see nfl.picks), and returns the number saved and the
+    errors for any that weren't.
+    """
+    if not request.user.has_perm('nfl.add_picksheet'):
+        return HttpResponseForbidden(simplejson.dumps({'error': "Permission denied."}),
+                                     content_type=CONTENT_TYPE)
+    format = 'csv' if request.META.get('CONTENT_TYPE', '').startswith('text/csv') else 'json'
+    try:
+        saved, errors = picks.submit_pick_sheets(StringIO(request.raw_post_data), format)
+    except picks.PickSheetError as e:
+        return HttpResponseBadRequest(simplejson.dumps({'error': str(e)}), content_type=CONTENT_TYPE)
+    body = simplejson.dumps({'saved': saved, 'errors': errors})
+    return HttpResponse(body, content_type=CONTENT_TYPE)